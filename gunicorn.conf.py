@@ -0,0 +1,11 @@
+# Настройки gunicorn, подхватываются автоматически из рабочего каталога.
+# Параметры запуска (bind, workers) задаются в командной строке docker-compose.
+
+
+def worker_exit(server, worker):
+    # Дописываем буфер результатов до выхода воркера (RESULT_BUFFER_ENABLED)
+    from typetester.ingest import buffer
+
+    written = buffer.stop()
+    if written:
+        server.log.info("Воркер %s дописал %d результатов из буфера", worker.pid, written)
@@ -7,6 +7,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'type_master.settings')
 django.setup()
 
+from typetester import corpus, samples as text_index
 from typetester.models import TextSample
 
 def create_samples():
@@ -41,7 +42,7 @@ def create_samples():
         ("Физическая активность полезна не только для тела, но и для разума. Прогулка, бег, йога или даже"
         "уборка дома помогают снять стресс и улучшить настроение. Движение стимулирует выработку эндорфинов - гормонов радости."
         "Не обязательно заниматься в зале по два часа. Достаточно 20–30 минут в день. Главное — делать это регулярно"
-        "и с удовольствием.", "medium", "ru")
+        "и с удовольствием.", "medium", "ru"),
         
         # Русские сложные
         ("Когнитивные искажения — систематические ошибки мышления, которые влияют на решения и суждения. Например, эффект" \
@@ -59,14 +60,14 @@ def create_samples():
         ("Programming allows us to create amazing things.", "medium", "en"),
     ]
     
-    for text, difficulty, language in samples:
-        TextSample.objects.create(
-            text=text,
-            difficulty=difficulty,
-            language=language
-        )
+    added = corpus.save_batch([
+        TextSample(text=corpus.normalize(text), difficulty=difficulty, language=language)
+        for text, difficulty, language in samples
+    ])
+    # bulk_create не шлёт сигналы — индекс текстов сбрасываем сами
+    text_index.invalidate()
     
-    print(f"✅ Создано {len(samples)} тестовых текстов")
+    print(f"✅ Создано {added} тестовых текстов, повторов пропущено: {len(samples) - added}")
 
 if __name__ == "__main__":
     create_samples()
\ No newline at end of file
@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+"""Резервная копия текстов и результатов (обёртка над manage.py backup_results).
+
+    python scripts/backup_database.py --output /var/backups/typemaster
+Повторный запуск с тем же каталогом дописывает только новые строки.
+Восстановление: python manage.py restore_results /var/backups/typemaster
+"""
+import os
+import sys
+
+import django
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'type_master.settings')
+django.setup()
+
+from django.core.management import execute_from_command_line
+
+if __name__ == "__main__":
+    execute_from_command_line([sys.argv[0], 'backup_results', *sys.argv[1:]])
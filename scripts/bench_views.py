@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+"""Замер всех представлений typetester.urls на разных объёмах данных.
+
+Для каждого объёма (число результатов) создаёт SQLite-базу через
+manage.py seed_bench — один раз, готовые базы лежат в --data-dir и
+переиспользуются, — и замеряет каждый маршрут на её копии: тестовым
+клиентом в одном процессе (--mode client) или через gunicorn (--mode
+gunicorn, запросы из --concurrency потоков). В отчёте по маршрутам —
+запросы в секунду, p50/p95/p99 задержки и число SQL-запросов на
+установившемся режиме. Отчёт пишется в JSON вместе с коммитом, чтобы
+сравнивать прогоны между коммитами:
+    python scripts/bench_views.py --scales 10000 1000000 10000000 --output bench/HEAD.json
+    python scripts/bench_views.py --compare bench/base.json bench/HEAD.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SCALES = (10000, 1000000, 10000000)
+
+
+def _env(database, static_root):
+    return {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': 'type_master.settings',
+        'SQLITE_PATH': database,
+        'STATIC_ROOT': static_root,
+        'DEBUG': 'False',
+        'ALLOWED_HOSTS': 'localhost,127.0.0.1',
+        # Медленные запросы в лог не нужны — они исказят замер
+        'METRICS_SLOW_REQUEST_MS': '0',
+        # Вся нагрузка идёт с одного адреса — лимит допуска save_result отключаем
+        'ADMISSION_RATE_PER_MINUTE': '0',
+    }
+
+
+def _manage(env, *args):
+    subprocess.run([sys.executable, 'manage.py', *args], cwd=BASE_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+
+
+def prepare_database(data_dir, scale, reseed):
+    """База с scale результатами (создаётся один раз) и собранная статика"""
+    database = os.path.join(data_dir, f'bench-{scale}.sqlite3')
+    static_root = os.path.join(data_dir, 'static')
+    env = _env(database, static_root)
+    if reseed and os.path.exists(database):
+        os.remove(database)
+    fresh = not os.path.exists(database)
+    # migrate и на готовой базе: у нового коммита могут быть новые миграции
+    _manage(env, 'migrate')
+    if fresh:
+        print(f"Заполнение базы на {scale} результатов…", file=sys.stderr)
+        _manage(env, 'seed_bench', '--results', str(scale))
+    if not os.path.isdir(static_root):
+        _manage(env, 'collectstatic', '--noinput')
+    return database, static_root
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn завершился при запуске")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn не ответил за отведённое время")
+
+
+def _http(port, request, cookie):
+    path, body = request.path, None
+    headers = {'Host': 'localhost', 'Connection': 'close'}
+    if request.method == 'POST':
+        body = request.data
+        headers['Content-Type'] = 'application/json'
+    elif request.data:
+        path = f"{path}?{urlencode(request.data)}"
+    if request.login:
+        headers['Cookie'] = cookie
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        connection.request(request.method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        payload = response.read()
+        content_type = response.getheader('Content-Type', '')
+    finally:
+        connection.close()
+    if response.status >= 400:
+        return False
+    if content_type.startswith('application/json'):
+        return json.loads(payload).get('success', True)
+    return True
+
+
+def run_gunicorn(bench, args):
+    """Запросы к gunicorn из нескольких потоков, маршруты по очереди"""
+    import random
+
+    from django.conf import settings
+
+    user = bench.bench_user()
+    context = bench.make_context(user)
+    _, logged_in = bench.clients(user)
+    cookie = f"{settings.SESSION_COOKIE_NAME}={logged_in.cookies[settings.SESSION_COOKIE_NAME].value}"
+    queries = bench.count_queries(seed=args.seed)
+
+    port = _free_port()
+    command = [
+        sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+        '--workers', str(args.workers), '--log-level', 'warning', 'type_master.wsgi:application',
+    ]
+    process = subprocess.Popen(command, cwd=BASE_DIR, env=os.environ.copy())
+    reports = {}
+    try:
+        _wait_ready(port, process)
+        for name, scenario in bench.SCENARIOS.items():
+            latencies = []
+            errors = [0]
+            lock = threading.Lock()
+
+            def worker(seed, count):
+                rng = random.Random(seed)
+                for _ in range(count):
+                    request = scenario(rng, context)
+                    began = time.perf_counter()
+                    try:
+                        ok = _http(port, request, cookie)
+                    except (OSError, http.client.HTTPException, ValueError):
+                        ok = False
+                    elapsed = time.perf_counter() - began
+                    with lock:
+                        latencies.append(elapsed)
+                        errors[0] += not ok
+
+            share, extra = divmod(args.requests, args.concurrency)
+            threads = [
+                threading.Thread(target=worker, args=(args.seed + i, share + (i < extra)))
+                for i in range(args.concurrency)
+            ]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            reports[name] = bench.summarize(latencies, errors[0], time.perf_counter() - started, queries[name])
+    finally:
+        process.terminate()
+        process.wait()
+    return reports
+
+
+def measure(args):
+    """Замер в процессе, настроенном на копию базы (вызывается из main через --measure)"""
+    import django
+
+    sys.path.insert(0, BASE_DIR)
+    django.setup()
+    from typetester import bench
+
+    missing = bench.missing_scenarios()
+    if missing:
+        sys.exit(f"Нет сценариев замера для маршрутов: {', '.join(missing)} (typetester/bench.py)")
+    if args.mode == 'client':
+        reports = bench.run_client(args.requests, seed=args.seed)
+    else:
+        reports = run_gunicorn(bench, args)
+    print(json.dumps(reports))
+
+
+def _measure_scale(database, static_root, args):
+    workdir = tempfile.mkdtemp(prefix='typemaster-bench-')
+    try:
+        # Замер пишет результаты — каждый прогон начинается с одинаковой базы
+        copy = os.path.join(workdir, 'db.sqlite3')
+        shutil.copy(database, copy)
+        command = [
+            sys.executable, os.path.abspath(__file__), '--measure', '--mode', args.mode,
+            '--requests', str(args.requests), '--workers', str(args.workers),
+            '--concurrency', str(args.concurrency), '--seed', str(args.seed),
+        ]
+        output = subprocess.run(
+            command, cwd=BASE_DIR, env=_env(copy, static_root), check=True, capture_output=True, text=True,
+        ).stdout
+        return json.loads(output.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(old_path, new_path):
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+    print(f"{old.get('commit')} → {new.get('commit')}")
+    print(f"{'объём':>10} {'маршрут':<16}{'p50, мс':>18}{'p99, мс':>18}{'RPS':>18}{'SQL':>10}")
+    for scale, views in new['scales'].items():
+        for name, report in views.items():
+            before = old['scales'].get(scale, {}).get(name)
+            if before is None:
+                continue
+            cells = [
+                f"{before[key]}→{report[key]}".rjust(18)
+                for key in ('p50_ms', 'p99_ms', 'rps')
+            ]
+            queries = f"{before.get('queries')}→{report.get('queries')}".rjust(10)
+            print(f"{scale:>10} {name:<16}{''.join(cells)}{queries}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=int, nargs='+', default=list(DEFAULT_SCALES), help="Объёмы: число результатов")
+    parser.add_argument('--mode', choices=['client', 'gunicorn'], default='client')
+    parser.add_argument('--requests', type=int, default=200, help="Запросов к каждому маршруту")
+    parser.add_argument('--workers', type=int, default=4, help="Воркеров gunicorn")
+    parser.add_argument('--concurrency', type=int, default=8, help="Потоков нагрузки для gunicorn")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=os.path.join(BASE_DIR, 'bench-data'), help="Каталог готовых баз")
+    parser.add_argument('--reseed', action='store_true', help="Пересоздать базы заново")
+    parser.add_argument('--output', help="Файл отчёта JSON (по умолчанию — в stdout)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="Сравнить два отчёта")
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.measure:
+        measure(args)
+        return
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    report = {
+        'commit': _commit(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'mode': args.mode,
+        'requests': args.requests,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'scales': {},
+    }
+    for scale in args.scales:
+        database, static_root = prepare_database(args.data_dir, scale, args.reseed)
+        print(f"Замер на {scale} результатов…", file=sys.stderr)
+        report['scales'][str(scale)] = _measure_scale(database, static_root, args)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""Накладные расходы MetricsMiddleware и счётчика SQL-запросов.
+
+Сравнивает вызов пустого представления с middleware и без него, а также
+SELECT 1 с обёрткой execute_wrapper внутри запроса и вне его:
+    python scripts/benchmark_metrics.py --requests 200000 --queries 50000
+"""
+import argparse
+import os
+import sys
+import time
+
+import django
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'type_master.settings')
+django.setup()
+
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from typetester import metrics
+
+
+def per_call_us(func, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=50000)
+    args = parser.parse_args()
+
+    request = RequestFactory().get('/')
+    response = HttpResponse(b'x' * 1024)
+
+    def view(request):
+        return response
+
+    middleware = metrics.MetricsMiddleware(view)
+    # Выгрузка в кэш раз в FLUSH_INTERVAL — её доля на запрос тоже входит в замер
+    bare = per_call_us(lambda: view(request), args.requests)
+    wrapped = per_call_us(lambda: middleware(request), args.requests)
+    print(f"Запрос без middleware:  {bare:.2f} мкс")
+    print(f"Запрос с middleware:    {wrapped:.2f} мкс (+{wrapped - bare:.2f} мкс)")
+
+    metrics.instrument(connection)
+    with connection.cursor() as cursor:
+        def query():
+            cursor.execute("SELECT 1")
+
+        outside = per_call_us(query, args.queries)
+        token = metrics._current.set(metrics.RequestStats(keep_sql=False))
+        try:
+            inside = per_call_us(query, args.queries)
+        finally:
+            metrics._current.reset(token)
+    print(f"SELECT 1 вне запроса:   {outside:.2f} мкс")
+    print(f"SELECT 1 со счётчиком:  {inside:.2f} мкс (+{inside - outside:.2f} мкс)")
+
+
+if __name__ == '__main__':
+    main()
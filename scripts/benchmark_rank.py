@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""Сравнение расчёта места: COUNT(*) WHERE wpm > x против гистограммы WPM.
+
+Работает с отдельной SQLite-базой, чтобы не трогать рабочую:
+    python scripts/benchmark_rank.py --rows 1000000 10000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import django
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'type_master.settings')
+django.setup()
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, transaction
+
+from typetester import histogram
+from typetester.models import TypingTestResult
+
+BATCH_SIZE = 10000
+
+
+def seed(rows):
+    """Дозаполняет таблицу результатов случайными WPM до rows строк"""
+    existing = TypingTestResult.objects.count()
+    while existing < rows:
+        size = min(BATCH_SIZE, rows - existing)
+        with transaction.atomic():
+            TypingTestResult.objects.bulk_create([
+                TypingTestResult(
+                    wpm=round(max(random.gauss(60, 20), 0), 1),
+                    accuracy=95.0,
+                    words_count=50,
+                    time_seconds=60.0,
+                    mistakes_count=2,
+                )
+                for _ in range(size)
+            ])
+        existing += size
+
+
+def measure(func, queries):
+    timings = []
+    for _ in range(queries):
+        wpm = round(random.uniform(0, 150), 1)
+        start = time.perf_counter()
+        func(wpm)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.mean(timings), timings[int(len(timings) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000000, 10000000])
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--database', help="Файл SQLite для бенчмарка (по умолчанию временный)")
+    args = parser.parse_args()
+
+    path = args.database or os.path.join(tempfile.gettempdir(), 'typemaster_rank_bench.sqlite3')
+    settings.DATABASES['default']['NAME'] = path
+    connection.close()
+    connection.settings_dict['NAME'] = path
+    call_command('migrate', verbosity=0)
+
+    def naive(wpm):
+        return TypingTestResult.objects.filter(wpm__gt=wpm).count() + 1
+
+    def indexed(wpm):
+        not_better, total = histogram.counts_for(histogram.GLOBAL_SCOPE, wpm)
+        return total - not_better + 1
+
+    print(f"База: {path}")
+    for rows in sorted(args.rows):
+        seed(rows)
+        histogram.rebuild()
+        naive_mean, naive_p99 = measure(naive, args.queries)
+        indexed_mean, indexed_p99 = measure(indexed, args.queries)
+        print(
+            f"{rows:>11,} строк | COUNT(*): {naive_mean:9.2f} мс (p99 {naive_p99:9.2f}) | "
+            f"гистограмма: {indexed_mean:6.3f} мс (p99 {indexed_p99:6.3f}) | "
+            f"ускорение ×{naive_mean / indexed_mean:,.0f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""Время оценки текста typetester.scoring на текстах 1k–50k символов.
+
+    python scripts/benchmark_scoring.py --budget-ms 5
+
+Код возврата 1, если медианное время какого-либо сценария превышает бюджет.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+import django
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'type_master.settings')
+django.setup()
+
+from typetester.scoring import score
+
+WORDS = (
+    "скорость печати зависит от практики the quick brown fox jumps over the lazy dog "
+    "терпение точность клавиатура typing speed accuracy keyboard practice"
+).split()
+
+
+def make_text(length, rng):
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return ' '.join(words)[:length]
+
+
+def with_typos(text, rate, rng):
+    chars = list(text)
+    for i in range(len(chars)):
+        if rng.random() < rate:
+            chars[i] = 'ъ'
+    return ''.join(chars)
+
+
+def scenarios(length, rng):
+    text = make_text(length, rng)
+    skip = length // 10
+    yield "без ошибок", text, text
+    yield "опечатки 0.5%", text, with_typos(text, 0.005, rng)
+    yield "пропуск символа", text, text[:skip] + text[skip + 1:]
+    yield "лишний символ", text, text[:skip] + 'x' + text[skip:]
+    yield "мусор (предел)", text, make_text(length, rng)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lengths', type=int, nargs='+', default=[1000, 5000, 10000, 50000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--budget-ms', type=float, default=None)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    over_budget = False
+    for length in args.lengths:
+        for name, original, typed in scenarios(length, rng):
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                result = score(original, typed, 60)
+                timings.append((time.perf_counter() - start) * 1000)
+            median = statistics.median(timings)
+            flag = ''
+            if args.budget_ms is not None and median > args.budget_ms:
+                over_budget = True
+                flag = '  ← превышен бюджет'
+            print(
+                f"{length:>6} симв. | {name:<16} | {median:8.3f} мс (макс {max(timings):8.3f}) | "
+                f"ошибок {result.errors:>5}{' (позиционно)' if result.capped else ''}{flag}"
+            )
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+"""Нагрузочное сравнение синхронного (WSGI) и асинхронного (ASGI) запуска.
+
+Поднимает gunicorn на временной SQLite-базе сначала с синхронными
+воркерами и обычными представлениями, затем с воркерами uvicorn и
+ASYNC_VIEWS=True, и гоняет смесь запросов (страница теста, таблица лидеров,
+сохранение результата). Печатает запросы в секунду, p50 и p99 задержки:
+    python scripts/load_test.py --workers 4 --concurrency 32 --duration 20
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STACKS = {
+    'sync': ['type_master.wsgi:application'],
+    'async': ['-k', 'uvicorn_worker.UvicornWorker', 'type_master.asgi:application'],
+}
+
+TEXT = "Быстрая коричневая лиса перепрыгивает через ленивую собаку."
+
+
+def prepare_database(path, samples, results):
+    """Создаёт базу с текстами и результатами и собирает статику в отдельном процессе"""
+    code = f"""
+import django
+django.setup()
+from django.core.management import call_command
+from typetester import ingest
+from typetester.models import TextSample, TypingTestResult
+call_command('migrate', verbosity=0)
+call_command('collectstatic', interactive=False, verbosity=0)
+TextSample.objects.bulk_create([
+    TextSample(text={TEXT!r} + f' {{i}}', difficulty=d, language='ru')
+    for i in range({samples}) for d in ('easy', 'medium', 'hard')
+])
+ids = list(TextSample.objects.values_list('id', flat=True))
+import random
+ingest.persist([
+    TypingTestResult(text_sample_id=random.choice(ids), wpm=random.uniform(10, 120), accuracy=95,
+                     words_count=8, time_seconds=30, mistakes_count=1)
+    for _ in range({results})
+])
+call_command('rebuild_stats', verbosity=0)
+"""
+    subprocess.run([sys.executable, '-c', code], cwd=BASE_DIR, env=_env(path, False), check=True, stdout=subprocess.DEVNULL)
+
+
+def _env(database, async_views):
+    return {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': 'type_master.settings',
+        'SQLITE_PATH': database,
+        'STATIC_ROOT': os.path.join(os.path.dirname(database), 'static'),
+        'ASYNC_VIEWS': str(async_views),
+        'DEBUG': 'False',
+        'ALLOWED_HOSTS': '*',
+        # Вся нагрузка идёт с одного адреса — лимит допуска save_result отключаем
+        'ADMISSION_RATE_PER_MINUTE': '0',
+    }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn завершился при запуске")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn не ответил за отведённое время")
+
+
+def _request(port, method, path, body=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    headers = {'Connection': 'close', 'Host': 'localhost'}
+    if body is not None:
+        headers['Content-Type'] = 'application/json'
+    try:
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        payload = response.read()
+    finally:
+        connection.close()
+    if response.status != 200:
+        return False
+    if path == '/save-result/':
+        return json.loads(payload).get('success', False)
+    return True
+
+
+def _scenario(rng):
+    """Запрос из смеси: страница теста, таблица лидеров, сохранение результата"""
+    roll = rng.random()
+    if roll < 0.4:
+        return 'test', 'GET', f"/test/?difficulty={rng.choice(['easy', 'medium', 'hard'])}&language=ru", None
+    if roll < 0.7:
+        return 'leaderboard', 'GET', '/leaderboard/', None
+    typed = TEXT if rng.random() < 0.5 else TEXT[:-5]
+    body = json.dumps({'typed_text': typed, 'original_text': TEXT, 'time_seconds': rng.uniform(5, 30)})
+    return 'save_result', 'POST', '/save-result/', body
+
+
+def run_load(port, concurrency, duration):
+    latencies = {}
+    errors = {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(seed):
+        rng = random.Random(seed)
+        while time.monotonic() < deadline:
+            name, method, path, body = _scenario(rng)
+            started = time.perf_counter()
+            try:
+                ok = _request(port, method, path, body)
+            except (OSError, http.client.HTTPException, ValueError):
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.setdefault(name, []).append(elapsed)
+                if not ok:
+                    errors[name] = errors.get(name, 0) + 1
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.monotonic() - started
+
+
+def _percentile(values, q):
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1] if len(values) > 1 else values[0]
+
+
+def benchmark(stack, database, args):
+    port = _free_port()
+    command = [
+        sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+        '--workers', str(args.workers), '--log-level', 'warning', *STACKS[stack],
+    ]
+    process = subprocess.Popen(command, cwd=BASE_DIR, env=_env(database, stack == 'async'))
+    try:
+        _wait_ready(port, process)
+        run_load(port, args.concurrency, min(args.duration, 3))  # прогрев
+        latencies, errors, elapsed = run_load(port, args.concurrency, args.duration)
+    finally:
+        process.terminate()
+        process.wait()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    report = {
+        'stack': stack,
+        'requests': len(all_latencies),
+        'rps': round(len(all_latencies) / elapsed, 1),
+        'p50_ms': round(_percentile(all_latencies, 50) * 1000, 1),
+        'p99_ms': round(_percentile(all_latencies, 99) * 1000, 1),
+        'errors': sum(errors.values()),
+        'endpoints': {
+            name: {
+                'requests': len(values),
+                'p50_ms': round(_percentile(values, 50) * 1000, 1),
+                'p99_ms': round(_percentile(values, 99) * 1000, 1),
+                'errors': errors.get(name, 0),
+            }
+            for name, values in sorted(latencies.items())
+        },
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stacks', nargs='+', choices=list(STACKS), default=list(STACKS))
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20, help="Секунд нагрузки на каждый стек")
+    parser.add_argument('--samples', type=int, default=100, help="Текстов каждой сложности")
+    parser.add_argument('--results', type=int, default=10000, help="Результатов в базе до начала")
+    parser.add_argument('--json', action='store_true', help="Вывести отчёт в JSON")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='typemaster-load-')
+    try:
+        template = os.path.join(workdir, 'template.sqlite3')
+        prepare_database(template, args.samples, args.results)
+        reports = []
+        for stack in args.stacks:
+            # Каждый стек начинает с одинаковой базы
+            database = os.path.join(workdir, f'{stack}.sqlite3')
+            shutil.copy(template, database)
+            reports.append(benchmark(stack, database, args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(reports, ensure_ascii=False, indent=2))
+        return
+    print(f"{'стек':<8}{'запросов':>10}{'RPS':>10}{'p50, мс':>10}{'p99, мс':>10}{'ошибок':>8}")
+    for report in reports:
+        print(
+            f"{report['stack']:<8}{report['requests']:>10}{report['rps']:>10}"
+            f"{report['p50_ms']:>10}{report['p99_ms']:>10}{report['errors']:>8}"
+        )
+        for name, endpoint in report['endpoints'].items():
+            print(f"  {name:<14}{endpoint['requests']:>10}{'':>10}{endpoint['p50_ms']:>10}{endpoint['p99_ms']:>10}{endpoint['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
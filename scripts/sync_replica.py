@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+"""Копирует основную SQLite-базу в файл реплики (локальная замена репликации).
+
+    SQLITE_REPLICA_PATH=replica.sqlite3 python scripts/sync_replica.py
+Копия делается через backup API SQLite, поэтому основную базу можно не
+останавливать. На настоящей СУБД реплику наполняет сама репликация.
+"""
+import os
+import sqlite3
+import sys
+
+import django
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'type_master.settings')
+django.setup()
+
+from django.conf import settings
+
+
+def main():
+    if 'replica' not in settings.DATABASES:
+        sys.exit("Реплика не настроена: задайте SQLITE_REPLICA_PATH")
+    with sqlite3.connect(settings.DATABASES['default']['NAME']) as source, \
+            sqlite3.connect(settings.DATABASES['replica']['NAME']) as target:
+        source.backup(target)
+    print(f"Скопировано в {settings.DATABASES['replica']['NAME']}")
+
+
+if __name__ == "__main__":
+    main()
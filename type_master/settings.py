@@ -23,6 +23,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'typetester.metrics.MetricsMiddleware',
+    'typetester.replica.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -56,10 +58,98 @@ WSGI_APPLICATION = 'type_master.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        # Постоянные соединения с проверкой перед повторным использованием
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
     }
 }
 
+# Реплика только для чтения статистики (см. typetester.replica)
+if os.getenv('SQLITE_REPLICA_PATH'):
+    DATABASES['replica'] = {**DATABASES['default'], 'NAME': os.getenv('SQLITE_REPLICA_PATH')}
+
+DATABASE_ROUTERS = ['typetester.replica.ReplicaRouter']
+
+# Сколько секунд после записи клиент читает из основной базы, а не с реплики
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '10'))
+
+# Кэш таблиц лидеров и счётчиков. LocMemCache живёт внутри одного процесса,
+# поэтому при нескольких воркерах gunicorn нужен общий бэкенд (Redis, Memcached);
+# docker-compose.prod.yml поднимает Redis
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'typemaster'),
+    }
+}
+# Сброс в кэше процесса не виден другим воркерам — с ним таблицы и страницы
+# живут недолго, чтобы устаревать не больше чем на минуту
+LOCAL_CACHE = CACHES['default']['BACKEND'].endswith('LocMemCache')
+
+LEADERBOARD_SIZE = int(os.getenv('LEADERBOARD_SIZE', '50'))
+LEADERBOARD_CACHE_TIMEOUT = int(os.getenv('LEADERBOARD_CACHE_TIMEOUT', '60' if LOCAL_CACHE else str(24 * 60 * 60)))
+
+# «Мои результаты»: строк на странице и длина ряда последних WPM в сводке
+MY_RESULTS_PAGE_SIZE = 50
+USER_STATS_RECENT = 10
+
+# Держать в памяти воркера не только id текстов, но и сами тексты
+TEXT_INDEX_STORE_TEXTS = os.getenv('TEXT_INDEX_STORE_TEXTS', 'False') == 'True'
+
+# Частотные таблицы слов для генерации текстов (manage.py build_word_tables)
+WORD_TABLES_DIR = os.getenv('WORD_TABLES_DIR', os.path.join(BASE_DIR, 'wordtables'))
+# Выдавать на тесте сгенерированные тексты вместо TextSample
+GENERATED_TEXTS = os.getenv('GENERATED_TEXTS', 'False') == 'True'
+
+# Гистограмма WPM для места и процентиля (после изменения — manage.py rebuild_stats)
+RANK_HISTOGRAM_BUCKET = 0.1
+RANK_HISTOGRAM_MAX_WPM = 300
+
+# Оценка текста: предел ошибок для выравнивания и ширина полосы поиска
+SCORING_MAX_ERRORS = 300
+SCORING_BAND = 16
+
+# Отложенная пакетная запись результатов (см. typetester.ingest)
+RESULT_BUFFER = {
+    'ENABLED': os.getenv('RESULT_BUFFER_ENABLED', 'False') == 'True',
+    'MAX_SIZE': int(os.getenv('RESULT_BUFFER_MAX_SIZE', '10000')),
+    'BATCH_SIZE': int(os.getenv('RESULT_BUFFER_BATCH_SIZE', '500')),
+    'FLUSH_INTERVAL': float(os.getenv('RESULT_BUFFER_FLUSH_INTERVAL', '1.0')),
+}
+
+# Асинхронные представления (typetester.async_views) для запуска под ASGI:
+# gunicorn -k uvicorn_worker.UvicornWorker type_master.asgi:application
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False') == 'True'
+
+# Метрики запросов для /metrics (см. typetester.metrics)
+METRICS = {
+    'ENABLED': os.getenv('METRICS_ENABLED', 'True') == 'True',
+    'FLUSH_INTERVAL': float(os.getenv('METRICS_FLUSH_INTERVAL', '10')),
+    # Запросы дольше порога (мс) пишутся в лог вместе с SQL; 0 — выключено
+    'SLOW_REQUEST_MS': int(os.getenv('METRICS_SLOW_REQUEST_MS', '0')),
+    'TOKEN': os.getenv('METRICS_TOKEN', ''),
+}
+
+# Сколько секунд анонимным отдаётся сохранённая страница (см. typetester.pagecache);
+# 0 — только ETag/304 без хранения страниц
+PAGE_CACHE_TIMEOUT = int(os.getenv('PAGE_CACHE_TIMEOUT', '60' if LOCAL_CACHE else '600'))
+
+# Допуск save_result: результатов в минуту на клиента (0 — без ограничения),
+# запас на всплеск и сколько помнить ответ по id теста для повторов
+ADMISSION_RATE_PER_MINUTE = int(os.getenv('ADMISSION_RATE_PER_MINUTE', '30'))
+ADMISSION_BURST = int(os.getenv('ADMISSION_BURST', '10'))
+ADMISSION_IDEMPOTENCY_TTL = int(os.getenv('ADMISSION_IDEMPOTENCY_TTL', str(60 * 60)))
+# Ключ request.META с адресом клиента за прокси (nginx ставит X-Real-IP);
+# пустой — REMOTE_ADDR. Задавать только когда перед приложением стоит прокси
+CLIENT_IP_HEADER = os.getenv('CLIENT_IP_HEADER', '')
+
+# Результаты старше стольких дней compact_results сворачивает в дневные сводки
+RESULT_RETENTION_DAYS = int(os.getenv('RESULT_RETENTION_DAYS', '365'))
+
+# Каталог резервных копий manage.py backup_results / restore_results
+BACKUP_DIR = os.getenv('BACKUP_DIR', os.path.join(BASE_DIR, 'backups'))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -81,7 +171,7 @@ USE_I18N = True
 USE_TZ = True
 
 STATIC_URL = '/static/'
-STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATIC_ROOT = os.getenv('STATIC_ROOT', os.path.join(BASE_DIR, 'staticfiles'))
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 MEDIA_URL = '/media/'
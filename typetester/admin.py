@@ -1,6 +1,32 @@
-from django.contrib import admin
+import csv
+import io
+from ipaddress import ip_address
+
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.utils.functional import cached_property
+
+from . import ingest, leaderboard, pagecache, pagination
 from .models import TextSample, TypingTestResult
 
+CURSOR_VAR = 'cursor'
+# Дальше этого числа строки не считаются: COUNT(*) по миллионам строк дороже самой страницы
+COUNT_LIMIT = 10000
+# Строк в одной пачке выгрузки и удаления
+CHUNK_SIZE = 2000
+
+EXPORT_FIELDS = (
+    'id', 'user__username', 'text_sample__language', 'text_sample__difficulty', 'wpm', 'accuracy',
+    'words_count', 'time_seconds', 'mistakes_count', 'ip_address', 'created_at',
+)
+
+
 @admin.register(TextSample)
 class TextSampleAdmin(admin.ModelAdmin):
     list_display = ('id', 'difficulty', 'language', 'created_at')
@@ -8,20 +34,159 @@ class TextSampleAdmin(admin.ModelAdmin):
     search_fields = ('text',)
     list_per_page = 20
 
+
+class CappedPaginator(Paginator):
+    """Считает строки не дальше COUNT_LIMIT"""
+
+    @cached_property
+    def count(self):
+        return self.object_list[:COUNT_LIMIT + 1].count()
+
+
+def count_label(count):
+    return f"более {COUNT_LIMIT}" if count > COUNT_LIMIT else str(count)
+
+
+def _chunks(queryset, size=CHUNK_SIZE):
+    """Строки values_list (первая колонка — id) пачками по возрастанию id"""
+    queryset = queryset.order_by('pk')
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_id)[:size])
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+class KeysetChangeList(ChangeList):
+    """Список результатов по ключу (created_at, id) вместо OFFSET.
+
+    Пока список не пересортирован по колонке, страницы листаются курсором
+    (typetester.pagination) и стоят одинаково на любой глубине.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = request.GET.get(CURSOR_VAR) or None
+        self.next_cursor = None
+        super().__init__(request, *args, **kwargs)
+
+    @property
+    def keyset(self):
+        return ORDER_VAR not in self.params and not self.show_all
+
+    @property
+    def count_label(self):
+        return count_label(self.result_count)
+
+    @property
+    def next_page_query(self):
+        return self.get_query_string({CURSOR_VAR: self.next_cursor})
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Смена фильтра или сортировки начинает список сначала
+        return super().get_query_string({CURSOR_VAR: None, **(new_params or {})}, remove)
+
+    def get_results(self, request):
+        if not self.keyset:
+            return super().get_results(request)
+        try:
+            rows, self.next_cursor = pagination.keyset_page(self.queryset, self.cursor, self.list_per_page)
+        except pagination.InvalidCursor:
+            raise IncorrectLookupParameters
+        self.paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        self.result_count = self.paginator.count
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.result_list = rows
+        self.can_show_all = False
+        self.multi_page = self.cursor is not None or self.next_cursor is not None
+
+
 @admin.register(TypingTestResult)
 class TypingTestResultAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'wpm', 'accuracy', 'time_seconds', 'created_at')
-    list_filter = ('created_at',)  # Убрали 'difficulty', так как его нет в модели
+    list_display = ('id', 'user', 'difficulty', 'wpm', 'accuracy', 'time_seconds', 'created_at')
+    list_filter = ('text_sample__difficulty', 'text_sample__language', 'created_at')
+    list_select_related = ('user', 'text_sample')
     search_fields = ('user__username', 'ip_address')
+    search_help_text = "Точное имя пользователя или IP-адрес"
     readonly_fields = ('created_at',)
+    # Выпадающие списки по всем пользователям и текстам на форме не нужны
+    raw_id_fields = ('user', 'text_sample')
     list_per_page = 50
-    
-    # Если хотите фильтровать по difficulty через связанную таблицу TextSample
+    paginator = CappedPaginator
+    show_full_result_count = False
+    actions = ('export_csv', 'delete_in_chunks')
+
+    @admin.display(description="Сложность", ordering='text_sample__difficulty')
     def difficulty(self, obj):
         if obj.text_sample:
             return obj.text_sample.get_difficulty_display()
         return "Не указано"
-    difficulty.short_description = "Сложность"
-    
-    # Тогда можно добавить difficulty в list_display, но не в list_filter
-    list_display = ('id', 'user', 'difficulty', 'wpm', 'accuracy', 'time_seconds', 'created_at')
\ No newline at end of file
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        # Точное совпадение идёт по индексу, LIKE '%…%' — по всей таблице
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        try:
+            ip_address(term)
+        except ValueError:
+            return queryset.filter(user__username=term), False
+        return queryset.filter(ip_address=term), False
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # Стандартное удаление собирает всю выборку в память ради страницы подтверждения
+        actions.pop('delete_selected', None)
+        return actions
+
+    @admin.action(description="Выгрузить в CSV")
+    def export_csv(self, request, queryset):
+        def lines():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_FIELDS)
+            for rows in _chunks(queryset.values_list(*EXPORT_FIELDS)):
+                writer.writerows(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+
+        response = StreamingHttpResponse(lines(), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="results.csv"'
+        return response
+
+    @admin.action(description="Удалить выбранные результаты", permissions=['delete'])
+    def delete_in_chunks(self, request, queryset):
+        if request.POST.get('post') != 'yes':
+            opts = self.model._meta
+            return TemplateResponse(request, 'admin/typetester/typingtestresult/delete_in_chunks.html', {
+                **self.admin_site.each_context(request),
+                'title': "Удаление результатов",
+                'opts': opts,
+                'count': count_label(CappedPaginator(queryset, 1).count),
+                'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+                'select_across': request.POST.get('select_across', '0'),
+                'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+                'media': self.media,
+            })
+        deleted = 0
+        for rows in _chunks(queryset.values_list('pk')):
+            # Каждая пачка вместе с вычитанием из статистики — своя транзакция
+            with transaction.atomic():
+                deleted += ingest.remove([pk for pk, in rows])
+        leaderboard.invalidate()
+        pagecache.invalidate()
+        self.message_user(request, f"Удалено результатов: {deleted}.", messages.SUCCESS)
+        return None
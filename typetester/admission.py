@@ -0,0 +1,254 @@
+"""Допуск запросов save_result до любой работы с базой.
+
+Оба фильтра живут в кэше Django — с Redis или Memcached они общие для всех
+воркеров — и смотрят только на тело запроса, cookie и адрес: ни сессия,
+ни пользователь, ни индекс текстов здесь не загружаются.
+
+* Ключ идемпотентности — id теста, который клиент создаёт в начале теста
+  (поле test_id или заголовок Idempotency-Key). Первый запрос занимает
+  ключ через cache.add, после сохранения под ключом на IDEMPOTENCY_TTL
+  секунд остаётся тело ответа, и повторы (ретраи клиента, двойная
+  отправка) получают тот же ответ без новой строки. Пока первый запрос не
+  закончен, повтор получает 409.
+* Корзина токенов на клиента (сессия по cookie, без неё — IP) и общая
+  корзина IP в IP_FACTOR раз шире: за одним адресом бывает несколько
+  человек. За nginx REMOTE_ADDR — адрес самого nginx, поэтому адрес
+  клиента берётся из заголовка CLIENT_IP_HEADER, который выставляет
+  прокси. Корзина — один счётчик в кэше, который меняется только
+  атомарным incr: израсходованные токены против накопленных к этому
+  моменту (время × скорость). Параллельные запросы не проскакивают лимит.
+"""
+import hashlib
+import math
+import re
+import time
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+
+from . import metrics
+
+# Результатов в минуту на клиента (0 — без ограничения) и запас на всплеск
+RATE_PER_MINUTE = getattr(settings, 'ADMISSION_RATE_PER_MINUTE', 30)
+BURST = getattr(settings, 'ADMISSION_BURST', 10)
+IP_FACTOR = 4
+IDEMPOTENCY_TTL = getattr(settings, 'ADMISSION_IDEMPOTENCY_TTL', 60 * 60)
+# Ключ request.META с адресом клиента от прокси, например HTTP_X_REAL_IP;
+# пустой — REMOTE_ADDR (без прокси заголовку доверять нельзя)
+CLIENT_IP_HEADER = getattr(settings, 'CLIENT_IP_HEADER', '')
+
+PREFIX = 'admission'
+PENDING = 'pending'
+# Корзина без запросов дольше этого сбрасывается (и так была бы полной)
+BUCKET_TTL = 60 * 60
+# Токены считаются в тысячных, чтобы счётчик был целым
+SCALE = 1000
+
+TEST_ID = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+
+class Bucket(NamedTuple):
+    key: str
+    rate: float
+    burst: int
+
+    @property
+    def retry_after(self):
+        return max(1, math.ceil(1 / self.rate))
+
+
+def _digest(value):
+    return hashlib.md5(value.encode()).hexdigest()
+
+
+def client_ip(request):
+    """Адрес клиента: из заголовка прокси, если он задан, иначе REMOTE_ADDR"""
+    if CLIENT_IP_HEADER:
+        # В X-Forwarded-For адрес, который видел наш прокси, — последний,
+        # всё левее мог прислать сам клиент
+        value = request.META.get(CLIENT_IP_HEADER, '').rsplit(',', 1)[-1].strip()
+        if value:
+            return value
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _client(request):
+    """Метка клиента для ключей: сессия, если есть cookie, иначе IP"""
+    session = request.COOKIES.get(settings.SESSION_COOKIE_NAME, '')
+    if session:
+        # Ключ сессии в имени ключа кэша не храним
+        return f"s{_digest(session)}"
+    return f"ip{client_ip(request)}"
+
+
+def buckets(request):
+    if not RATE_PER_MINUTE:
+        return []
+    rate = RATE_PER_MINUTE / 60
+    ip = client_ip(request)
+    return [
+        Bucket(f"{PREFIX}:bucket:{_client(request)}", rate, BURST),
+        Bucket(f"{PREFIX}:net:{ip}", rate * IP_FACTOR, BURST * IP_FACTOR),
+    ]
+
+
+def _bounds(bucket):
+    level = int(time.time() * bucket.rate * SCALE)
+    # Значение счётчика при полной корзине
+    return level, level - bucket.burst * SCALE
+
+
+def _take(bucket):
+    level, full = _bounds(bucket)
+    if cache.add(bucket.key, full + SCALE, BUCKET_TTL):
+        return True
+    try:
+        used = cache.incr(bucket.key, SCALE)
+    except ValueError:
+        # Ключ вытеснен между add и incr — корзина снова полная
+        cache.set(bucket.key, full + SCALE, BUCKET_TTL)
+        return True
+    if used - SCALE < full:
+        # За время простоя токенов накопилось бы больше запаса
+        cache.incr(bucket.key, full - (used - SCALE))
+        return True
+    if used > level:
+        cache.decr(bucket.key, SCALE)
+        return False
+    return True
+
+
+async def _atake(bucket):
+    level, full = _bounds(bucket)
+    if await cache.aadd(bucket.key, full + SCALE, BUCKET_TTL):
+        return True
+    try:
+        used = await cache.aincr(bucket.key, SCALE)
+    except ValueError:
+        await cache.aset(bucket.key, full + SCALE, BUCKET_TTL)
+        return True
+    if used - SCALE < full:
+        await cache.aincr(bucket.key, full - (used - SCALE))
+        return True
+    if used > level:
+        await cache.adecr(bucket.key, SCALE)
+        return False
+    return True
+
+
+def _give_back(bucket):
+    try:
+        cache.decr(bucket.key, SCALE)
+    except ValueError:
+        pass
+
+
+async def _agive_back(bucket):
+    try:
+        await cache.adecr(bucket.key, SCALE)
+    except ValueError:
+        pass
+
+
+def test_id(request, data):
+    """id теста из тела или заголовка Idempotency-Key (или None)"""
+    value = data.get('test_id') or request.headers.get('Idempotency-Key')
+    if isinstance(value, str) and TEST_ID.match(value):
+        return value
+    return None
+
+
+class Ticket:
+    """Допущенный запрос: после ответа — complete() с телом ответа или release()"""
+
+    def __init__(self, key=None):
+        self.key = key
+
+    def complete(self, payload):
+        if self.key:
+            cache.set(self.key, payload, IDEMPOTENCY_TTL)
+
+    async def acomplete(self, payload):
+        if self.key:
+            await cache.aset(self.key, payload, IDEMPOTENCY_TTL)
+
+    def release(self):
+        """Освобождает ключ: повтор после ошибки пойдёт как новый запрос"""
+        if self.key:
+            cache.delete(self.key)
+
+    async def arelease(self):
+        if self.key:
+            await cache.adelete(self.key)
+
+
+def _replay(request, stored):
+    route = metrics.route_for(request)
+    if stored == PENDING:
+        metrics.collector.record_admission(route, 'in_flight')
+        return JsonResponse({'success': False, 'error': "Результат этого теста уже сохраняется"}, status=409)
+    metrics.collector.record_admission(route, 'replayed')
+    response = JsonResponse(stored)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _limited(request, bucket):
+    metrics.collector.record_admission(metrics.route_for(request), 'limited')
+    response = JsonResponse({'success': False, 'error': "Слишком много результатов, попробуйте позже"}, status=429)
+    response['Retry-After'] = str(bucket.retry_after)
+    return response
+
+
+def admit(request, data):
+    """(готовый ответ или None, Ticket).
+
+    Ответ — сохранённый ответ на повтор, 409 или 429; None значит, что
+    запрос допущен и его нужно обработать, а потом закрыть Ticket.
+    """
+    key = None
+    value = test_id(request, data)
+    if value is not None:
+        key = f"{PREFIX}:test:{_client(request)}:{value}"
+        if not cache.add(key, PENDING, IDEMPOTENCY_TTL):
+            stored = cache.get(key)
+            if stored is not None:
+                return _replay(request, stored), Ticket()
+            # Ключ истёк между add и get — занимаем заново
+            cache.set(key, PENDING, IDEMPOTENCY_TTL)
+    ticket = Ticket(key)
+    taken = []
+    for bucket in buckets(request):
+        if not _take(bucket):
+            for other in taken:
+                _give_back(other)
+            ticket.release()
+            return _limited(request, bucket), Ticket()
+        taken.append(bucket)
+    metrics.collector.record_admission(metrics.route_for(request), 'accepted')
+    return None, ticket
+
+
+async def aadmit(request, data):
+    key = None
+    value = test_id(request, data)
+    if value is not None:
+        key = f"{PREFIX}:test:{_client(request)}:{value}"
+        if not await cache.aadd(key, PENDING, IDEMPOTENCY_TTL):
+            stored = await cache.aget(key)
+            if stored is not None:
+                return _replay(request, stored), Ticket()
+            await cache.aset(key, PENDING, IDEMPOTENCY_TTL)
+    ticket = Ticket(key)
+    taken = []
+    for bucket in buckets(request):
+        if not await _atake(bucket):
+            for other in taken:
+                await _agive_back(other)
+            await ticket.arelease()
+            return _limited(request, bucket), Ticket()
+        taken.append(bucket)
+    metrics.collector.record_admission(metrics.route_for(request), 'accepted')
+    return None, ticket
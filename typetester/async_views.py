@@ -0,0 +1,148 @@
+"""Асинхронные версии представлений для запуска под ASGI (ASYNC_VIEWS=True).
+
+Чтение идёт через асинхронный ORM (afirst, async for) и асинхронный кэш,
+так что воркер uvicorn не блокируется на ожидании базы. Запись результата
+остаётся синхронной транзакцией ingest.persist (в Django 4.2 нет
+асинхронных транзакций) и выполняется в потоке через sync_to_async.
+Разбор запроса, оценка текста и формирование ответа общие с views.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import JsonResponse
+from django.shortcuts import redirect, render
+
+from . import admission, histogram, ingest, keystrokes, leaderboard as boards, pagination, rollup, samples, userstats
+from .views import (
+    MY_RESULTS_PAGE_SIZE, build_result, home_context, home_page, leaderboard_context, leaderboard_filters,
+    leaderboard_page, my_results_queryset, result_payload, results_page_response, rollup_scope,
+    generated_page, generated_passage, test_context, test_page,
+)
+
+
+async def _get_user(request):
+    """Пользователь запроса или None.
+
+    request.user читает сессию синхронно; после этого вызова он уже загружен,
+    и шаблоны могут обращаться к нему без запросов к базе.
+    """
+    return await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+
+
+async def home(request):
+    """Главная страница с выбором настроек"""
+    page = home_page(request)
+    response = await page.alookup()
+    if response is not None:
+        return response
+    await _get_user(request)
+    stats = await rollup.aget_rollup()
+    return await page.afinish(render(request, 'typetester/home.html', home_context(stats)))
+
+
+async def typing_test(request):
+    """Страница тестирования скорости печати"""
+    difficulty = request.GET.get('difficulty', 'easy')
+    language = request.GET.get('language', 'ru')
+    sample_id = await samples.index.achoose(difficulty, language)
+    passage = generated_passage(request, difficulty, language, sample_id)
+    if passage is not None:
+        await _get_user(request)
+        return generated_page(request, passage, difficulty, language)
+    page = test_page(request, difficulty, language, sample_id)
+    response = await page.alookup()
+    if response is not None:
+        return response
+    await _get_user(request)
+    text, text_id = await samples.index.atext(sample_id, difficulty, language)
+    context = test_context(text, text_id, difficulty, language, await samples.aspans(text, text_id))
+    return await page.afinish(render(request, 'typetester/test.html', context))
+
+
+async def save_result(request):
+    """Сохранение результата теста (AJAX)"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'})
+    ticket = admission.Ticket()
+    try:
+        data = json.loads(request.body)
+        response, ticket = await admission.aadmit(request, data)
+        if response is not None:
+            return response
+        text_id = data.get('text_id')
+        text_sample = await samples.index.alookup(text_id) if text_id else None
+        user = await _get_user(request)
+        result, score = build_result(request, data, user, text_sample)
+
+        # submit() может ждать место в очереди до PUT_TIMEOUT — не на цикле событий
+        if ingest.buffer.enabled and await sync_to_async(ingest.buffer.submit, thread_sensitive=False)(result):
+            rank, percentile = await histogram.aestimate_position(result)
+        else:
+            await sync_to_async(ingest.persist)([result])
+            rank, percentile = await histogram.aposition(result)
+
+        payload = result_payload(result, score, rank, percentile)
+        await ticket.acomplete(payload)
+        return JsonResponse(payload)
+
+    except Exception as e:
+        await ticket.arelease()
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        })
+
+
+# csrf_exempt в Django 4.2 оборачивает представление синхронной функцией
+save_result.csrf_exempt = True
+
+
+async def leaderboard(request):
+    """Таблица лидеров"""
+    language, difficulty, period = leaderboard_filters(request)
+    page = leaderboard_page(request, language, difficulty, period)
+    response = await page.alookup()
+    if response is not None:
+        return response
+    await _get_user(request)
+    top_results = await boards.aget_board(language, difficulty, period)
+    stats = await rollup.aget_rollup(*rollup_scope(language, difficulty))
+    return await page.afinish(render(request, 'typetester/results.html', leaderboard_context(top_results, stats, language, difficulty, period)))
+
+
+async def my_results(request):
+    """Личные результаты пользователя"""
+    user = await _get_user(request)
+    if user is None:
+        # login_required в Django 4.2 не умеет оборачивать корутины
+        return redirect_to_login(request.get_full_path())
+    try:
+        results, next_cursor = await pagination.akeyset_page(
+            my_results_queryset(user), request.GET.get('cursor'), MY_RESULTS_PAGE_SIZE,
+        )
+    except pagination.InvalidCursor:
+        return redirect('my_results')
+
+    context = {
+        'results': results,
+        'next_cursor': next_cursor,
+        'user_stats': await userstats.aget_stats(user),
+        'slow_keys': await keystrokes.aslow_keys(user),
+        'slow_bigrams': await keystrokes.aslow_keys(user, bigrams=True),
+    }
+    return render(request, 'typetester/my_results.html', context)
+
+
+async def my_results_api(request):
+    """Следующая страница личных результатов (JSON для подгрузки при прокрутке)"""
+    user = await _get_user(request)
+    if user is None:
+        return JsonResponse({'success': False, 'error': 'Authentication required'}, status=401)
+    try:
+        results, next_cursor = await pagination.akeyset_page(
+            my_results_queryset(user), request.GET.get('cursor'), MY_RESULTS_PAGE_SIZE,
+        )
+    except pagination.InvalidCursor as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return results_page_response(results, next_cursor)
@@ -0,0 +1,349 @@
+"""Резервная копия текстов и результатов сегментами по столбцам.
+
+Таблица выгружается по ключу id: каждый сегмент — один запрос
+pk > последний_id с iterator(chunk_size), не больше segment_size строк.
+Сегмент хранится как gzip JSON по столбцам {столбец: [значения]} — так
+однотипные значения идут подряд и сжимаются лучше. После каждого сегмента
+manifest.json перезаписывается атомарно, и следующий запуск продолжает с
+последнего выгруженного id: результаты только добавляются, поэтому
+инкрементальная копия дописывает новые сегменты к старым.
+
+Строки, удалённые после выгрузки (compact_results, админка), отмечаются
+в манифесте диапазонами id у своего сегмента — иначе восстановление
+вернуло бы результаты, уже свёрнутые в сводки, и посчитало бы их дважды.
+Сводки DailyResultSummary меняются на месте, поэтому выгружаются целиком
+каждый раз (SNAPSHOT_MODELS), а старые сегменты сводок удаляются.
+
+Восстановление читает сегменты по манифесту и пишет их bulk_create,
+пропуская строки, которые уже есть в базе, так что его тоже можно
+перезапускать. Память в обоих направлениях ограничена одним сегментом.
+"""
+import datetime
+import gzip
+import hashlib
+import json
+import os
+from bisect import bisect_right
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+from . import retention
+from .models import DailyResultSummary, TextSample, TypingTestResult
+
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 1
+
+SEGMENT_SIZE = 50000
+CHUNK_SIZE = 2000
+BATCH_SIZE = 1000
+
+# Порядок важен: результаты ссылаются на тексты
+MODELS = (TextSample, TypingTestResult, DailyResultSummary)
+# Модели, строки которых меняются: выгружаются целиком при каждом запуске
+SNAPSHOT_MODELS = (DailyResultSummary,)
+
+SUMMARY_KEY = ('day', 'user_id', 'language', 'difficulty')
+
+
+class BackupError(Exception):
+    pass
+
+
+class _Encoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder обрезает время до миллисекунд — в копии нужны все знаки
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+@contextmanager
+def _keep_dates(model):
+    """Отключает auto_now/auto_now_add, чтобы bulk_create не затёр даты из копии"""
+    fields = [
+        (field, field.auto_now, field.auto_now_add)
+        for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    for field, _, _ in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in fields:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def _columns(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def read_manifest(path):
+    try:
+        with open(os.path.join(path, MANIFEST), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {'version': FORMAT_VERSION, 'models': {}}
+    except ValueError:
+        raise BackupError(f"Повреждён {MANIFEST} в {path}")
+    if manifest.get('version') != FORMAT_VERSION:
+        raise BackupError(f"Неизвестная версия резервной копии: {manifest.get('version')}")
+    return manifest
+
+
+def _write_manifest(path, manifest):
+    tmp = os.path.join(path, f"{MANIFEST}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, os.path.join(path, MANIFEST))
+
+
+def _write_segment(path, model, columns, data, prefix=''):
+    first_id, last_id = data['id'][0], data['id'][-1]
+    name = f"{model._meta.model_name}-{prefix}{first_id:012d}-{last_id:012d}.json.gz"
+    payload = json.dumps(
+        {'model': _label(model), 'columns': columns, 'data': data},
+        cls=_Encoder, ensure_ascii=False, separators=(',', ':'),
+    ).encode('utf-8')
+    compressed = gzip.compress(payload)
+    tmp = os.path.join(path, f"{name}.tmp")
+    with open(tmp, 'wb') as f:
+        f.write(compressed)
+    os.replace(tmp, os.path.join(path, name))
+    digest = hashlib.sha256(compressed).hexdigest()
+    return {'file': name, 'first_id': first_id, 'last_id': last_id, 'rows': len(data['id']), 'sha256': digest}
+
+
+def _ranges(ids):
+    """Отсортированные id в виде диапазонов [первый, последний]"""
+    ranges = []
+    for pk in ids:
+        if ranges and ranges[-1][1] == pk - 1:
+            ranges[-1][1] = pk
+        else:
+            ranges.append([pk, pk])
+    return ranges
+
+
+def _range_size(ranges):
+    return sum(last - first + 1 for first, last in ranges)
+
+
+def _in_ranges(ranges, pk):
+    i = bisect_right(ranges, [pk, float('inf')]) - 1
+    return i >= 0 and ranges[i][0] <= pk <= ranges[i][1]
+
+
+def _track_deletions(path, model, state):
+    """Отмечает у выгруженных сегментов строки, которых уже нет в базе; True, если что-то изменилось"""
+    changed = False
+    for segment in state['segments']:
+        rows = model.objects.filter(pk__gte=segment['first_id'], pk__lte=segment['last_id'])
+        deleted = segment.get('deleted', [])
+        if rows.count() == segment['rows'] - _range_size(deleted):
+            continue
+        present = set(rows.values_list('pk', flat=True))
+        ids = _read_segment(path, segment)['data']['id']
+        segment['deleted'] = _ranges(pk for pk in ids if pk not in present)
+        changed = True
+    return changed
+
+
+def _export_rows(path, model, columns, queryset, segment_size, chunk_size, prefix=''):
+    """Сегменты строк queryset по возрастанию id"""
+    last_id = 0
+    while True:
+        rows = (
+            queryset.filter(pk__gt=last_id).order_by('pk')
+            .values_list(*columns)[:segment_size]
+            .iterator(chunk_size=chunk_size)
+        )
+        data = {column: [] for column in columns}
+        for row in rows:
+            for column, value in zip(columns, row):
+                data[column].append(value)
+        if not data['id']:
+            return
+        segment = _write_segment(path, model, columns, data, prefix)
+        last_id = segment['last_id']
+        yield segment
+
+
+def _export_snapshot(path, model, label, state, segment_size, chunk_size, progress):
+    """Выгружает таблицу целиком новым поколением сегментов; возвращает сегменты прошлого"""
+    # Имена нового поколения не совпадают со старыми, пока манифест ссылается на них
+    generation = state.get('generation', 0) + 1
+    segments = []
+    for segment in _export_rows(
+        path, model, state['columns'], model.objects.all(), segment_size, chunk_size, prefix=f"s{generation}-",
+    ):
+        segments.append(segment)
+        if progress:
+            progress(label, segment)
+    old = state['segments']
+    state.update(
+        generation=generation, segments=segments, rows=sum(segment['rows'] for segment in segments),
+        last_id=segments[-1]['last_id'] if segments else 0,
+    )
+    return old
+
+
+def export(path, segment_size=SEGMENT_SIZE, chunk_size=CHUNK_SIZE, progress=None):
+    """Выгружает новые строки с прошлого запуска; возвращает {модель: строк}"""
+    os.makedirs(path, exist_ok=True)
+    manifest = read_manifest(path)
+    exported = {}
+    for model in MODELS:
+        label = _label(model)
+        columns = _columns(model)
+        state = manifest['models'].setdefault(label, {'columns': columns, 'last_id': 0, 'rows': 0, 'segments': []})
+        if state['columns'] != columns:
+            raise BackupError(f"Столбцы {label} изменились с прошлой копии — начните новую в другом каталоге")
+        if model in SNAPSHOT_MODELS:
+            old = _export_snapshot(path, model, label, state, segment_size, chunk_size, progress)
+            _write_manifest(path, manifest)
+            # Старые сегменты удаляются только после записи манифеста без них
+            for segment in old:
+                os.remove(os.path.join(path, segment['file']))
+            exported[label] = state['rows']
+            continue
+        if _track_deletions(path, model, state):
+            _write_manifest(path, manifest)
+        exported[label] = 0
+        queryset = model.objects.filter(pk__gt=state['last_id'])
+        for segment in _export_rows(path, model, columns, queryset, segment_size, chunk_size):
+            state['segments'].append(segment)
+            state['last_id'] = segment['last_id']
+            state['rows'] += segment['rows']
+            _write_manifest(path, manifest)
+            exported[label] += segment['rows']
+            if progress:
+                progress(label, segment)
+    return exported
+
+
+def _read_segment(path, segment):
+    with open(os.path.join(path, segment['file']), 'rb') as f:
+        raw = f.read()
+    if hashlib.sha256(raw).hexdigest() != segment['sha256']:
+        raise BackupError(f"Контрольная сумма {segment['file']} не совпадает")
+    return json.loads(gzip.decompress(raw))
+
+
+def _missing_to_null(objs, attname, model):
+    """Обнуляет ссылки на строки, которых нет в базе; возвращает их число"""
+    ids = {getattr(obj, attname) for obj in objs} - {None}
+    existing = set(model.objects.filter(pk__in=ids).values_list('pk', flat=True)) if ids else set()
+    missing = 0
+    for obj in objs:
+        if getattr(obj, attname) is not None and getattr(obj, attname) not in existing:
+            setattr(obj, attname, None)
+            missing += 1
+    return missing
+
+
+def _merge_summaries(batch):
+    """Складывает сводки с одинаковым ключом (день, пользователь, область).
+
+    Совпадают сводки, у которых обнулили отсутствующего пользователя, и
+    сводки копии, для которых в базе уже есть своя строка. Возвращает
+    сводки, которые нужно создать, и число слитых.
+    """
+    merged = {}
+    for obj in batch:
+        key = tuple(getattr(obj, field) for field in SUMMARY_KEY)
+        if key in merged:
+            retention.add_to_summary(merged[key], _summary_sums(obj), obj.wpm_max, obj.wpm_counts)
+        else:
+            merged[key] = obj
+    changed = []
+    for summary in DailyResultSummary.objects.select_for_update().filter(day__in={key[0] for key in merged}):
+        obj = merged.pop(tuple(getattr(summary, field) for field in SUMMARY_KEY), None)
+        if obj is not None:
+            retention.add_to_summary(summary, _summary_sums(obj), obj.wpm_max, obj.wpm_counts)
+            changed.append(summary)
+    DailyResultSummary.objects.bulk_update(changed, [*retention.SUMMARY_SUMS, 'wpm_max', 'wpm_counts'])
+    return list(merged.values()), len(batch) - len(merged)
+
+
+def _summary_sums(summary):
+    return {field: getattr(summary, field) for field in retention.SUMMARY_SUMS}
+
+
+def _restore_segment(model, payload, batch_size, deleted=()):
+    fields = {field.attname: field for field in model._meta.concrete_fields}
+    columns = payload['columns']
+    data = payload['data']
+    unknown = set(columns) - set(fields)
+    if unknown:
+        raise BackupError(f"В сегменте {payload['model']} неизвестные столбцы: {', '.join(sorted(unknown))}")
+    existing = set(
+        model.objects.filter(pk__gte=data['id'][0], pk__lte=data['id'][-1]).values_list('pk', flat=True)
+    )
+    objs = []
+    for values in zip(*(data[column] for column in columns)):
+        obj = model(**{column: fields[column].to_python(value) for column, value in zip(columns, values)})
+        # Удалённые после выгрузки строки не возвращаем
+        if obj.pk not in existing and not _in_ranges(deleted, obj.pk):
+            objs.append(obj)
+    added = orphans = 0
+    with transaction.atomic(), _keep_dates(model):
+        # Пачками, чтобы списки IN (...) не упирались в предел параметров запроса
+        for start in range(0, len(objs), batch_size):
+            batch = objs[start:start + batch_size]
+            if model is TextSample:
+                # Тот же текст уже может быть в базе под другим id
+                hashes = set(TextSample.objects.filter(
+                    content_hash__in=[obj.content_hash for obj in batch if obj.content_hash],
+                ).values_list('content_hash', flat=True))
+                batch = [obj for obj in batch if obj.content_hash not in hashes]
+            if model is TypingTestResult:
+                # Пользователей копия не содержит, а тексты могли удалить
+                orphans += _missing_to_null(batch, 'user_id', User)
+                orphans += _missing_to_null(batch, 'text_sample_id', TextSample)
+            merged = 0
+            if model is DailyResultSummary:
+                orphans += _missing_to_null(batch, 'user_id', User)
+                batch, merged = _merge_summaries(batch)
+            model.objects.bulk_create(batch)
+            added += len(batch) + merged
+    return added, orphans
+
+
+def restore(path, batch_size=BATCH_SIZE, progress=None):
+    """Загружает сегменты из копии; возвращает {модель: (добавлено, без ссылки)}"""
+    manifest = read_manifest(path)
+    if not manifest['models']:
+        raise BackupError(f"В {path} нет {MANIFEST}")
+    restored = {}
+    for model in MODELS:
+        label = _label(model)
+        state = manifest['models'].get(label)
+        if state is None:
+            continue
+        added = orphans = 0
+        for segment in state['segments']:
+            payload = _read_segment(path, segment)
+            segment_added, segment_orphans = _restore_segment(
+                model, payload, batch_size, segment.get('deleted', []),
+            )
+            added += segment_added
+            orphans += segment_orphans
+            if progress:
+                progress(label, segment, segment_added)
+        restored[label] = (added, orphans)
+    # Строки вставлены с явными id — счётчики автоинкремента нужно подвинуть
+    statements = connection.ops.sequence_reset_sql(no_style(), list(MODELS))
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+    return restored
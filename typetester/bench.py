@@ -0,0 +1,195 @@
+"""Сценарии замера представлений для scripts/bench_views.py.
+
+Для каждого имени URL из typetester.urls здесь есть функция, которая
+собирает случайный, но правдоподобный запрос к нему. missing_scenarios()
+показывает маршруты без сценария — новое представление не выпадет из
+замеров незаметно.
+"""
+import json
+import random
+import statistics
+import time
+from typing import NamedTuple
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+
+from . import leaderboard, pagination, seeding, urls, views
+from .models import TextSample, TypingTestResult
+
+
+class BenchRequest(NamedTuple):
+    method: str
+    path: str
+    data: object = None
+    login: bool = False
+
+
+def _home(rng, context):
+    return BenchRequest('GET', reverse('home'))
+
+
+def _typing_test(rng, context):
+    return BenchRequest('GET', reverse('typing_test'), {
+        'difficulty': rng.choice(list(leaderboard.DIFFICULTIES)),
+        'language': rng.choice(list(leaderboard.LANGUAGES)),
+    })
+
+
+def _save_result(rng, context):
+    sample_id, text = context['sample']
+    # Часть текста с опечатками, чтобы оценка шла не по короткому пути
+    typed = text if rng.random() < 0.5 else text[:len(text) // 2] + 'x' + text[len(text) // 2 + 1:]
+    body = json.dumps({
+        'typed_text': typed,
+        'original_text': text,
+        'time_seconds': round(rng.uniform(20, 90), 2),
+        'text_id': sample_id,
+    })
+    return BenchRequest('POST', reverse('save_result'), body, login=rng.random() < 0.5)
+
+
+def _leaderboard(rng, context):
+    return BenchRequest('GET', reverse('leaderboard'), {
+        'language': rng.choice([''] + list(leaderboard.LANGUAGES)),
+        'difficulty': rng.choice([''] + list(leaderboard.DIFFICULTIES)),
+        'period': rng.choice(list(leaderboard.PERIODS)),
+    })
+
+
+def _my_results(rng, context):
+    return BenchRequest('GET', reverse('my_results'), login=True)
+
+
+def _my_results_api(rng, context):
+    return BenchRequest('GET', reverse('my_results_api'), {'cursor': context['cursor'] or ''}, login=True)
+
+
+def _metrics(rng, context):
+    return BenchRequest('GET', reverse('metrics'))
+
+
+SCENARIOS = {
+    'home': _home,
+    'typing_test': _typing_test,
+    'save_result': _save_result,
+    'leaderboard': _leaderboard,
+    'my_results': _my_results,
+    'my_results_api': _my_results_api,
+    'metrics': _metrics,
+}
+
+
+def missing_scenarios():
+    """Имена URL приложения, для которых нет сценария"""
+    names = {pattern.name for pattern in urls.urlpatterns if isinstance(pattern, URLPattern) and pattern.name}
+    return sorted(names - set(SCENARIOS))
+
+
+def bench_user():
+    """Пользователь bench_N с самым свежим результатом — от его имени идут запросы вошедшего"""
+    user_id = (
+        TypingTestResult.objects
+        .filter(user__username__startswith=seeding.USERNAME_PREFIX)
+        .order_by('-id')
+        .values_list('user_id', flat=True)
+        .first()
+    )
+    if user_id is None:
+        raise RuntimeError("Нет результатов пользователей bench_N — сначала запустите manage.py seed_bench")
+    return User.objects.get(pk=user_id)
+
+
+def make_context(user):
+    sample = TextSample.objects.order_by('?').values_list('id', 'text').first()
+    queryset = views.my_results_queryset(user)
+    _, cursor = pagination.keyset_page(queryset, size=views.MY_RESULTS_PAGE_SIZE)
+    return {'sample': sample, 'cursor': cursor}
+
+
+def send(client, request):
+    """Выполняет запрос; возвращает True, если он удался"""
+    if request.method == 'POST':
+        response = client.post(request.path, request.data, content_type='application/json')
+    else:
+        response = client.get(request.path, request.data)
+    if response.status_code >= 400:
+        return False
+    if response.get('Content-Type', '').startswith('application/json'):
+        return json.loads(response.content).get('success', True)
+    return True
+
+
+def percentile(values, q):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1]
+
+
+def summarize(latencies, errors, elapsed, queries=None):
+    """Отчёт по одному маршруту: запросы в секунду, p50/p95/p99 в мс"""
+    report = {
+        'requests': len(latencies),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'errors': errors,
+    }
+    if queries is not None:
+        report['queries'] = queries
+    return report
+
+
+def clients(user):
+    """Анонимный клиент и клиент, вошедший как user"""
+    host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS and settings.ALLOWED_HOSTS[0] != '*' else 'localhost'
+    anonymous = Client(HTTP_HOST=host)
+    logged_in = Client(HTTP_HOST=host)
+    logged_in.force_login(user)
+    return anonymous, logged_in
+
+
+def count_queries(requests=3, seed=0):
+    """Число SQL-запросов на установившемся режиме: {маршрут: запросов в последнем из requests}"""
+    rng = random.Random(seed)
+    user = bench_user()
+    context = make_context(user)
+    anonymous, logged_in = clients(user)
+    counts = {}
+    for name, scenario in SCENARIOS.items():
+        for _ in range(requests):
+            request = scenario(rng, context)
+            with CaptureQueriesContext(connection) as captured:
+                send(logged_in if request.login else anonymous, request)
+        counts[name] = len(captured)
+    return counts
+
+
+def run_client(requests_per_view, seed=0, warmup=20):
+    """Последовательные запросы тестовым клиентом в этом процессе"""
+    rng = random.Random(seed)
+    user = bench_user()
+    context = make_context(user)
+    anonymous, logged_in = clients(user)
+    queries = count_queries(seed=seed)
+    reports = {}
+    for name, scenario in SCENARIOS.items():
+        for _ in range(warmup):
+            request = scenario(rng, context)
+            send(logged_in if request.login else anonymous, request)
+        latencies = []
+        errors = 0
+        started = time.perf_counter()
+        for _ in range(requests_per_view):
+            request = scenario(rng, context)
+            began = time.perf_counter()
+            ok = send(logged_in if request.login else anonymous, request)
+            latencies.append(time.perf_counter() - began)
+            errors += not ok
+        reports[name] = summarize(latencies, errors, time.perf_counter() - started, queries[name])
+    return reports
@@ -0,0 +1,203 @@
+"""Импорт больших корпусов текстов в TextSample.
+
+Файлы читаются построчно: обычный текст (абзацы разделены пустой строкой)
+или JSONL с полем text и необязательными language и difficulty. Текст
+нормализуется, режется по предложениям на отрывки нужной длины, язык и
+сложность определяются эвристикой. Повторы отсекаются по content_hash —
+хешу нормализованного текста: внутри пачки по множеству, с базой — одним
+запросом на пачку. Пачки пишутся через bulk_create, поэтому память не
+растёт с размером корпуса.
+"""
+import gzip
+import hashlib
+import json
+import re
+import unicodedata
+
+from django.db import transaction
+
+from .models import TextSample
+
+MIN_CHARS = 150
+MAX_CHARS = 500
+BATCH_SIZE = 500
+
+# Абзац длиннее этого режется, не дожидаясь пустой строки
+MAX_PARAGRAPH = 20000
+
+WHITESPACE = re.compile(r'\s+')
+SENTENCE_END = re.compile(r'(?<=[.!?…])\s+')
+WORD = re.compile(r'\w+')
+CYRILLIC = re.compile(r'[а-яё]', re.IGNORECASE)
+LATIN = re.compile(r'[a-z]', re.IGNORECASE)
+# Границы оценки сложности (easy, medium) по языкам: русские слова длиннее
+DIFFICULTY_THRESHOLDS = {
+    'ru': (7.0, 10.0),
+    'en': (5.5, 9.0),
+}
+
+# Символы, которых нет на основных клавишах: цифры, скобки, кавычки-ёлочки и т.п.
+SPECIAL = re.compile(r'[^\w\s.,!?\-]|\d')
+
+
+def normalize(text):
+    """Юникод NFC, без управляющих символов и с одиночными пробелами"""
+    text = unicodedata.normalize('NFC', text)
+    text = ''.join(ch for ch in text if ch.isprintable() or ch.isspace())
+    return WHITESPACE.sub(' ', text).strip()
+
+
+def content_hash(text):
+    """Хеш нормализованного текста для поиска повторов"""
+    return hashlib.sha256(normalize(text).encode('utf-8')).hexdigest()
+
+
+def split_passages(text, min_chars=MIN_CHARS, max_chars=MAX_CHARS):
+    """Режет нормализованный текст на отрывки по границам предложений.
+
+    Слишком длинное предложение режется по словам. Короткий отрывок, к
+    которому не помещается следующее предложение, не теряется, а уходит в
+    начало следующего куска; отбрасывается только короткий хвост текста.
+    """
+    passage = ''
+    for sentence in SENTENCE_END.split(text):
+        candidate = f"{passage} {sentence}" if passage else sentence
+        if len(candidate) > max_chars and len(passage) >= min_chars:
+            yield passage
+            candidate = sentence
+        while len(candidate) > max_chars:
+            cut = candidate.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            head, candidate = candidate[:cut], candidate[cut:].lstrip()
+            yield head
+        passage = candidate
+        if len(passage) >= max_chars:
+            yield passage
+            passage = ''
+    if len(passage) >= min_chars:
+        yield passage
+
+
+def detect_language(text):
+    """ru или en по преобладающему алфавиту (None, если букв нет)"""
+    cyrillic = len(CYRILLIC.findall(text))
+    latin = len(LATIN.findall(text))
+    if not cyrillic and not latin:
+        return None
+    return 'ru' if cyrillic >= latin else 'en'
+
+
+def classify_difficulty(text, language='ru'):
+    """Сложность по средней длине слова, доле длинных слов и спецсимволов"""
+    words = WORD.findall(text)
+    if not words:
+        return 'easy'
+    avg_length = sum(map(len, words)) / len(words)
+    long_share = sum(len(word) >= 9 for word in words) / len(words)
+    special_share = len(SPECIAL.findall(text)) / len(text)
+    score = avg_length + 10 * long_share + 40 * special_share
+    easy, medium = DIFFICULTY_THRESHOLDS[language]
+    if score < easy:
+        return 'easy'
+    if score < medium:
+        return 'medium'
+    return 'hard'
+
+
+def _open(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def _text_records(lines):
+    """Абзацы обычного текста как записи {'text': ...}"""
+    paragraph = []
+    size = 0
+    for line in lines:
+        line = line.strip()
+        if line:
+            paragraph.append(line)
+            size += len(line) + 1
+        if paragraph and (not line or size >= MAX_PARAGRAPH):
+            yield {'text': ' '.join(paragraph)}
+            paragraph = []
+            size = 0
+    if paragraph:
+        yield {'text': ' '.join(paragraph)}
+
+
+def _jsonl_records(lines):
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise ValueError(f"Строка {number}: некорректный JSON")
+        if not isinstance(record, dict) or not isinstance(record.get('text'), str):
+            raise ValueError(f"Строка {number}: нужен объект с полем text")
+        yield record
+
+
+def read_records(path, fmt='auto'):
+    """Записи корпуса из файла, по одной (формат text или jsonl)"""
+    if fmt == 'auto':
+        fmt = 'jsonl' if re.search(r'\.jsonl?(\.gz)?$', path) else 'text'
+    with _open(path) as lines:
+        reader = _jsonl_records if fmt == 'jsonl' else _text_records
+        yield from reader(lines)
+
+
+def passages(records, language=None, difficulty=None, min_chars=MIN_CHARS, max_chars=MAX_CHARS):
+    """Несохранённые TextSample из записей корпуса.
+
+    language и difficulty заменяют значения из записи и эвристику.
+    """
+    for record in records:
+        text = normalize(record['text'])
+        for passage in split_passages(text, min_chars, max_chars):
+            passage_language = language or record.get('language') or detect_language(passage)
+            if passage_language not in ('ru', 'en'):
+                continue
+            passage_difficulty = difficulty or record.get('difficulty')
+            if passage_difficulty not in ('easy', 'medium', 'hard'):
+                passage_difficulty = classify_difficulty(passage, passage_language)
+            yield TextSample(
+                text=passage,
+                language=passage_language,
+                difficulty=passage_difficulty,
+                content_hash=content_hash(passage),
+            )
+
+
+def save_batch(batch):
+    """Записывает пачку TextSample без повторов; возвращает число новых"""
+    unique = {}
+    for sample in batch:
+        if not sample.content_hash:
+            sample.content_hash = content_hash(sample.text)
+        unique.setdefault(sample.content_hash, sample)
+    with transaction.atomic():
+        existing = set(
+            TextSample.objects.filter(content_hash__in=list(unique)).values_list('content_hash', flat=True)
+        )
+        new = [sample for key, sample in unique.items() if key not in existing]
+        # ignore_conflicts — на случай параллельного импорта тех же текстов
+        TextSample.objects.bulk_create(new, ignore_conflicts=True)
+    return len(new)
+
+
+def import_samples(samples, batch_size=BATCH_SIZE, dry_run=False):
+    """Пишет поток TextSample пачками; возвращает (прочитано, добавлено)"""
+    read = added = 0
+    batch = []
+    for sample in samples:
+        batch.append(sample)
+        read += 1
+        if len(batch) >= batch_size:
+            added += 0 if dry_run else save_batch(batch)
+            batch = []
+    if batch and not dry_run:
+        added += save_batch(batch)
+    return read, added
@@ -0,0 +1,206 @@
+"""Индекс места и процентиля по гистограмме WPM.
+
+WPM раскладывается по корзинам фиксированной ширины (по умолчанию 0.1 WPM).
+Каждая непустая корзина области — отдельная строка WpmBucket со счётчиком,
+и новый результат прибавляется к своей корзине через UPDATE с F(): запись
+блокирует строку корзины, а не всю гистограмму, и ничего не читает.
+
+Поверх корзин лежит второй уровень — блоки по BLOCK_SIZE (≈ √BUCKETS)
+соседних корзин, тоже строками WpmBucket (level=BLOCK_LEVEL). Результат
+прибавляется и к своему блоку, поэтому место и процентиль — одна агрегация
+по всем блокам области и корзинам внутри одного блока, O(√BUCKETS) строк
+по уникальному индексу вместо всех корзин или COUNT(*) по результатам.
+Строка блока общая для результатов с близким WPM, но таких строк в области
+несколько десятков, а не одна на всю гистограмму.
+"""
+import math
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from .models import DailyResultSummary, TypingTestResult, WpmBucket
+from .rollup import GLOBAL_SCOPE, scopes_for
+
+BUCKET_WIDTH = getattr(settings, 'RANK_HISTOGRAM_BUCKET', 0.1)
+MAX_WPM = getattr(settings, 'RANK_HISTOGRAM_MAX_WPM', 300)
+BUCKETS = int(round(MAX_WPM / BUCKET_WIDTH)) + 1
+BLOCK_SIZE = math.isqrt(BUCKETS - 1) + 1
+BLOCKS = -(-BUCKETS // BLOCK_SIZE)
+
+BUCKET_LEVEL = 0
+BLOCK_LEVEL = 1
+
+
+def bucket_for(wpm):
+    """Номер корзины (результаты выше MAX_WPM попадают в последнюю)"""
+    return min(max(int(wpm / BUCKET_WIDTH + 1e-9), 0), BUCKETS - 1)
+
+
+def blocks_of(counts):
+    """Суммы блоков по счётчикам корзин"""
+    return [sum(counts[start:start + BLOCK_SIZE]) for start in range(0, BUCKETS, BLOCK_SIZE)]
+
+
+def apply(results):
+    """Прибавляет сохранённые результаты к корзинам их областей.
+
+    Вызывается в транзакции вставки.
+    """
+    _change(results, 1)
+
+
+def retract(results):
+    """Вычитает удалённые результаты из корзин (в транзакции удаления)"""
+    _change(results, -1)
+
+
+def _change(results, sign):
+    deltas = Counter()
+    for result in results:
+        bucket = bucket_for(result.wpm)
+        for language, difficulty in scopes_for(result):
+            deltas[(language, difficulty, BUCKET_LEVEL, bucket)] += 1
+            deltas[(language, difficulty, BLOCK_LEVEL, bucket // BLOCK_SIZE)] += 1
+
+    # Строки корзин и блоков блокируются в одном порядке во всех транзакциях
+    for (language, difficulty, level, bucket), count in sorted(deltas.items()):
+        rows = WpmBucket.objects.filter(language=language, difficulty=difficulty, level=level, bucket=bucket)
+        if rows.update(count=F('count') + sign * count) or sign < 0:
+            continue
+        try:
+            with transaction.atomic():
+                WpmBucket.objects.create(
+                    language=language, difficulty=difficulty, level=level, bucket=bucket, count=count,
+                )
+        except IntegrityError:
+            # Корзину только что создала параллельная транзакция
+            rows.update(count=F('count') + count)
+
+
+def _counts_query(scope, wpm):
+    language, difficulty = scope
+    bucket = bucket_for(wpm)
+    block = bucket // BLOCK_SIZE
+    # Все блоки области и корзины своего блока до корзины wpm включительно
+    within_block = Q(level=BUCKET_LEVEL, bucket__gte=block * BLOCK_SIZE, bucket__lte=bucket)
+    queryset = WpmBucket.objects.filter(Q(level=BLOCK_LEVEL) | within_block, language=language, difficulty=difficulty)
+    return queryset, dict(
+        total=Coalesce(Sum('count', filter=Q(level=BLOCK_LEVEL)), 0),
+        not_better=Coalesce(Sum('count', filter=Q(level=BLOCK_LEVEL, bucket__lt=block) | within_block), 0),
+    )
+
+
+def counts_for(scope, wpm):
+    """(результатов с WPM не выше корзины wpm, всего результатов) в области"""
+    queryset, aggregates = _counts_query(scope, wpm)
+    row = queryset.aggregate(**aggregates)
+    return row['not_better'], row['total']
+
+
+async def acounts_for(scope, wpm):
+    queryset, aggregates = _counts_query(scope, wpm)
+    row = await queryset.aaggregate(**aggregates)
+    return row['not_better'], row['total']
+
+
+def _position(not_better, total):
+    # Место: 1 + количество результатов строго лучше; процентиль — доля не лучше
+    percentile = round(not_better / total * 100, 1) if total else 100.0
+    return total - not_better + 1, percentile
+
+
+def _estimate(not_better, total):
+    percentile = round((not_better + 1) / (total + 1) * 100, 1)
+    return total - not_better + 1, percentile
+
+
+def position(result):
+    """Место и процентиль уже учтённого результата в самой узкой из его областей"""
+    return _position(*counts_for(scopes_for(result)[-1], result.wpm))
+
+
+async def aposition(result):
+    return _position(*await acounts_for(scopes_for(result)[-1], result.wpm))
+
+
+def estimate_position(result):
+    """Место и процентиль результата, который ещё не попал в гистограмму"""
+    return _estimate(*counts_for(scopes_for(result)[-1], result.wpm))
+
+
+async def aestimate_position(result):
+    return _estimate(*await acounts_for(scopes_for(result)[-1], result.wpm))
+
+
+def compute(chunk_size=10000):
+    """Считает счётчики корзин заново по исходным строкам и дневным сводкам"""
+    counts = defaultdict(lambda: [0] * BUCKETS)
+    counts[GLOBAL_SCOPE] = [0] * BUCKETS
+    rows = (
+        TypingTestResult.objects
+        .order_by()
+        .values_list('wpm', 'text_sample__language', 'text_sample__difficulty')
+        .iterator(chunk_size=chunk_size)
+    )
+    for wpm, language, difficulty in rows:
+        bucket = bucket_for(wpm)
+        counts[GLOBAL_SCOPE][bucket] += 1
+        if language is not None:
+            counts[(language, difficulty)][bucket] += 1
+
+    summaries = DailyResultSummary.objects.values_list('wpm_counts', 'language', 'difficulty')
+    for wpm_counts, language, difficulty in summaries.iterator(chunk_size=chunk_size):
+        for wpm, count in wpm_counts.items():
+            bucket = bucket_for(float(wpm))
+            counts[GLOBAL_SCOPE][bucket] += count
+            # Пустые язык и сложность — результаты без текста
+            if language:
+                counts[(language, difficulty)][bucket] += count
+    return counts
+
+
+def stored_counts(level=BUCKET_LEVEL):
+    """Счётчики корзин (или блоков) из WpmBucket: {scope: [count] * BUCKETS}"""
+    size = BUCKETS if level == BUCKET_LEVEL else BLOCKS
+    counts = defaultdict(lambda: [0] * size)
+    for language, difficulty, bucket, count in WpmBucket.objects.filter(level=level).values_list(
+        'language', 'difficulty', 'bucket', 'count',
+    ).iterator():
+        # Корзины за пределами BUCKETS — от старых настроек RANK_HISTOGRAM_*
+        counts[(language, difficulty)][min(bucket, size - 1)] += count
+    return counts
+
+
+def check():
+    """Список областей, где корзины или блоки расходятся с исходными строками"""
+    expected = compute()
+    stored = stored_counts()
+    stored_blocks = stored_counts(BLOCK_LEVEL)
+    mismatches = []
+    for scope in sorted(set(expected) | set(stored) | set(stored_blocks)):
+        actual = stored.get(scope, [0] * BUCKETS)
+        counts = expected.get(scope, [0] * BUCKETS)
+        if actual != counts or stored_blocks.get(scope, [0] * BLOCKS) != blocks_of(counts):
+            mismatches.append((scope, sum(actual), sum(counts)))
+    return mismatches
+
+
+@transaction.atomic
+def rebuild():
+    """Пересобирает гистограммы по исходным строкам"""
+    counts = compute()
+    WpmBucket.objects.all().delete()
+    WpmBucket.objects.bulk_create(
+        (
+            WpmBucket(language=language, difficulty=difficulty, level=level, bucket=bucket, count=count)
+            for (language, difficulty), values in counts.items()
+            for level, level_counts in ((BUCKET_LEVEL, values), (BLOCK_LEVEL, blocks_of(values)))
+            for bucket, count in enumerate(level_counts)
+            if count
+        ),
+        batch_size=1000,
+    )
+    return counts
@@ -0,0 +1,229 @@
+"""Сохранение результатов тестов: сразу или через буфер с пакетной записью.
+
+persist() записывает пачку результатов вместе с журналами нажатий и
+обновляет всё, что от них зависит (сводную статистику, сводки
+пользователей, гистограммы, таблицы лидеров, версии кэша страниц), в одной
+транзакции. remove() и retract() делают обратное для удалённых результатов.
+
+ResultBuffer — необязательный режим отложенной записи (RESULT_BUFFER['ENABLED']):
+save_result проверяет и оценивает результат в запросе и кладёт его в
+ограниченную очередь процесса, а фоновый поток пишет очередь пачками через
+bulk_create по порогу размера или времени. При переполнении очереди submit()
+возвращает False и запрос сохраняет результат сам (обратное давление вместо
+потери данных). При штатной остановке процесса очередь дописывается.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+
+from . import histogram, keystrokes, leaderboard, pagecache, retention, rollup, userstats
+from .models import TextSample, TypingTestResult
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'MAX_SIZE': 10000,
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 1.0,
+    'PUT_TIMEOUT': 0.05,
+}
+
+
+def persist(results):
+    """Сохраняет результаты и обновляет производные данные.
+
+    Текст берётся из индекса процесса без запроса, и другой воркер мог его
+    уже удалить. Тогда внешний ключ не проходит при коммите, а результаты с
+    удалённым текстом сохраняются без текста — как раньше при DoesNotExist.
+    """
+    try:
+        _persist(results)
+    except IntegrityError:
+        if not _drop_missing_samples(results):
+            raise
+        _persist(results)
+
+
+def _drop_missing_samples(results):
+    """Отвязывает результаты от удалённых текстов; False, если таких нет"""
+    sample_ids = {result.text_sample_id for result in results if result.text_sample_id is not None}
+    missing = sample_ids - set(TextSample.objects.filter(pk__in=sample_ids).values_list('pk', flat=True))
+    if not missing:
+        return False
+    logger.warning("Тексты %s удалены до сохранения результатов, результаты сохраняются без текста", sorted(missing))
+    for result in results:
+        if result.text_sample_id in missing:
+            result.text_sample = None
+        # Транзакция откатилась, выданные при вставке id недействительны
+        result.pk = None
+        result._state.adding = True
+    return True
+
+
+def _persist(results):
+    with transaction.atomic():
+        if len(results) == 1 or not connection.features.can_return_rows_from_bulk_insert:
+            # Для статистики нужны id вставленных строк
+            for result in results:
+                result.save()
+        else:
+            TypingTestResult.objects.bulk_create(results)
+        keystrokes.save_logs(results)
+        rollup.apply(results)
+        userstats.apply(results)
+        histogram.apply(results)
+        transaction.on_commit(lambda: leaderboard.record(results))
+        transaction.on_commit(lambda: pagecache.touch(results))
+
+
+def retract(results):
+    """Вычитает уже удалённые результаты из сводной статистики, сводок
+    пользователей и гистограмм (в транзакции удаления)"""
+    rollup.retract(results)
+    userstats.retract(results)
+    histogram.retract(results)
+
+
+def remove(ids):
+    """Удаляет результаты с журналами нажатий и вычитает их из производных
+    данных; возвращает число удалённых. Вызывается в транзакции.
+
+    Строки блокируются перед удалением, чтобы параллельное удаление тех же
+    строк не вычло их второй раз. Кэши таблиц лидеров и страниц вызывающий
+    код сбрасывает сам.
+    """
+    results = list(
+        TypingTestResult.objects
+        .select_for_update(of=('self',))
+        .filter(pk__in=ids)
+        .select_related('text_sample')
+        .only('id', 'user_id', 'wpm', 'accuracy', 'text_sample__language', 'text_sample__difficulty')
+    )
+    retention.purge([result.pk for result in results])
+    retract(results)
+    return len(results)
+
+
+class ResultBuffer:
+    """Ограниченная очередь результатов с фоновой пакетной записью"""
+
+    def __init__(self, enabled=False, max_size=10000, batch_size=500, flush_interval=1.0, put_timeout=0.05):
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_size)
+        self._stopping = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._leftover = []
+
+    @classmethod
+    def from_settings(cls):
+        options = {**DEFAULTS, **getattr(settings, 'RESULT_BUFFER', {})}
+        return cls(
+            enabled=options['ENABLED'],
+            max_size=options['MAX_SIZE'],
+            batch_size=options['BATCH_SIZE'],
+            flush_interval=options['FLUSH_INTERVAL'],
+            put_timeout=options['PUT_TIMEOUT'],
+        )
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    def submit(self, result):
+        """Ставит результат в очередь; False, если очередь переполнена"""
+        self._ensure_started()
+        try:
+            self._queue.put(result, timeout=self.put_timeout)
+        except queue.Full:
+            logger.warning("Буфер результатов переполнен (%d), запись в запросе", self._queue.maxsize)
+            return False
+        return True
+
+    def _ensure_started(self):
+        # Поток запускается лениво, уже в воркере после fork
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name='result-buffer', daemon=True)
+                self._thread.start()
+
+    def _take_batch(self, timeout):
+        """Забирает до batch_size результатов, ожидая первый не дольше timeout"""
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        with self._write_lock:
+            try:
+                persist(batch)
+            except Exception:
+                logger.exception("Не удалось записать пачку из %d результатов, повтор позже", len(batch))
+                return False
+        return True
+
+    def _run(self):
+        pending = []
+        try:
+            while not self._stopping.is_set():
+                if not pending:
+                    pending = self._take_batch(self.flush_interval)
+                if pending and not self._write(pending):
+                    self._stopping.wait(self.flush_interval)
+                    continue
+                pending = []
+        finally:
+            # Недописанную пачку допишет flush() при остановке
+            self._leftover.extend(pending)
+            connection.close()
+
+    def flush(self):
+        """Синхронно записывает всё, что накопилось в очереди"""
+        written = 0
+        while True:
+            batch, self._leftover = self._leftover, []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return written
+            if not self._write(batch):
+                self._leftover = batch + self._leftover
+                raise RuntimeError(f"Не удалось записать {len(batch)} результатов из буфера")
+            written += len(batch)
+
+    def stop(self, timeout=10):
+        """Останавливает фоновый поток и дописывает очередь"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.flush()
+
+
+buffer = ResultBuffer.from_settings()
+atexit.register(buffer.stop)
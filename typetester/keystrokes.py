@@ -0,0 +1,203 @@
+"""Журнал нажатий клавиш: двоичный формат и пакетный анализ задержек.
+
+Клиент присылает последовательность пар (код символа, задержка в мс с
+предыдущего нажатия), каждое число закодировано беззнаковым varint (LEB128)
+и всё вместе — base64. Сервер хранит байты как есть в KeystrokeLog, а
+команда analyze_keystrokes разбирает необработанные журналы пачками и
+накапливает по каждому пользователю задержку и ошибки для клавиш и пар
+клавиш в KeyStat, чтобы страница «Мои результаты» не разбирала журналы.
+"""
+import base64
+import binascii
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast, Length
+
+from .models import KeyStat, KeystrokeLog
+
+logger = logging.getLogger(__name__)
+
+BACKSPACE = 8
+# Коды — символы Юникода, больше этого chr() не примет
+MAX_CODE = 0x10FFFF
+
+MAX_BYTES = getattr(settings, 'KEYSTROKE_LOG_MAX_BYTES', 256 * 1024)
+
+# Сколько нажатий нужно, чтобы клавиша попала в список медленных
+MIN_HITS = 10
+
+
+class KeystrokeFormatError(ValueError):
+    pass
+
+
+def encode(events):
+    """Кодирует пары (код, задержка) в varint-байты"""
+    out = bytearray()
+    for code, delta in events:
+        for value in (code, delta):
+            while value >= 0x80:
+                out.append((value & 0x7F) | 0x80)
+                value >>= 7
+            out.append(value)
+    return bytes(out)
+
+
+def decode(data):
+    """Разбирает varint-байты в список пар (код, задержка)"""
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            if shift > 35:
+                raise KeystrokeFormatError("Слишком длинное число в журнале нажатий")
+            continue
+        if not len(values) % 2 and value > MAX_CODE:
+            raise KeystrokeFormatError("Код символа в журнале нажатий вне диапазона Юникода")
+        values.append(value)
+        value = shift = 0
+    if shift or len(values) % 2:
+        raise KeystrokeFormatError("Журнал нажатий обрывается посередине записи")
+    return list(zip(values[::2], values[1::2]))
+
+
+def from_upload(payload):
+    """Проверяет base64 из запроса и возвращает байты журнала (или None)"""
+    if not payload:
+        return None
+    if len(payload) > MAX_BYTES * 4 // 3 + 4:
+        raise KeystrokeFormatError("Журнал нажатий слишком большой")
+    try:
+        data = base64.b64decode(payload, validate=True)
+    except (binascii.Error, ValueError):
+        raise KeystrokeFormatError("Журнал нажатий должен быть в base64")
+    decode(data)
+    return data
+
+
+def analyze(data, original_text):
+    """Задержка и ошибки по ожидаемым клавишам и парам клавиш.
+
+    Возвращает {последовательность: [нажатий, сумма мс, ошибок]}.
+    Задержка первого нажатия (от начала теста) не учитывается.
+    """
+    stats = defaultdict(lambda: [0, 0, 0])
+    position = 0
+    previous = None
+    first = True
+    for code, delta in decode(data):
+        if code == BACKSPACE:
+            position = max(position - 1, 0)
+            previous = None
+            continue
+        if position >= len(original_text):
+            break
+        expected = original_text[position]
+        wrong = chr(code) != expected
+        # Регистр не различаем: это одна и та же клавиша
+        expected = expected.lower()
+        if not first:
+            for sequence in (expected, previous + expected if previous else None):
+                if sequence:
+                    entry = stats[sequence]
+                    entry[0] += 1
+                    entry[1] += delta
+                    entry[2] += wrong
+        first = False
+        previous = None if wrong else expected
+        position += 1
+    return stats
+
+
+def save_logs(results):
+    """Сохраняет журналы нажатий уже записанных результатов"""
+    logs = [
+        KeystrokeLog(result_id=result.pk, data=result.keystrokes)
+        for result in results
+        if getattr(result, 'keystrokes', None)
+    ]
+    if logs:
+        KeystrokeLog.objects.bulk_create(logs)
+
+
+def _merge(totals):
+    """Прибавляет {(user_id, sequence): [нажатий, мс, ошибок]} к KeyStat"""
+    user_ids = {user_id for user_id, _ in totals}
+    existing = {
+        (stat.user_id, stat.sequence): stat
+        for stat in KeyStat.objects.select_for_update().filter(
+            user_id__in=user_ids, sequence__in={sequence for _, sequence in totals},
+        )
+    }
+    created, updated = [], []
+    for key, (hits, total_ms, errors) in totals.items():
+        stat = existing.get(key)
+        if stat is None:
+            created.append(KeyStat(user_id=key[0], sequence=key[1], hits=hits, total_ms=total_ms, errors=errors))
+            continue
+        stat.hits += hits
+        stat.total_ms += total_ms
+        stat.errors += errors
+        updated.append(stat)
+    KeyStat.objects.bulk_create(created)
+    KeyStat.objects.bulk_update(updated, ['hits', 'total_ms', 'errors'])
+
+
+def analyze_pending(batch_size=500):
+    """Обрабатывает одну пачку необработанных журналов; возвращает их число"""
+    with transaction.atomic():
+        logs = list(
+            KeystrokeLog.objects
+            .select_for_update(skip_locked=True)
+            .filter(analyzed=False)
+            .select_related('result__text_sample')
+            .order_by('pk')[:batch_size]
+        )
+        if not logs:
+            return 0
+        totals = defaultdict(lambda: [0, 0, 0])
+        for log in logs:
+            result = log.result
+            if result.user_id is None or result.text_sample is None:
+                # Анонимам статистика не нужна, а без текста не с чем сравнивать
+                continue
+            try:
+                stats = analyze(bytes(log.data), result.text_sample.text)
+            except ValueError:
+                # Испорченный журнал помечается обработанным вместе с пачкой,
+                # иначе он возвращался бы в каждую следующую
+                logger.warning("Пропущен испорченный журнал нажатий %s", log.pk)
+                continue
+            for sequence, (hits, total_ms, errors) in stats.items():
+                entry = totals[(result.user_id, sequence)]
+                entry[0] += hits
+                entry[1] += total_ms
+                entry[2] += errors
+        _merge(totals)
+        KeystrokeLog.objects.filter(pk__in=[log.pk for log in logs]).update(analyzed=True)
+    return len(logs)
+
+
+def _slow_keys(user, bigrams, limit):
+    return (
+        KeyStat.objects
+        .filter(user=user, hits__gte=MIN_HITS)
+        .annotate(length=Length('sequence'), avg=Cast(F('total_ms'), FloatField()) / F('hits'))
+        .filter(length=2 if bigrams else 1)
+        .order_by('-avg')[:limit]
+    )
+
+
+def slow_keys(user, bigrams=False, limit=10):
+    """Самые медленные клавиши (или пары клавиш) пользователя"""
+    return list(_slow_keys(user, bigrams, limit))
+
+
+async def aslow_keys(user, bigrams=False, limit=10):
+    return [stat async for stat in _slow_keys(user, bigrams, limit)]
@@ -0,0 +1,206 @@
+"""Таблицы лидеров по языку, сложности и периоду.
+
+Каждая таблица — это топ-N результатов, который хранится в кэше Django и
+обновляется при сохранении нового результата. При промахе кэша таблица
+собирается одним запросом по индексу wpm, имена пользователей подтягиваются
+одним запросом на всю таблицу.
+
+У каждой таблицы есть счётчик поколений: record() увеличивает его, если
+таблицы нет в кэше, а собранная при промахе таблица кладётся в кэш, только
+если счётчик за время запроса не изменился. Иначе таблица, прочитанная до
+коммита нового результата, осталась бы в кэше без него на весь
+CACHE_TIMEOUT.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import replica
+from .models import TextSample, TypingTestResult
+
+BOARD_SIZE = getattr(settings, 'LEADERBOARD_SIZE', 50)
+CACHE_TIMEOUT = getattr(settings, 'LEADERBOARD_CACHE_TIMEOUT', 24 * 60 * 60)
+
+LANGUAGES = dict(TextSample._meta.get_field('language').choices)
+DIFFICULTIES = dict(TextSample._meta.get_field('difficulty').choices)
+PERIODS = {
+    'all': "За всё время",
+    'month': "За месяц",
+    'day': "За день",
+}
+
+ENTRY_FIELDS = ('id', 'user_id', 'wpm', 'accuracy', 'time_seconds', 'created_at')
+
+# Блокировка на время чтения-изменения-записи таблицы в кэше
+LOCK_TIMEOUT = 5
+
+
+def period_start(period, now=None):
+    """Начало текущего периода (None для «за всё время»)"""
+    if period == 'all':
+        return None
+    now = timezone.localtime(now)
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == 'month':
+        start = start.replace(day=1)
+    return start
+
+
+def _cache_key(language, difficulty, period, now=None):
+    start = period_start(period, now)
+    stamp = start.strftime('%Y%m%d') if start else 'all'
+    return f"leaderboard:{language or '*'}:{difficulty or '*'}:{period}:{stamp}"
+
+
+def _generation_key(key):
+    return f"{key}:gen"
+
+
+def _bump(key):
+    """Отмечает, что таблица key изменилась, пока её не было в кэше"""
+    generation_key = _generation_key(key)
+    if cache.add(generation_key, 1, CACHE_TIMEOUT):
+        return
+    try:
+        cache.incr(generation_key)
+    except ValueError:
+        # Ключ успел истечь между add и incr
+        cache.add(generation_key, 1, CACHE_TIMEOUT)
+
+
+def _sort_key(entry):
+    return -entry['wpm'], entry['id']
+
+
+def board_queryset(language, difficulty, period):
+    """Запрос строк таблицы лидеров (без кэша)"""
+    qs = TypingTestResult.objects.all()
+    if language:
+        qs = qs.filter(text_sample__language=language)
+    if difficulty:
+        qs = qs.filter(text_sample__difficulty=difficulty)
+    start = period_start(period)
+    if start is not None:
+        qs = qs.filter(created_at__gte=start)
+    return qs.order_by('-wpm', 'id').values(*ENTRY_FIELDS)[:BOARD_SIZE]
+
+
+def _user_ids(entries):
+    return {entry['user_id'] for entry in entries if entry['user_id'] is not None}
+
+
+def _with_usernames(entries, usernames):
+    return [dict(entry, username=usernames.get(entry['user_id'])) for entry in entries]
+
+
+def _attach_usernames(entries):
+    user_ids = _user_ids(entries)
+    usernames = dict(User.objects.filter(pk__in=user_ids).values_list('id', 'username')) if user_ids else {}
+    return _with_usernames(entries, usernames)
+
+
+def normalize(language, difficulty, period):
+    """Отбрасывает неизвестные значения фильтров"""
+    return (
+        language if language in LANGUAGES else '',
+        difficulty if difficulty in DIFFICULTIES else '',
+        period if period in PERIODS else 'all',
+    )
+
+
+def get_board(language='', difficulty='', period='all'):
+    """Топ результатов с именами пользователей"""
+    key = _cache_key(language, difficulty, period)
+    entries = cache.get(key)
+    if entries is None:
+        generation = cache.get(_generation_key(key))
+        # Таблица живёт в кэше долго — собираем её по основной базе, чтобы
+        # не закэшировать отставание реплики
+        with replica.primary():
+            entries = list(board_queryset(language, difficulty, period))
+        if cache.get(_generation_key(key)) == generation:
+            cache.set(key, entries, CACHE_TIMEOUT)
+    return _attach_usernames(entries)
+
+
+async def aget_board(language='', difficulty='', period='all'):
+    key = _cache_key(language, difficulty, period)
+    entries = await cache.aget(key)
+    if entries is None:
+        generation = await cache.aget(_generation_key(key))
+        with replica.primary():
+            entries = [entry async for entry in board_queryset(language, difficulty, period)]
+        if await cache.aget(_generation_key(key)) == generation:
+            await cache.aset(key, entries, CACHE_TIMEOUT)
+    user_ids = _user_ids(entries)
+    usernames = {
+        pk: username
+        async for pk, username in User.objects.filter(pk__in=user_ids).values_list('id', 'username')
+    } if user_ids else {}
+    return _with_usernames(entries, usernames)
+
+
+def scopes(language=None, difficulty=None):
+    """Все фильтры таблиц, под которые попадает пара язык/сложность"""
+    languages = ('', language) if language else ('',)
+    difficulties = ('', difficulty) if difficulty else ('',)
+    return [(lang, diff) for lang in languages for diff in difficulties]
+
+
+def _boards_for(result):
+    sample = result.text_sample
+    filters = scopes(sample.language, sample.difficulty) if sample is not None else scopes()
+    for language, difficulty in filters:
+        for period in PERIODS:
+            yield _cache_key(language, difficulty, period, result.created_at)
+
+
+def _qualifies(entries, entry):
+    return len(entries) < BOARD_SIZE or _sort_key(entry) < _sort_key(entries[-1])
+
+
+def record(results):
+    """Добавляет сохранённые результаты в закэшированные таблицы.
+
+    Таблицы, которых нет в кэше, соберутся при первом чтении; у них только
+    увеличивается поколение, чтобы уже идущая сборка не закэшировала
+    таблицу без результата. Если таблицу в этот момент обновляет другой
+    процесс, она сбрасывается, чтобы не потерять ни одну из записей.
+    """
+    for result in results:
+        entry = {field: getattr(result, field) for field in ENTRY_FIELDS}
+        for key in _boards_for(result):
+            entries = cache.get(key)
+            if entries is None:
+                _bump(key)
+                continue
+            if not _qualifies(entries, entry):
+                continue
+            lock_key = f"{key}:lock"
+            if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+                _bump(key)
+                cache.delete(key)
+                continue
+            try:
+                entries = cache.get(key)
+                if entries is not None:
+                    entries = sorted(entries + [entry], key=_sort_key)[:BOARD_SIZE]
+                    cache.set(key, entries, CACHE_TIMEOUT)
+            finally:
+                cache.delete(lock_key)
+
+
+def invalidate(result=None):
+    """Сбрасывает таблицы, в которые входит результат (или все текущие)"""
+    if result is not None:
+        cache.delete_many(list(_boards_for(result)))
+        return
+    filters = {
+        scope for language in LANGUAGES for difficulty in DIFFICULTIES
+        for scope in scopes(language, difficulty)
+    }
+    cache.delete_many([
+        _cache_key(language, difficulty, period)
+        for language, difficulty in filters for period in PERIODS
+    ])
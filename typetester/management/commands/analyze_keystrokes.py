@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from typetester import keystrokes
+
+
+class Command(BaseCommand):
+    help = "Разбирает необработанные журналы нажатий и накапливает статистику клавиш пользователей"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Журналов в одной транзакции")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            processed = keystrokes.analyze_pending(options['batch_size'])
+            if not processed:
+                break
+            total += processed
+            self.stdout.write(f"Обработано журналов: {total}")
+        self.stdout.write(self.style.SUCCESS(f"Готово, обработано журналов: {total}"))
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from typetester import backup
+
+
+class Command(BaseCommand):
+    help = (
+        "Выгружает тексты, результаты и дневные сводки в сжатые сегменты по столбцам; повторный "
+        "запуск дописывает только строки, появившиеся после прошлой копии"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default=settings.BACKUP_DIR,
+            help="Каталог резервной копии (по умолчанию BACKUP_DIR)",
+        )
+        parser.add_argument('--segment-size', type=int, default=backup.SEGMENT_SIZE, help="Строк в одном сегменте")
+        parser.add_argument('--chunk-size', type=int, default=backup.CHUNK_SIZE, help="Строк за одно чтение из базы")
+
+    def handle(self, *args, **options):
+        try:
+            exported = backup.export(
+                options['output'], options['segment_size'], options['chunk_size'], progress=self._progress,
+            )
+        except (OSError, backup.BackupError) as exc:
+            raise CommandError(str(exc))
+        summary = ", ".join(f"{label}: {rows}" for label, rows in exported.items())
+        self.stdout.write(self.style.SUCCESS(f"Выгружено строк — {summary}"))
+
+    def _progress(self, label, segment):
+        self.stdout.write(f"{segment['file']}: {segment['rows']} строк")
@@ -0,0 +1,65 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from typetester import corpus, samples, textgen
+from typetester.models import TextSample
+
+
+class Command(BaseCommand):
+    help = (
+        "Строит частотные таблицы слов и пар слов по языкам для генерации текстов без базы: "
+        "по TextSample, текстам по умолчанию и файлам корпуса"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help="Дополнительные файлы корпуса в UTF-8 (обычный текст или JSONL)")
+        parser.add_argument(
+            '--format', choices=['auto', 'text', 'jsonl'], default='auto',
+            help="Формат файлов (auto — по расширению .jsonl)",
+        )
+        parser.add_argument(
+            '--language', choices=list(textgen.LANGUAGES), action='append',
+            help="Строить только для этого языка (можно повторять)",
+        )
+        parser.add_argument('--max-words', type=int, default=textgen.MAX_WORDS, help="Слов в словаре языка")
+        parser.add_argument('--no-samples', action='store_true', help="Не брать тексты из базы")
+
+    def _texts(self, options):
+        """Пары (язык, текст) из всех источников"""
+        for (_, language), text in samples.DEFAULT_TEXTS.items():
+            yield language, text
+        if not options['no_samples']:
+            yield from (
+                (language, text)
+                for text, language in TextSample.objects.order_by().values_list('text', 'language').iterator()
+            )
+        for path in options['paths']:
+            for record in corpus.read_records(path, options['format']):
+                text = corpus.normalize(record['text'])
+                yield record.get('language') or corpus.detect_language(text), text
+
+    def handle(self, *args, **options):
+        languages = options['language'] or list(textgen.LANGUAGES)
+        # Тексты сразу идут в счётчики: в памяти только частоты, а не весь корпус
+        counts = {language: (Counter(), Counter()) for language in languages}
+        try:
+            for language, text in self._texts(options):
+                if language in counts:
+                    textgen.update_counts(*counts[language], text)
+        except (OSError, UnicodeDecodeError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        for language in languages:
+            words, pairs = counts[language]
+            if not words:
+                self.stdout.write(self.style.WARNING(f"{language}: нет текстов, таблицы не построены"))
+                continue
+            data = textgen.build(words, pairs, language, options['max_words'])
+            path = textgen.table_path(language)
+            textgen.write(path, data)
+            self.stdout.write(
+                f"{language}: слов {min(len(words), options['max_words'])}, пар {len(pairs)}, "
+                f"{len(data) // 1024} КБ → {path}"
+            )
+        self.stdout.write(self.style.SUCCESS("Готово"))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from typetester import leaderboard, pagecache, retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Сворачивает результаты старше срока хранения в дневные сводки по пользователю, "
+        "языку и сложности и удаляет исходные строки пачками; личные рекорды и строки "
+        "текущих таблиц лидеров остаются"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=retention.RETENTION_DAYS,
+            help="Сворачивать результаты старше стольких дней (RESULT_RETENTION_DAYS)",
+        )
+        parser.add_argument('--batch-size', type=int, default=retention.BATCH_SIZE, help="Строк в одной транзакции")
+        parser.add_argument('--pause', type=float, default=0, help="Пауза между пачками, секунд")
+        parser.add_argument('--dry-run', action='store_true', help="Только посчитать строки, ничего не меняя")
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError("--days должен быть не меньше 1")
+        self.verbosity = options['verbosity']
+        before = retention.cutoff(options['days'])
+        try:
+            folded = retention.compact(
+                before, options['batch_size'], options['pause'], options['dry_run'], progress=self._progress,
+            )
+        finally:
+            if not options['dry_run']:
+                # Удалённые строки могли быть в таблицах лидеров
+                leaderboard.invalidate()
+                pagecache.invalidate()
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"Будет свёрнуто результатов до {before:%Y-%m-%d}: {folded}"))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Свёрнуто результатов до {before:%Y-%m-%d}: {folded}"))
+
+    def _progress(self, folded):
+        if self.verbosity >= 2:
+            self.stdout.write(f"  {folded}")
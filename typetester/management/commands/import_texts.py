@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from typetester import corpus, leaderboard, samples
+
+
+class Command(BaseCommand):
+    help = (
+        "Импортирует тексты из больших корпусов (обычный текст или JSONL, можно .gz): "
+        "режет на отрывки, определяет язык и сложность, отбрасывает повторы"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help="Файлы корпуса в UTF-8")
+        parser.add_argument(
+            '--format', choices=['auto', 'text', 'jsonl'], default='auto',
+            help="Формат файлов (auto — по расширению .jsonl)",
+        )
+        parser.add_argument(
+            '--language', choices=list(leaderboard.LANGUAGES),
+            help="Язык всех отрывков вместо определения по алфавиту",
+        )
+        parser.add_argument(
+            '--difficulty', choices=list(leaderboard.DIFFICULTIES),
+            help="Сложность всех отрывков вместо эвристики",
+        )
+        parser.add_argument('--min-chars', type=int, default=corpus.MIN_CHARS, help="Минимальная длина отрывка")
+        parser.add_argument('--max-chars', type=int, default=corpus.MAX_CHARS, help="Максимальная длина отрывка")
+        parser.add_argument('--batch-size', type=int, default=corpus.BATCH_SIZE, help="Отрывков в одной вставке")
+        parser.add_argument('--dry-run', action='store_true', help="Только разобрать файлы, ничего не записывая")
+
+    def handle(self, *args, **options):
+        if options['min_chars'] > options['max_chars']:
+            raise CommandError("--min-chars больше --max-chars")
+        total_read = total_added = 0
+        try:
+            for path in options['paths']:
+                records = corpus.read_records(path, options['format'])
+                passages = corpus.passages(
+                    records, options['language'], options['difficulty'],
+                    options['min_chars'], options['max_chars'],
+                )
+                read, added = corpus.import_samples(passages, options['batch_size'], options['dry_run'])
+                total_read += read
+                total_added += added
+                self.stdout.write(f"{path}: отрывков {read}, новых {added}")
+        except (OSError, UnicodeDecodeError, ValueError) as exc:
+            raise CommandError(str(exc))
+        finally:
+            # bulk_create не шлёт сигналы — индекс текстов сбрасываем сами,
+            # в том числе если импорт оборвался после части пачек
+            if not options['dry_run']:
+                samples.invalidate()
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"Разобрано отрывков: {total_read}, в базу ничего не записано"))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: отрывков {total_read}, добавлено {total_added}, повторов {total_read - total_added}"
+        ))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from typetester import histogram, pagecache, rollup, userstats
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересобирает сводную статистику (StatsRollup), гистограммы WPM и сводки "
+        "пользователей по исходным результатам и сверяет их с ними"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help="Только сверить сводную статистику с исходными строками, ничего не изменяя",
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            totals = rollup.rebuild()
+            self.stdout.write(f"Пересобрано строк статистики: {len(totals)}")
+            counts = histogram.rebuild()
+            self.stdout.write(f"Пересобрано гистограмм WPM: {len(counts)}")
+            users = userstats.rebuild()
+            self.stdout.write(f"Пересобрано сводок пользователей: {len(users)}")
+            # Страницы показывают сводную статистику — их версии тоже новые
+            pagecache.invalidate()
+
+        mismatches = rollup.check()
+        for (language, difficulty), field, stored, actual in mismatches:
+            self.stderr.write(f"{self._scope(language, difficulty)}: {field} = {stored}, по данным {actual}")
+        histogram_mismatches = histogram.check()
+        for (language, difficulty), stored, actual in histogram_mismatches:
+            self.stderr.write(
+                f"{self._scope(language, difficulty)}: гистограмма WPM ({stored} результатов) "
+                f"не совпадает с данными ({actual})"
+            )
+        user_mismatches = userstats.check()
+        for user_id in user_mismatches:
+            self.stderr.write(f"Сводка пользователя {user_id} не совпадает с его результатами")
+
+        total = len(mismatches) + len(histogram_mismatches) + len(user_mismatches)
+        if total:
+            raise CommandError(f"Найдено расхождений: {total}")
+        self.stdout.write(self.style.SUCCESS("Сводная статистика совпадает с исходными данными"))
+
+    @staticmethod
+    def _scope(language, difficulty):
+        return f"{language}/{difficulty}" if language or difficulty else "глобально"
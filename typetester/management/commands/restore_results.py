@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from typetester import backup, leaderboard, pagecache, samples
+
+
+class Command(BaseCommand):
+    help = (
+        "Загружает тексты, результаты и дневные сводки из резервной копии backup_results; строки, которые "
+        "уже есть в базе, пропускаются, после загрузки пересобирается статистика"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=settings.BACKUP_DIR,
+            help="Каталог резервной копии (по умолчанию BACKUP_DIR)",
+        )
+        parser.add_argument('--batch-size', type=int, default=backup.BATCH_SIZE, help="Строк в одной вставке")
+        parser.add_argument(
+            '--no-rebuild', action='store_true',
+            help="Не пересобирать статистику (тогда запустите rebuild_stats сами)",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            restored = backup.restore(options['path'], options['batch_size'], progress=self._progress)
+        except (OSError, ValueError, backup.BackupError) as exc:
+            raise CommandError(str(exc))
+        finally:
+            # bulk_create не шлёт сигналы — кэши сбрасываем сами
+            samples.invalidate()
+            leaderboard.invalidate()
+            pagecache.invalidate()
+        for label, (added, orphans) in restored.items():
+            line = f"{label}: добавлено {added}"
+            if orphans:
+                line += f", ссылок на отсутствующие строки обнулено {orphans}"
+            self.stdout.write(line)
+        if not options['no_rebuild']:
+            call_command('rebuild_stats', stdout=self.stdout, stderr=self.stderr)
+
+    def _progress(self, label, segment, added):
+        self.stdout.write(f"{segment['file']}: добавлено {added} из {segment['rows']}")
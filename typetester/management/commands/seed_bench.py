@@ -0,0 +1,54 @@
+import random
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from typetester import leaderboard, pagecache, samples, seeding
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет базу синтетическими пользователями, текстами и результатами для нагрузочных замеров "
+        "(bulk-вставки пачками, затем пересборка статистики)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--results', type=int, default=10000, help="Сколько результатов добавить")
+        parser.add_argument('--users', type=int, help="Пользователей bench_N (по умолчанию результатов / 100)")
+        parser.add_argument('--samples', type=int, default=50, help="Текстов на каждую пару язык+сложность")
+        parser.add_argument('--days', type=int, default=365, help="На сколько дней назад разнести результаты")
+        parser.add_argument('--batch-size', type=int, default=seeding.BATCH_SIZE, help="Строк в одной вставке")
+        parser.add_argument('--seed', type=int, default=1, help="Начальное значение генератора")
+        parser.add_argument('--no-rebuild', action='store_true', help="Не пересобирать статистику после вставки")
+
+    def handle(self, *args, **options):
+        if options['results'] < 0 or options['samples'] < 1:
+            raise CommandError("--results не может быть отрицательным, --samples должен быть не меньше 1")
+        self.verbosity = options['verbosity']
+        rng = random.Random(options['seed'])
+        users_count = options['users'] if options['users'] is not None else max(options['results'] // 100, 1)
+        started = time.perf_counter()
+
+        user_ids = seeding.seed_users(users_count, options['batch_size'])
+        sample_rows = seeding.seed_samples(options['samples'], rng)
+        self.stdout.write(f"Пользователей: {len(user_ids)}, текстов: {len(sample_rows)}")
+        try:
+            inserted = seeding.seed_results(
+                options['results'], user_ids, sample_rows, rng, options['days'], options['batch_size'],
+                progress=self._progress,
+            )
+        finally:
+            # bulk_create не шлёт сигналы — кэши сбрасываем сами
+            samples.invalidate()
+            leaderboard.invalidate()
+            pagecache.invalidate()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"Результатов: {inserted} за {elapsed:.1f} с ({inserted / max(elapsed, 1e-9):.0f} строк/с)")
+
+        if not options['no_rebuild']:
+            call_command('rebuild_stats', stdout=self.stdout, stderr=self.stderr)
+
+    def _progress(self, inserted):
+        if self.verbosity >= 2:
+            self.stdout.write(f"  {inserted}")
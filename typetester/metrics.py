@@ -0,0 +1,330 @@
+"""Метрики запросов по маршрутам в формате Prometheus.
+
+MetricsMiddleware замеряет для каждого запроса время ответа, число и время
+SQL-запросов и размер ответа и копит их в памяти процесса — это несколько
+сложений под блокировкой. Раз в FLUSH_INTERVAL секунд накопленное
+прибавляется к счётчикам в кэше Django (cache.add/cache.incr), так что при
+общем кэше (Redis, Memcached) /metrics показывает сумму по всем воркерам.
+
+SQL считается обёрткой из connection.execute_wrapper, которая ставится на
+каждое соединение один раз (сигнал connection_created) и пишет в счётчики
+текущего запроса через contextvar — так учитываются и запросы асинхронных
+представлений, выполняемые в потоках sync_to_async.
+
+Если задан SLOW_REQUEST_MS, запросы дольше порога пишутся в лог
+typetester.slow_requests вместе с самыми долгими SQL-запросами.
+"""
+import atexit
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import URLPattern, URLResolver, get_resolver
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger('typetester.slow_requests')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL': 10.0,
+    'SLOW_REQUEST_MS': 0,
+    'SLOW_SQL_LIMIT': 5,
+    'TOKEN': '',
+}
+OPTIONS = {**DEFAULTS, **getattr(settings, 'METRICS', {})}
+
+PREFIX = 'typemaster'
+CACHE_PREFIX = 'metrics'
+
+# Границы корзин гистограммы времени ответа, секунды
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATUSES = ('1xx', '2xx', '3xx', '4xx', '5xx')
+# Исходы кэша страниц (typetester.pagecache)
+CACHE_RESULTS = ('hit', 'miss', 'not_modified')
+# Исходы допуска save_result (typetester.admission)
+ADMISSION_RESULTS = ('accepted', 'replayed', 'in_flight', 'limited')
+
+# Поля строки счётчиков маршрута; времена хранятся в микросекундах, чтобы
+# счётчики в кэше были целыми и складывались через incr
+FIELDS = (
+    ('requests', 'duration_us', 'db_queries', 'db_us', 'response_bytes')
+    + tuple(f'status_{status}' for status in STATUSES)
+    + tuple(f'bucket_{index}' for index in range(len(BUCKETS) + 1))
+    + tuple(f'cache_{result}' for result in CACHE_RESULTS)
+    + tuple(f'admission_{result}' for result in ADMISSION_RESULTS)
+)
+STATUS_OFFSET = FIELDS.index('status_1xx')
+BUCKET_OFFSET = FIELDS.index('bucket_0')
+CACHE_OFFSET = FIELDS.index('cache_hit')
+ADMISSION_OFFSET = FIELDS.index('admission_accepted')
+
+UNMATCHED = 'unmatched'
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'sql')
+
+    def __init__(self, keep_sql):
+        self.queries = 0
+        self.db_time = 0.0
+        self.sql = [] if keep_sql else None
+
+
+_current = ContextVar('typetester_request_stats', default=None)
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """Считает SQL-запросы текущего запроса (вне запроса ничего не делает)"""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats.queries += 1
+        stats.db_time += elapsed
+        if stats.sql is not None:
+            stats.sql.append((elapsed, sql))
+
+
+def instrument(connection):
+    """Ставит execute_wrapper на соединение (повторный вызов ничего не меняет)"""
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, execute_wrapper)
+
+
+class Collector:
+    """Счётчики маршрутов в памяти процесса с периодической выгрузкой в кэш"""
+
+    def __init__(self, flush_interval=10.0):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._next_flush = time.monotonic() + flush_interval
+
+    def _row(self, route):
+        row = self._pending.get(route)
+        if row is None:
+            row = self._pending[route] = [0] * len(FIELDS)
+        return row
+
+    def record_cache(self, route, result):
+        """Исход кэша страницы: hit, miss или not_modified"""
+        field = CACHE_OFFSET + CACHE_RESULTS.index(result)
+        with self._lock:
+            self._row(route)[field] += 1
+
+    def record_admission(self, route, result):
+        """Исход допуска запроса: accepted, replayed, in_flight или limited"""
+        field = ADMISSION_OFFSET + ADMISSION_RESULTS.index(result)
+        with self._lock:
+            self._row(route)[field] += 1
+
+    def record(self, route, status, duration, queries, db_time, size):
+        bucket = BUCKET_OFFSET + bisect_left(BUCKETS, duration)
+        status_field = STATUS_OFFSET + min(max(status // 100, 1), 5) - 1
+        with self._lock:
+            row = self._row(route)
+            row[0] += 1
+            row[1] += int(duration * 1e6)
+            row[2] += queries
+            row[3] += int(db_time * 1e6)
+            row[4] += size
+            row[status_field] += 1
+            row[bucket] += 1
+            due = time.monotonic() >= self._next_flush
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Прибавляет накопленное к общим счётчикам в кэше"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._next_flush = time.monotonic() + self.flush_interval
+        try:
+            for route, row in pending.items():
+                for field, value in zip(FIELDS, row):
+                    if value:
+                        key = _key(route, field)
+                        if not cache.add(key, value, None):
+                            cache.incr(key, value)
+        except Exception:
+            # Метрики не должны ронять запрос; недописанное теряется
+            logger.exception("Не удалось выгрузить метрики в кэш")
+
+
+def _key(route, field):
+    return f"{CACHE_PREFIX}:{route}:{field}"
+
+
+def route_for(request):
+    """Метка маршрута: имя URL, пространство имён (admin) или unmatched"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNMATCHED
+    if match.namespaces:
+        return match.namespaces[0]
+    return match.url_name or UNMATCHED
+
+
+def _route_labels(resolver=None, top=True):
+    """Все возможные метки маршрутов — по ним собираются ключи для /metrics"""
+    labels = set()
+    for pattern in (resolver or get_resolver()).url_patterns:
+        if isinstance(pattern, URLResolver):
+            if pattern.namespace:
+                labels.add(pattern.namespace)
+            else:
+                labels |= _route_labels(pattern, top=False)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            labels.add(pattern.name)
+    if top:
+        labels.add(UNMATCHED)
+    return labels
+
+
+def _series(name, route, value, **labels):
+    labels = {'route': route, **labels}
+    rendered = ','.join(f'{key}="{label}"' for key, label in labels.items())
+    return f"{PREFIX}_{name}{{{rendered}}} {value}"
+
+
+def render():
+    """Текст для Prometheus по общим счётчикам в кэше"""
+    collector.flush()
+    routes = sorted(_route_labels())
+    values = cache.get_many([_key(route, field) for route in routes for field in FIELDS])
+    rows = {
+        route: [values.get(_key(route, field), 0) for field in FIELDS]
+        for route in routes
+    }
+    rows = {route: row for route, row in rows.items() if row[0]}
+
+    lines = [
+        f"# HELP {PREFIX}_requests_total Запросы по маршруту и классу статуса",
+        f"# TYPE {PREFIX}_requests_total counter",
+    ]
+    for route, row in rows.items():
+        for index, status in enumerate(STATUSES):
+            if row[STATUS_OFFSET + index]:
+                lines.append(_series('requests_total', route, row[STATUS_OFFSET + index], status=status))
+
+    lines += [
+        f"# HELP {PREFIX}_request_duration_seconds Время ответа",
+        f"# TYPE {PREFIX}_request_duration_seconds histogram",
+    ]
+    for route, row in rows.items():
+        cumulative = 0
+        for index, bound in enumerate(BUCKETS + (float('inf'),)):
+            cumulative += row[BUCKET_OFFSET + index]
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(_series('request_duration_seconds_bucket', route, cumulative, le=le))
+        lines.append(_series('request_duration_seconds_sum', route, row[1] / 1e6))
+        lines.append(_series('request_duration_seconds_count', route, row[0]))
+
+    for name, index, scale, help_text in (
+        ('db_queries_total', 2, 1, "SQL-запросы"),
+        ('db_time_seconds_total', 3, 1e6, "Время SQL-запросов"),
+        ('response_bytes_total', 4, 1, "Размер ответов"),
+    ):
+        lines += [f"# HELP {PREFIX}_{name} {help_text}", f"# TYPE {PREFIX}_{name} counter"]
+        for route, row in rows.items():
+            lines.append(_series(name, route, row[index] / scale if scale != 1 else row[index]))
+
+    cached = {route: row[CACHE_OFFSET:CACHE_OFFSET + len(CACHE_RESULTS)] for route, row in rows.items()}
+    cached = {route: counts for route, counts in cached.items() if any(counts)}
+    lines += [
+        f"# HELP {PREFIX}_page_cache_total Ответы из кэша страниц, промахи и 304",
+        f"# TYPE {PREFIX}_page_cache_total counter",
+    ]
+    for route, counts in cached.items():
+        for result, value in zip(CACHE_RESULTS, counts):
+            lines.append(_series('page_cache_total', route, value, result=result))
+    lines += [
+        f"# HELP {PREFIX}_page_cache_hit_ratio Доля запросов без рендеринга страницы (кэш и 304)",
+        f"# TYPE {PREFIX}_page_cache_hit_ratio gauge",
+    ]
+    for route, (hit, miss, not_modified) in cached.items():
+        lines.append(_series('page_cache_hit_ratio', route, round((hit + not_modified) / (hit + miss + not_modified), 4)))
+
+    lines += [
+        f"# HELP {PREFIX}_admission_total Допуск записи: принятые, повторы, ещё в работе и отказы по лимиту",
+        f"# TYPE {PREFIX}_admission_total counter",
+    ]
+    for route, row in rows.items():
+        for index, result in enumerate(ADMISSION_RESULTS):
+            if row[ADMISSION_OFFSET + index]:
+                lines.append(_series('admission_total', route, row[ADMISSION_OFFSET + index], result=result))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """Замеры запроса для /metrics; работает и в синхронном, и в асинхронном стеке"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = OPTIONS['ENABLED']
+        self.slow_threshold = OPTIONS['SLOW_REQUEST_MS'] / 1000
+        self.is_async = iscoroutinefunction(self.get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        stats, token, started = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, stats, started)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        stats, token, started = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, stats, started)
+        return response
+
+    def _start(self):
+        stats = RequestStats(keep_sql=bool(self.slow_threshold))
+        return stats, _current.set(stats), time.perf_counter()
+
+    def _finish(self, request, response, stats, started):
+        duration = time.perf_counter() - started
+        size = 0 if response.streaming else len(response.content)
+        route = route_for(request)
+        collector.record(route, response.status_code, duration, stats.queries, stats.db_time, size)
+        if self.slow_threshold and duration >= self.slow_threshold:
+            self._log_slow(request, route, duration, stats)
+
+    @staticmethod
+    def _log_slow(request, route, duration, stats):
+        slowest = sorted(stats.sql, reverse=True)[:OPTIONS['SLOW_SQL_LIMIT']]
+        queries = ''.join(f"\n  {elapsed * 1000:.1f} мс: {sql}" for elapsed, sql in slowest)
+        slow_logger.warning(
+            "Медленный запрос %s %s (%s): %.1f мс, SQL: %d за %.1f мс%s",
+            request.method, request.path, route, duration * 1000,
+            stats.queries, stats.db_time * 1000, queries,
+        )
+
+
+collector = Collector(OPTIONS['FLUSH_INTERVAL'])
+atexit.register(collector.flush)
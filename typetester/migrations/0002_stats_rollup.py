@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('typetester', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('language', models.CharField(blank=True, default='', max_length=10, verbose_name='Язык')),
+                ('difficulty', models.CharField(blank=True, default='', max_length=20, verbose_name='Сложность')),
+                ('tests_count', models.BigIntegerField(default=0, verbose_name='Количество тестов')),
+                ('users_count', models.BigIntegerField(default=0, verbose_name='Количество пользователей')),
+                ('wpm_sum', models.FloatField(default=0, verbose_name='Сумма WPM')),
+                ('wpm_sq_sum', models.FloatField(default=0, verbose_name='Сумма квадратов WPM')),
+                ('wpm_max', models.FloatField(default=0, verbose_name='Лучший WPM')),
+                ('accuracy_sum', models.FloatField(default=0, verbose_name='Сумма точности')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Сводная статистика',
+                'verbose_name_plural': 'Сводная статистика',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='statsrollup',
+            constraint=models.UniqueConstraint(fields=('language', 'difficulty'), name='stats_rollup_scope_unique'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('typetester', '0002_stats_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WpmHistogram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('language', models.CharField(blank=True, default='', max_length=10, verbose_name='Язык')),
+                ('difficulty', models.CharField(blank=True, default='', max_length=20, verbose_name='Сложность')),
+                ('total', models.BigIntegerField(default=0, verbose_name='Количество результатов')),
+                ('tree', models.BinaryField(verbose_name='Дерево счётчиков')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Гистограмма WPM',
+                'verbose_name_plural': 'Гистограммы WPM',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='wpmhistogram',
+            constraint=models.UniqueConstraint(fields=('language', 'difficulty'), name='wpm_histogram_scope_unique'),
+        ),
+    ]
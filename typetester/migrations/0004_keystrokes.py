@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('typetester', '0003_wpm_histogram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeystrokeLog',
+            fields=[
+                ('result', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='keystroke_log', serialize=False, to='typetester.typingtestresult', verbose_name='Результат теста')),
+                ('data', models.BinaryField(verbose_name='Нажатия')),
+                ('analyzed', models.BooleanField(db_index=True, default=False, verbose_name='Обработан')),
+            ],
+            options={
+                'verbose_name': 'Журнал нажатий',
+                'verbose_name_plural': 'Журналы нажатий',
+            },
+        ),
+        migrations.CreateModel(
+            name='KeyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.CharField(max_length=2, verbose_name='Клавиша или пара')),
+                ('hits', models.BigIntegerField(default=0, verbose_name='Нажатий')),
+                ('total_ms', models.BigIntegerField(default=0, verbose_name='Суммарная задержка (мс)')),
+                ('errors', models.BigIntegerField(default=0, verbose_name='Ошибок')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='key_stats', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Статистика клавиши',
+                'verbose_name_plural': 'Статистика клавиш',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='keystat',
+            constraint=models.UniqueConstraint(fields=('user', 'sequence'), name='key_stat_user_sequence_unique'),
+        ),
+    ]
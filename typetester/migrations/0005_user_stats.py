@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('typetester', '0004_keystrokes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='typing_stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('tests_count', models.BigIntegerField(default=0, verbose_name='Количество тестов')),
+                ('wpm_sum', models.FloatField(default=0, verbose_name='Сумма WPM')),
+                ('best_wpm', models.FloatField(default=0, verbose_name='Лучший WPM')),
+                ('accuracy_sum', models.FloatField(default=0, verbose_name='Сумма точности')),
+                ('recent_wpm', models.JSONField(blank=True, default=list, verbose_name='WPM последних тестов')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Статистика пользователя',
+                'verbose_name_plural': 'Статистика пользователей',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='typingtestresult',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='result_user_created_idx'),
+        ),
+    ]
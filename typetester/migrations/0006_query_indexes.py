@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('typetester', '0005_user_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='textsample',
+            index=models.Index(fields=['difficulty', 'language'], name='sample_difficulty_lang_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='typingtestresult',
+            index=models.Index(fields=['-wpm', 'id'], name='result_wpm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='typingtestresult',
+            index=models.Index(fields=['-created_at'], name='result_created_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:08
+
+from django.db import migrations, models
+
+
+def fill_content_hash(apps, schema_editor):
+    """Хеш получает первый (по id) из одинаковых текстов.
+
+    Остальные повторы не удаляются — на них могут ссылаться результаты, а
+    язык и сложность у повторов бывают разные. Их content_hash остаётся
+    пустым: TextSample.save не заполняет его, пока текст совпадает с уже
+    захешированным, а TextSample.clean не даёт сохранить в админке новый
+    повтор. Лишний повтор можно удалить в админке — его результаты
+    останутся без текста (SET_NULL).
+    """
+    from typetester.corpus import content_hash
+
+    TextSample = apps.get_model('typetester', 'TextSample')
+    seen = set()
+    batch = []
+    for sample in TextSample.objects.order_by('pk').only('pk', 'text').iterator():
+        key = content_hash(sample.text)
+        # У повторов, которые уже есть в базе, хеш остаётся пустым
+        if key in seen:
+            continue
+        seen.add(key)
+        sample.content_hash = key
+        batch.append(sample)
+        if len(batch) >= 500:
+            TextSample.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    TextSample.objects.bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('typetester', '0006_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='textsample',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, verbose_name='Хеш текста'),
+        ),
+        migrations.RunPython(fill_content_hash, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='textsample',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True, verbose_name='Хеш текста'),
+        ),
+    ]
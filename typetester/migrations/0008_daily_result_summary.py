@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('typetester', '0007_text_sample_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyResultSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('language', models.CharField(blank=True, default='', max_length=10, verbose_name='Язык')),
+                ('difficulty', models.CharField(blank=True, default='', max_length=20, verbose_name='Сложность')),
+                ('tests_count', models.BigIntegerField(default=0, verbose_name='Количество тестов')),
+                ('wpm_sum', models.FloatField(default=0, verbose_name='Сумма WPM')),
+                ('wpm_sq_sum', models.FloatField(default=0, verbose_name='Сумма квадратов WPM')),
+                ('wpm_max', models.FloatField(default=0, verbose_name='Лучший WPM')),
+                ('accuracy_sum', models.FloatField(default=0, verbose_name='Сумма точности')),
+                ('words_sum', models.BigIntegerField(default=0, verbose_name='Сумма слов')),
+                ('time_sum', models.FloatField(default=0, verbose_name='Суммарное время (сек)')),
+                ('mistakes_sum', models.BigIntegerField(default=0, verbose_name='Сумма ошибок')),
+                ('wpm_counts', models.JSONField(default=dict, verbose_name='Распределение WPM')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_summaries', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Сводка результатов за день',
+                'verbose_name_plural': 'Сводки результатов за день',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyresultsummary',
+            constraint=models.UniqueConstraint(fields=('day', 'user', 'language', 'difficulty'), name='daily_summary_scope_unique'),
+        ),
+    ]
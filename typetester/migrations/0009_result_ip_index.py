@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('typetester', '0008_daily_result_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='typingtestresult',
+            index=models.Index(fields=['ip_address'], name='result_ip_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:20
+
+import sys
+from array import array
+
+from django.db import migrations, models
+
+
+def split_histograms(apps, schema_editor):
+    """Раскладывает деревья Фенвика WpmHistogram по строкам корзин"""
+    WpmHistogram = apps.get_model('typetester', 'WpmHistogram')
+    WpmBucket = apps.get_model('typetester', 'WpmBucket')
+    buckets = []
+    for row in WpmHistogram.objects.iterator():
+        tree = array('I')
+        tree.frombytes(bytes(row.tree))
+        if sys.byteorder != 'little':
+            tree.byteswap()
+
+        def prefix(i):
+            total = 0
+            while i > 0:
+                total += tree[i]
+                i -= i & -i
+            return total
+
+        previous = 0
+        for bucket in range(len(tree) - 1):
+            current = prefix(bucket + 1)
+            if current > previous:
+                buckets.append(WpmBucket(
+                    language=row.language, difficulty=row.difficulty, bucket=bucket, count=current - previous,
+                ))
+            previous = current
+    WpmBucket.objects.bulk_create(buckets, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('typetester', '0009_result_ip_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WpmBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('language', models.CharField(blank=True, default='', max_length=10, verbose_name='Язык')),
+                ('difficulty', models.CharField(blank=True, default='', max_length=20, verbose_name='Сложность')),
+                ('bucket', models.PositiveIntegerField(verbose_name='Корзина')),
+                ('count', models.BigIntegerField(default=0, verbose_name='Количество результатов')),
+            ],
+            options={
+                'verbose_name': 'Корзина гистограммы WPM',
+                'verbose_name_plural': 'Корзины гистограммы WPM',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='wpmbucket',
+            constraint=models.UniqueConstraint(fields=('language', 'difficulty', 'bucket'), name='wpm_bucket_scope_unique'),
+        ),
+        # Обратно гистограммы не собираются: после отката выполните rebuild_stats
+        migrations.RunPython(split_histograms, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='WpmHistogram',
+        ),
+    ]
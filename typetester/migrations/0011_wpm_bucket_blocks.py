@@ -0,0 +1,56 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:37
+
+import math
+from collections import Counter
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def add_blocks(apps, schema_editor):
+    """Складывает существующие корзины в блоки (как histogram.BLOCK_SIZE)"""
+    WpmBucket = apps.get_model('typetester', 'WpmBucket')
+    width = getattr(settings, 'RANK_HISTOGRAM_BUCKET', 0.1)
+    max_wpm = getattr(settings, 'RANK_HISTOGRAM_MAX_WPM', 300)
+    block_size = math.isqrt(int(round(max_wpm / width))) + 1
+    blocks = Counter()
+    for language, difficulty, bucket, count in WpmBucket.objects.values_list(
+        'language', 'difficulty', 'bucket', 'count',
+    ).iterator():
+        blocks[(language, difficulty, bucket // block_size)] += count
+    WpmBucket.objects.bulk_create(
+        (
+            WpmBucket(language=language, difficulty=difficulty, level=1, bucket=block, count=count)
+            for (language, difficulty, block), count in blocks.items()
+            if count
+        ),
+        batch_size=1000,
+    )
+
+
+def remove_blocks(apps, schema_editor):
+    apps.get_model('typetester', 'WpmBucket').objects.filter(level=1).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('typetester', '0010_wpm_buckets'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='wpmbucket',
+            name='wpm_bucket_scope_unique',
+        ),
+        migrations.AddField(
+            model_name='wpmbucket',
+            name='level',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Уровень (0 — корзина, 1 — блок)'),
+        ),
+        migrations.RunPython(add_blocks, remove_blocks),
+        migrations.AddConstraint(
+            model_name='wpmbucket',
+            constraint=models.UniqueConstraint(fields=('language', 'difficulty', 'level', 'bucket'), name='wpm_bucket_scope_unique'),
+        ),
+    ]
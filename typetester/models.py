@@ -1,3 +1,4 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.contrib.auth.models import User
 
@@ -14,10 +15,43 @@ class TextSample(models.Model):
         ('en', 'Английский'),
     ], verbose_name="Язык", default='ru')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    # Хеш нормализованного текста, по нему импорт отсекает повторы
+    content_hash = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False, verbose_name="Хеш текста")
     
     class Meta:
         verbose_name = "Текст для теста"
         verbose_name_plural = "Тексты для тестов"
+        indexes = [
+            models.Index(fields=['difficulty', 'language'], name='sample_difficulty_lang_idx'),
+        ]
+    
+    def _duplicate(self, key):
+        return TextSample.objects.filter(content_hash=key).exclude(pk=self.pk).only('pk').first()
+    
+    def _legacy_duplicate(self):
+        # Повторы, оставшиеся с миграции 0007, хранятся с пустым хешем
+        return self.pk is not None and self.content_hash is None
+    
+    def clean(self):
+        from .corpus import content_hash
+        key = content_hash(self.text)
+        if key == self.content_hash:
+            return
+        duplicate = self._duplicate(key)
+        if duplicate is None:
+            return
+        if self._legacy_duplicate() and TextSample.objects.filter(pk=self.pk, text=self.text).exists():
+            return
+        raise ValidationError({'text': f"Такой текст уже есть (#{duplicate.pk})"})
+    
+    def save(self, *args, **kwargs):
+        from .corpus import content_hash
+        key = content_hash(self.text)
+        if key != self.content_hash:
+            if self._legacy_duplicate() and self._duplicate(key) is not None:
+                key = None
+            self.content_hash = key
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.get_difficulty_display()} - {self.get_language_display()}"
@@ -43,6 +77,208 @@ class TypingTestResult(models.Model):
         verbose_name = "Результат теста"
         verbose_name_plural = "Результаты тестов"
         ordering = ['-created_at']
+        indexes = [
+            # Постраничный вывод «Моих результатов» по ключу (created_at, id)
+            models.Index(fields=['user', '-created_at', '-id'], name='result_user_created_idx'),
+            # Таблицы лидеров: ORDER BY wpm DESC, id
+            models.Index(fields=['-wpm', 'id'], name='result_wpm_idx'),
+            # Meta.ordering и таблицы лидеров за месяц/день
+            models.Index(fields=['-created_at'], name='result_created_idx'),
+            # Поиск по IP в админке
+            models.Index(fields=['ip_address'], name='result_ip_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.wpm} WPM ({self.accuracy}%) - {self.user.username if self.user else 'Аноним'}"
\ No newline at end of file
+        return f"{self.wpm} WPM ({self.accuracy}%) - {self.user.username if self.user else 'Аноним'}"
+
+class UserStats(models.Model):
+    """Сводка результатов пользователя, обновляется при каждом сохранении результата"""
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True,
+        related_name='typing_stats', verbose_name="Пользователь",
+    )
+    tests_count = models.BigIntegerField(default=0, verbose_name="Количество тестов")
+    wpm_sum = models.FloatField(default=0, verbose_name="Сумма WPM")
+    best_wpm = models.FloatField(default=0, verbose_name="Лучший WPM")
+    accuracy_sum = models.FloatField(default=0, verbose_name="Сумма точности")
+    recent_wpm = models.JSONField(default=list, blank=True, verbose_name="WPM последних тестов")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Статистика пользователя"
+        verbose_name_plural = "Статистика пользователей"
+
+    def __str__(self):
+        return f"{self.user}: {self.tests_count} тестов"
+
+    @property
+    def avg_wpm(self):
+        return self.wpm_sum / self.tests_count if self.tests_count else 0
+
+    @property
+    def avg_accuracy(self):
+        return self.accuracy_sum / self.tests_count if self.tests_count else 0
+
+    @property
+    def trend(self):
+        """Разница между средним WPM последних тестов и средним за всё время"""
+        if not self.recent_wpm:
+            return 0
+        return sum(self.recent_wpm) / len(self.recent_wpm) - self.avg_wpm
+
+
+class StatsRollup(models.Model):
+    """Накопительная статистика результатов (глобальная и по языку/сложности)
+
+    Пустые language и difficulty обозначают глобальную строку.
+    Обновляется в save_result в той же транзакции, что и сам результат.
+    """
+    language = models.CharField(max_length=10, blank=True, default='', verbose_name="Язык")
+    difficulty = models.CharField(max_length=20, blank=True, default='', verbose_name="Сложность")
+
+    tests_count = models.BigIntegerField(default=0, verbose_name="Количество тестов")
+    users_count = models.BigIntegerField(default=0, verbose_name="Количество пользователей")
+    wpm_sum = models.FloatField(default=0, verbose_name="Сумма WPM")
+    wpm_sq_sum = models.FloatField(default=0, verbose_name="Сумма квадратов WPM")
+    wpm_max = models.FloatField(default=0, verbose_name="Лучший WPM")
+    accuracy_sum = models.FloatField(default=0, verbose_name="Сумма точности")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Сводная статистика"
+        verbose_name_plural = "Сводная статистика"
+        constraints = [
+            models.UniqueConstraint(fields=['language', 'difficulty'], name='stats_rollup_scope_unique'),
+        ]
+
+    def __str__(self):
+        scope = f"{self.language}/{self.difficulty}" if self.language or self.difficulty else "Все тесты"
+        return f"{scope}: {self.tests_count} тестов"
+
+    @property
+    def avg_wpm(self):
+        return self.wpm_sum / self.tests_count if self.tests_count else 0
+
+    @property
+    def avg_accuracy(self):
+        return self.accuracy_sum / self.tests_count if self.tests_count else 0
+
+    @property
+    def wpm_stddev(self):
+        if not self.tests_count:
+            return 0
+        variance = self.wpm_sq_sum / self.tests_count - self.avg_wpm ** 2
+        return max(variance, 0) ** 0.5
+
+
+class WpmBucket(models.Model):
+    """Корзина гистограммы WPM для быстрого расчёта места и процентиля
+
+    Строка на каждую непустую корзину области и на каждый непустой блок
+    соседних корзин (level=1, см. typetester.histogram). Пустые language и
+    difficulty — глобальная гистограмма.
+    """
+    language = models.CharField(max_length=10, blank=True, default='', verbose_name="Язык")
+    difficulty = models.CharField(max_length=20, blank=True, default='', verbose_name="Сложность")
+    level = models.PositiveSmallIntegerField(default=0, verbose_name="Уровень (0 — корзина, 1 — блок)")
+    bucket = models.PositiveIntegerField(verbose_name="Корзина")
+    count = models.BigIntegerField(default=0, verbose_name="Количество результатов")
+
+    class Meta:
+        verbose_name = "Корзина гистограммы WPM"
+        verbose_name_plural = "Корзины гистограммы WPM"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['language', 'difficulty', 'level', 'bucket'], name='wpm_bucket_scope_unique',
+            ),
+        ]
+
+    def __str__(self):
+        scope = f"{self.language}/{self.difficulty}" if self.language or self.difficulty else "Все тесты"
+        kind = "блок" if self.level else "корзина"
+        return f"{scope}, {kind} {self.bucket}: {self.count} результатов"
+
+
+class KeystrokeLog(models.Model):
+    """Журнал нажатий клавиш теста в компактном двоичном виде
+
+    Пары (код символа, задержка в мс), закодированные varint (см. typetester.keystrokes).
+    """
+    result = models.OneToOneField(
+        TypingTestResult, on_delete=models.CASCADE, primary_key=True,
+        related_name='keystroke_log', verbose_name="Результат теста",
+    )
+    data = models.BinaryField(verbose_name="Нажатия")
+    analyzed = models.BooleanField(default=False, db_index=True, verbose_name="Обработан")
+
+    class Meta:
+        verbose_name = "Журнал нажатий"
+        verbose_name_plural = "Журналы нажатий"
+
+    def __str__(self):
+        return f"Нажатия для результата {self.result_id}"
+
+
+class KeyStat(models.Model):
+    """Накопленная задержка и ошибки пользователя по клавише или паре клавиш"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='key_stats', verbose_name="Пользователь")
+    sequence = models.CharField(max_length=2, verbose_name="Клавиша или пара")
+    hits = models.BigIntegerField(default=0, verbose_name="Нажатий")
+    total_ms = models.BigIntegerField(default=0, verbose_name="Суммарная задержка (мс)")
+    errors = models.BigIntegerField(default=0, verbose_name="Ошибок")
+
+    class Meta:
+        verbose_name = "Статистика клавиши"
+        verbose_name_plural = "Статистика клавиш"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'sequence'], name='key_stat_user_sequence_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} «{self.sequence}»: {self.avg_ms:.0f} мс"
+
+    @property
+    def avg_ms(self):
+        return self.total_ms / self.hits if self.hits else 0
+
+    @property
+    def error_rate(self):
+        return self.errors / self.hits * 100 if self.hits else 0
+
+
+class DailyResultSummary(models.Model):
+    """Результаты за день, свёрнутые compact_results (см. typetester.retention)
+
+    Одна строка на (день, пользователь, язык, сложность); пустые language и
+    difficulty — результаты без текста, пустой user — анонимные.
+    """
+    day = models.DateField(verbose_name="День")
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, null=True, blank=True,
+        related_name='daily_summaries', verbose_name="Пользователь",
+    )
+    language = models.CharField(max_length=10, blank=True, default='', verbose_name="Язык")
+    difficulty = models.CharField(max_length=20, blank=True, default='', verbose_name="Сложность")
+
+    tests_count = models.BigIntegerField(default=0, verbose_name="Количество тестов")
+    wpm_sum = models.FloatField(default=0, verbose_name="Сумма WPM")
+    wpm_sq_sum = models.FloatField(default=0, verbose_name="Сумма квадратов WPM")
+    wpm_max = models.FloatField(default=0, verbose_name="Лучший WPM")
+    accuracy_sum = models.FloatField(default=0, verbose_name="Сумма точности")
+    words_sum = models.BigIntegerField(default=0, verbose_name="Сумма слов")
+    time_sum = models.FloatField(default=0, verbose_name="Суммарное время (сек)")
+    mistakes_sum = models.BigIntegerField(default=0, verbose_name="Сумма ошибок")
+    # {WPM: количество} — из него пересобираются гистограммы при любых корзинах
+    wpm_counts = models.JSONField(default=dict, verbose_name="Распределение WPM")
+
+    class Meta:
+        verbose_name = "Сводка результатов за день"
+        verbose_name_plural = "Сводки результатов за день"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'user', 'language', 'difficulty'], name='daily_summary_scope_unique',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.user or 'Аноним'} {self.language}/{self.difficulty}: {self.tests_count} тестов"
@@ -0,0 +1,186 @@
+"""Условные GET и кэш целых страниц: главная, таблица лидеров, тест.
+
+Данные этих страниц меняются только с новыми результатами, поэтому для
+каждой области (язык, сложность) — тех же, что у таблиц лидеров, — в кэше
+хранится версия: время последнего изменения в наносекундах. ingest.persist
+обновляет версии областей результата после коммита, сигналы и команды —
+при изменении данных в обход save_result.
+
+ETag страницы собирается из её версий и cookie сессии, так что
+If-None-Match и If-Modified-Since проверяются без запросов к базе.
+Анонимным посетителям (без cookie сессии) страница целиком отдаётся из
+общего кэша, пока версии не изменились; у вошедших из кэша берётся только
+шапка base.html ({% cache %}). Попадания, промахи и 304 считаются в
+метриках маршрута (typemaster_page_cache_total).
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from . import leaderboard, metrics, replica
+
+# Сколько хранить страницу для анонимных; 0 — только условные GET
+TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 10 * 60)
+
+VERSION_PREFIX = 'page_version'
+PAGE_PREFIX = 'page'
+
+# Cookie, в которой MessageMiddleware передаёт сообщения до показа
+MESSAGES_COOKIE = 'messages'
+
+
+def _version_key(scope):
+    language, difficulty = scope
+    return f"{VERSION_PREFIX}:{language or '*'}:{difficulty or '*'}"
+
+
+def _all_scopes():
+    return {
+        scope for language in leaderboard.LANGUAGES for difficulty in leaderboard.DIFFICULTIES
+        for scope in leaderboard.scopes(language, difficulty)
+    }
+
+
+def scopes_for(result):
+    """Области, страницы которых меняет результат"""
+    sample = result.text_sample
+    if sample is None:
+        return leaderboard.scopes()
+    return leaderboard.scopes(sample.language, sample.difficulty)
+
+
+def _bump(scopes):
+    now = time.time_ns()
+    cache.set_many({_version_key(scope): now for scope in scopes}, None)
+
+
+def touch(results):
+    """Новые версии областей сохранённых результатов"""
+    _bump({scope for result in results for scope in scopes_for(result)})
+
+
+def invalidate(result=None):
+    """Новые версии областей результата (или всех областей)"""
+    _bump(scopes_for(result) if result is not None else _all_scopes())
+
+
+class Page:
+    """Условный GET и кэш одной страницы.
+
+    lookup() возвращает готовый ответ (304 или страницу из кэша) либо None —
+    тогда страницу нужно отрисовать и передать в finish().
+    """
+
+    def __init__(self, request, route, scopes, *parts, since=None, conditional=True):
+        self.request = request
+        self.route = route
+        self.scopes = list(dict.fromkeys(scopes))
+        self.parts = parts
+        # Данные страницы могут устареть и без новых результатов (смена периода)
+        self.since = since.timestamp() if since is not None else 0
+        self.conditional = conditional
+        self.session = request.COOKIES.get(settings.SESSION_COOKIE_NAME, '')
+        # Сообщения показываются один раз — такие ответы не кэшируем
+        self.enabled = request.method in ('GET', 'HEAD') and MESSAGES_COOKIE not in request.COOKIES
+        # Закреплённый за основной базой клиент должен видеть свежие данные
+        self.shared = self.enabled and not self.session and not replica.pinned(request) and TIMEOUT > 0
+        self.versions = ()
+        self.etag = None
+        self.last_modified = None
+
+    def _keys(self):
+        keys = [_version_key(scope) for scope in self.scopes]
+        if self.shared:
+            keys.append(self._page_key())
+        return keys
+
+    def _page_key(self):
+        digest = hashlib.md5(repr(self.parts).encode()).hexdigest()
+        return f"{PAGE_PREFIX}:{self.route}:{digest}"
+
+    def lookup(self):
+        if not self.enabled:
+            return None
+        values = cache.get_many(self._keys())
+        missing = [_version_key(scope) for scope in self.scopes if _version_key(scope) not in values]
+        if missing:
+            # Версия вытеснена из кэша: новая сбросит и сохранённые страницы
+            for key in missing:
+                cache.add(key, time.time_ns(), None)
+            values.update(cache.get_many(missing))
+        return self._resolve(values)
+
+    async def alookup(self):
+        if not self.enabled:
+            return None
+        values = await cache.aget_many(self._keys())
+        missing = [_version_key(scope) for scope in self.scopes if _version_key(scope) not in values]
+        if missing:
+            for key in missing:
+                await cache.aadd(key, time.time_ns(), None)
+            values.update(await cache.aget_many(missing))
+        return self._resolve(values)
+
+    def _resolve(self, values):
+        self.versions = tuple(values.get(_version_key(scope), 0) for scope in self.scopes)
+        if self.conditional:
+            raw = repr((self.route, self.parts, self.versions, self.session))
+            self.etag = f'"{hashlib.md5(raw.encode()).hexdigest()}"'
+            self.last_modified = int(max((version / 1e9 for version in self.versions), default=0))
+            self.last_modified = max(self.last_modified, int(self.since))
+            response = get_conditional_response(self.request, etag=self.etag, last_modified=self.last_modified)
+            if response is not None:
+                metrics.collector.record_cache(self.route, 'not_modified')
+                return self._headers(response)
+        if self.shared:
+            stored = values.get(self._page_key())
+            if stored is not None and stored[0] == self.versions:
+                metrics.collector.record_cache(self.route, 'hit')
+                return self._headers(HttpResponse(stored[1]))
+        metrics.collector.record_cache(self.route, 'miss')
+        return None
+
+    def _store(self, response):
+        if response.status_code != 200:
+            return None
+        if replica.REPLICA and not replica.pinned(self.request):
+            if time.time_ns() - max(self.versions, default=0) < replica.STICKY_SECONDS * 1e9:
+                # Данные только что изменились, а страница могла быть собрана
+                # по ещё отстающей реплике — не запоминаем её ни здесь, ни в браузере
+                self.etag = None
+                return None
+        return (self._page_key(), (self.versions, response.content)) if self.shared else None
+
+    def finish(self, response):
+        """Сохраняет отрисованную страницу для анонимных и дописывает заголовки"""
+        if not self.enabled:
+            return response
+        entry = self._store(response)
+        if entry is not None:
+            cache.set(*entry, TIMEOUT)
+        return self._headers(response)
+
+    async def afinish(self, response):
+        if not self.enabled:
+            return response
+        entry = self._store(response)
+        if entry is not None:
+            await cache.aset(*entry, TIMEOUT)
+        return self._headers(response)
+
+    def _headers(self, response):
+        if self.etag is not None and response.status_code in (200, 304):
+            response.headers.setdefault('ETag', self.etag)
+            response.headers.setdefault('Last-Modified', http_date(self.last_modified))
+        patch_vary_headers(response, ('Cookie',))
+        # Браузер и прокси каждый раз переспрашивают — ответом обычно будет 304
+        if self.session:
+            patch_cache_control(response, no_cache=True, private=True)
+        else:
+            patch_cache_control(response, no_cache=True)
+        return response
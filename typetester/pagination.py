@@ -0,0 +1,52 @@
+"""Постраничный вывод по ключу (created_at, id) вместо OFFSET.
+
+Курсор — это base64 от created_at и id последней показанной строки;
+следующая страница начинается строго после него, поэтому стоимость запроса
+не зависит от номера страницы.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(obj):
+    raw = f"{obj.created_at.isoformat()}|{obj.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(f"Некорректный курсор: {cursor!r}")
+
+
+def after_cursor(queryset, cursor=None):
+    """Строки строго после курсора по убыванию (created_at, id)"""
+    queryset = queryset.order_by('-created_at', '-pk')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    return queryset
+
+
+def keyset_page(queryset, cursor=None, size=50):
+    """Страница строк по убыванию (created_at, id): (строки, курсор следующей или None)"""
+    return _page(list(after_cursor(queryset, cursor)[:size + 1]), size)
+
+
+async def akeyset_page(queryset, cursor=None, size=50):
+    return _page([row async for row in after_cursor(queryset, cursor)[:size + 1]], size)
+
+
+def _page(rows, size):
+    if len(rows) > size:
+        return rows[:size], encode_cursor(rows[size - 1])
+    return rows, None
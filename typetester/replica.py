@@ -0,0 +1,114 @@
+"""Чтение статистики с реплики базы, запись — в основную.
+
+Реплика (alias replica) подключается переменной SQLITE_REPLICA_PATH; без
+неё роутер всё отправляет в default. ReplicaMiddleware разрешает чтение с
+реплики на время GET/HEAD-запроса, и роутер отправляет туда чтения моделей
+typetester: сводную статистику, гистограммы, личные результаты. Сессии и
+пользователи всегда читаются из основной базы — иначе только что вошедший
+пользователь мог бы не найти свою сессию на отстающей реплике. Чтения внутри
+транзакции на основной базе тоже остаются на ней.
+
+После запроса, который мог что-то записать (POST и т.п.), клиент получает
+cookie на STICKY_SECONDS секунд, и все его запросы в это время читают
+основную базу: сохранив результат, он сразу видит его в таблицах и
+статистике, даже если реплика ещё отстаёт.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRIMARY = DEFAULT_DB_ALIAS
+REPLICA = 'replica' if 'replica' in settings.DATABASES else None
+
+STICKY_SECONDS = getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+PIN_COOKIE = 'db_primary'
+
+APP_LABEL = 'typetester'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_use_replica = ContextVar('typetester_use_replica', default=False)
+
+
+@contextmanager
+def _reading(value):
+    token = _use_replica.set(value)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def replica():
+    """Чтения внутри блока идут на реплику (если она настроена)"""
+    return _reading(True)
+
+
+def primary():
+    """Чтения внутри блока идут в основную базу"""
+    return _reading(False)
+
+
+def pinned(request):
+    """Читает ли клиент из основной базы после недавней записи"""
+    return PIN_COOKIE in request.COOKIES
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (
+            REPLICA
+            and _use_replica.get()
+            and model._meta.app_label == APP_LABEL
+            and not connections[PRIMARY].in_atomic_block
+        ):
+            return REPLICA
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика — копия основной базы, связи между ними допустимы
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схема попадает на реплику вместе с данными
+        return db == PRIMARY
+
+
+class ReplicaMiddleware:
+    """Включает чтение с реплики для безопасных запросов и закрепляет писавших за основной базой"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(self.get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with _reading(self._use_replica(request)):
+            response = self.get_response(request)
+        return self._pin(request, response)
+
+    async def __acall__(self, request):
+        with _reading(self._use_replica(request)):
+            response = await self.get_response(request)
+        return self._pin(request, response)
+
+    @staticmethod
+    def _use_replica(request):
+        return bool(REPLICA) and request.method in SAFE_METHODS and not pinned(request)
+
+    @staticmethod
+    def _pin(request, response):
+        if REPLICA and request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(PIN_COOKIE, '1', max_age=STICKY_SECONDS, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,183 @@
+"""Сворачивание старых результатов в дневные сводки.
+
+Результаты старше RESULT_RETENTION_DAYS складываются в DailyResultSummary
+по (день, пользователь, язык, сложность), а сами строки удаляются — вместе
+с ними уходят user_agent, IP и журналы нажатий. Работа идёт пачками по id:
+каждая пачка — короткая транзакция (одно чтение сводок, bulk_update,
+bulk_create и два DELETE), так что запись новых результатов не ждёт
+окончания всей чистки.
+
+Остаются:
+  * лучший результат каждого пользователя в каждой области (язык,
+    сложность) — на нём держатся личные рекорды и подсчёт пользователей
+    в сводной статистике;
+  * последние userstats.RECENT_COUNT результатов каждого пользователя —
+    по ним пересобираются последние тесты в UserStats;
+  * строки текущих таблиц лидеров по всем фильтрам и периодам, в том
+    числе анонимные: при коротком сроке хранения под чистку попадают и
+    результаты текущего месяца;
+  * результаты с ещё не разобранным журналом нажатий.
+
+Накопленные StatsRollup, WpmBucket и UserStats при этом не меняются:
+результаты переезжают из строк в сводки с теми же суммами. Пересборка
+(rebuild_stats) складывает сводки с оставшимися строками.
+"""
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from . import leaderboard, userstats
+from .models import DailyResultSummary, KeystrokeLog, TypingTestResult
+
+RETENTION_DAYS = getattr(settings, 'RESULT_RETENTION_DAYS', 365)
+BATCH_SIZE = 500
+
+SUMMARY_SUMS = ('tests_count', 'wpm_sum', 'wpm_sq_sum', 'accuracy_sum', 'words_sum', 'time_sum', 'mistakes_sum')
+
+ROW_FIELDS = (
+    'id', 'user_id', 'text_sample__language', 'text_sample__difficulty', 'created_at',
+    'wpm', 'accuracy', 'words_count', 'time_seconds', 'mistakes_count',
+)
+
+
+def cutoff(days=None, now=None):
+    """Граница: результаты раньше неё сворачиваются"""
+    return (now or timezone.now()) - timezone.timedelta(days=RETENTION_DAYS if days is None else days)
+
+
+def personal_bests():
+    """id лучших результатов каждого пользователя по областям"""
+    ranked = (
+        TypingTestResult.objects
+        .filter(user__isnull=False)
+        .annotate(place=Window(
+            RowNumber(),
+            partition_by=[F('user_id'), F('text_sample__language'), F('text_sample__difficulty')],
+            order_by=[F('wpm').desc(), F('id').asc()],
+        ))
+        .filter(place=1)
+        .values_list('id', flat=True)
+    )
+    return set(ranked)
+
+
+def board_entries():
+    """id результатов из текущих таблиц лидеров по всем фильтрам и периодам"""
+    ids = set()
+    for language in ('', *leaderboard.LANGUAGES):
+        for difficulty in ('', *leaderboard.DIFFICULTIES):
+            for period in leaderboard.PERIODS:
+                ids.update(entry['id'] for entry in leaderboard.get_board(language, difficulty, period))
+    return ids
+
+
+def candidates(before):
+    """Результаты, которые можно свернуть (без учёта личных рекордов)"""
+    return TypingTestResult.objects.filter(
+        Q(keystroke_log__isnull=True) | Q(keystroke_log__analyzed=True),
+        created_at__lt=before,
+    )
+
+
+def _key(row):
+    _, user_id, language, difficulty, created_at = row[:5]
+    return timezone.localdate(created_at), user_id, language or '', difficulty or ''
+
+
+def _deltas(rows):
+    deltas = {}
+    for row in rows:
+        wpm, accuracy, words, seconds, mistakes = row[5:]
+        delta = deltas.get(_key(row))
+        if delta is None:
+            delta = deltas[_key(row)] = dict.fromkeys(SUMMARY_SUMS, 0)
+            delta['wpm_max'] = 0.0
+            delta['wpm_counts'] = defaultdict(int)
+        delta['tests_count'] += 1
+        delta['wpm_sum'] += wpm
+        delta['wpm_sq_sum'] += wpm * wpm
+        delta['wpm_max'] = max(delta['wpm_max'], wpm)
+        delta['accuracy_sum'] += accuracy
+        delta['words_sum'] += words
+        delta['time_sum'] += seconds
+        delta['mistakes_sum'] += mistakes
+        delta['wpm_counts'][repr(wpm)] += 1
+    return deltas
+
+
+def add_to_summary(summary, sums, wpm_max, wpm_counts):
+    """Прибавляет к сводке суммы {поле: значение}, лучший WPM и распределение WPM"""
+    for field in SUMMARY_SUMS:
+        setattr(summary, field, getattr(summary, field) + sums[field])
+    summary.wpm_max = max(summary.wpm_max, wpm_max)
+    counts = dict(summary.wpm_counts)
+    for wpm, count in wpm_counts.items():
+        counts[wpm] = counts.get(wpm, 0) + count
+    summary.wpm_counts = counts
+
+
+def _fold(rows):
+    """Прибавляет пачку строк к сводкам и удаляет строки"""
+    deltas = _deltas(rows)
+    days = {day for day, _, _, _ in deltas}
+    user_ids = {user_id for _, user_id, _, _ in deltas}
+    users = Q(user_id__in=user_ids - {None})
+    if None in user_ids:
+        users |= Q(user__isnull=True)
+    existing = {
+        (summary.day, summary.user_id, summary.language, summary.difficulty): summary
+        for summary in DailyResultSummary.objects.select_for_update().filter(users, day__in=days)
+    }
+    changed, created = [], []
+    for key, delta in deltas.items():
+        summary = existing.get(key)
+        if summary is None:
+            day, user_id, language, difficulty = key
+            summary = DailyResultSummary(day=day, user_id=user_id, language=language, difficulty=difficulty)
+            created.append(summary)
+        else:
+            changed.append(summary)
+        add_to_summary(summary, delta, delta['wpm_max'], delta['wpm_counts'])
+    if changed:
+        DailyResultSummary.objects.bulk_update(changed, [*SUMMARY_SUMS, 'wpm_max', 'wpm_counts'])
+    DailyResultSummary.objects.bulk_create(created)
+
+    purge([row[0] for row in rows])
+
+
+def purge(ids):
+    """Удаляет результаты с журналами нажатий двумя DELETE.
+
+    Напрямую, без сборщика каскадов и post_delete на каждую строку —
+    кэши вызывающий код сбрасывает один раз после всей чистки.
+    """
+    KeystrokeLog.objects.filter(result_id__in=ids).delete()
+    TypingTestResult.objects.filter(pk__in=ids)._raw_delete(TypingTestResult.objects.db)
+
+
+def compact(before, batch_size=BATCH_SIZE, pause=0, dry_run=False, progress=None):
+    """Сворачивает результаты раньше before; возвращает число свёрнутых строк"""
+    keep = personal_bests() | set(userstats.recent_results().values_list('id', flat=True)) | board_entries()
+    queryset = candidates(before).order_by('pk').values_list(*ROW_FIELDS)
+    last_id = 0
+    folded = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_id)[:batch_size])
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        rows = [row for row in rows if row[0] not in keep]
+        if rows and not dry_run:
+            with transaction.atomic():
+                _fold(rows)
+        folded += len(rows)
+        if progress:
+            progress(folded)
+        if pause:
+            time.sleep(pause)
+    return folded
@@ -0,0 +1,236 @@
+"""Инкрементальная сводная статистика по результатам тестов.
+
+Вместо COUNT/AVG/MAX по всей таблице TypingTestResult представления читают
+одну строку StatsRollup. save_result обновляет глобальную строку и строку
+(язык, сложность) в той же транзакции, что и вставку результата.
+
+users_count — число разных зарегистрированных пользователей; анонимные
+результаты, в отличие от прежнего values('user').distinct(), за
+пользователя не считаются.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Max, Sum, Value, When
+from django.utils import timezone
+
+from .models import DailyResultSummary, StatsRollup, TypingTestResult
+
+GLOBAL_SCOPE = ('', '')
+
+ROLLUP_FIELDS = ('tests_count', 'users_count', 'wpm_sum', 'wpm_sq_sum', 'wpm_max', 'accuracy_sum')
+
+# Допуск при сравнении сумм с плавающей точкой в check()
+FLOAT_TOLERANCE = 1e-6
+
+
+def scopes_for(result):
+    """Области статистики, в которые попадает результат"""
+    scopes = [GLOBAL_SCOPE]
+    sample = result.text_sample
+    if sample is not None:
+        scopes.append((sample.language, sample.difficulty))
+    return scopes
+
+
+def get_rollup(language='', difficulty=''):
+    """Строка статистики (несохранённая пустая, если тестов ещё не было)"""
+    rollup = StatsRollup.objects.filter(language=language, difficulty=difficulty).first()
+    return rollup or StatsRollup(language=language, difficulty=difficulty)
+
+
+async def aget_rollup(language='', difficulty=''):
+    rollup = await StatsRollup.objects.filter(language=language, difficulty=difficulty).afirst()
+    return rollup or StatsRollup(language=language, difficulty=difficulty)
+
+
+def _known_users(user_ids, scope, exclude_ids):
+    """Пользователи, у которых в области есть результаты, кроме только что вставленных"""
+    qs = TypingTestResult.objects.filter(user_id__in=user_ids).exclude(pk__in=exclude_ids)
+    if scope != GLOBAL_SCOPE:
+        qs = qs.filter(text_sample__language=scope[0], text_sample__difficulty=scope[1])
+    return set(qs.order_by().values_list('user_id', flat=True).distinct())
+
+
+def _deltas(results):
+    deltas = defaultdict(lambda: {
+        'tests': 0, 'wpm_sum': 0.0, 'wpm_sq_sum': 0.0, 'wpm_max': 0.0,
+        'accuracy_sum': 0.0, 'users': set(),
+    })
+    for result in results:
+        for scope in scopes_for(result):
+            delta = deltas[scope]
+            delta['tests'] += 1
+            delta['wpm_sum'] += result.wpm
+            delta['wpm_sq_sum'] += result.wpm * result.wpm
+            delta['wpm_max'] = max(delta['wpm_max'], result.wpm)
+            delta['accuracy_sum'] += result.accuracy
+            if result.user_id is not None:
+                delta['users'].add(result.user_id)
+    return deltas
+
+
+def apply(results):
+    """Учитывает уже сохранённые результаты в сводной статистике.
+
+    Вызывается внутри той же транзакции, что и вставка результатов.
+    Новые пользователи области ищутся уже после UPDATE её строки: он держит
+    блокировку до конца транзакции, поэтому параллельная транзакция с первым
+    результатом того же пользователя увидит наш результат и не посчитает
+    его второй раз. Области обходятся в одном порядке, чтобы не было
+    взаимной блокировки.
+    """
+    deltas = _deltas(results)
+    batch_ids = [result.pk for result in results]
+    for scope in sorted(deltas):
+        delta = deltas[scope]
+        language, difficulty = scope
+        changes = {
+            'tests_count': F('tests_count') + delta['tests'],
+            'wpm_sum': F('wpm_sum') + delta['wpm_sum'],
+            'wpm_sq_sum': F('wpm_sq_sum') + delta['wpm_sq_sum'],
+            'accuracy_sum': F('accuracy_sum') + delta['accuracy_sum'],
+            'wpm_max': Case(
+                When(wpm_max__lt=delta['wpm_max'], then=Value(delta['wpm_max'])),
+                default=F('wpm_max'),
+                output_field=FloatField(),
+            ),
+            'updated_at': timezone.now(),
+        }
+        rows = StatsRollup.objects.filter(language=language, difficulty=difficulty)
+        if not rows.update(**changes):
+            StatsRollup.objects.get_or_create(language=language, difficulty=difficulty)
+            rows.update(**changes)
+        if delta['users']:
+            new_users = len(delta['users'] - _known_users(delta['users'], scope, batch_ids))
+            if new_users:
+                rows.update(users_count=F('users_count') + new_users)
+
+
+def _scope_max(scope):
+    """Лучший WPM области по оставшимся строкам и дневным сводкам"""
+    rows = TypingTestResult.objects.all()
+    summaries = DailyResultSummary.objects.all()
+    if scope != GLOBAL_SCOPE:
+        rows = rows.filter(text_sample__language=scope[0], text_sample__difficulty=scope[1])
+        summaries = summaries.filter(language=scope[0], difficulty=scope[1])
+    values = [rows.aggregate(value=Max('wpm'))['value'], summaries.aggregate(value=Max('wpm_max'))['value']]
+    return max((value for value in values if value is not None), default=0.0)
+
+
+def retract(results):
+    """Вычитает удалённые результаты из сводной статистики.
+
+    Вызывается в транзакции удаления, когда строк уже нет. Пользователь
+    перестаёт считаться в области, если в ней не осталось его строк, а
+    лучший WPM пересчитывается, только если удалён результат не хуже него.
+    """
+    deltas = _deltas(results)
+    for scope in sorted(deltas):
+        delta = deltas[scope]
+        language, difficulty = scope
+        rows = StatsRollup.objects.filter(language=language, difficulty=difficulty)
+        updated = rows.update(
+            tests_count=F('tests_count') - delta['tests'],
+            wpm_sum=F('wpm_sum') - delta['wpm_sum'],
+            wpm_sq_sum=F('wpm_sq_sum') - delta['wpm_sq_sum'],
+            accuracy_sum=F('accuracy_sum') - delta['accuracy_sum'],
+            updated_at=timezone.now(),
+        )
+        if not updated:
+            continue
+        if delta['users']:
+            gone = len(delta['users'] - _known_users(delta['users'], scope, ()))
+            if gone:
+                rows.update(users_count=F('users_count') - gone)
+        if rows.filter(wpm_max__lte=delta['wpm_max']).exists():
+            rows.update(wpm_max=_scope_max(scope))
+
+
+def compute():
+    """Считает статистику заново по исходным строкам и дневным сводкам.
+
+    Возвращает словарь {(язык, сложность): {поле: значение}}.
+    """
+    fields = dict(
+        tests_count=Count('id'),
+        users_count=Count('user', distinct=True),
+        wpm_sum=Sum('wpm'),
+        wpm_sq_sum=Sum(F('wpm') * F('wpm')),
+        wpm_max=Max('wpm'),
+        accuracy_sum=Sum('accuracy'),
+    )
+    totals = {GLOBAL_SCOPE: TypingTestResult.objects.aggregate(**fields)}
+    per_scope = (
+        TypingTestResult.objects
+        .filter(text_sample__isnull=False)
+        .order_by()
+        .values('text_sample__language', 'text_sample__difficulty')
+        .annotate(**fields)
+    )
+    for row in per_scope:
+        scope = (row.pop('text_sample__language'), row.pop('text_sample__difficulty'))
+        totals[scope] = row
+
+    for values in totals.values():
+        for name, value in values.items():
+            if value is None:
+                values[name] = 0
+
+    # Свёрнутые результаты. users_count берётся только из строк: лучший
+    # результат каждого пользователя в области compact_results оставляет
+    summaries = (
+        DailyResultSummary.objects
+        .order_by()
+        .values('language', 'difficulty')
+        .annotate(
+            tests_count=Sum('tests_count'),
+            wpm_sum=Sum('wpm_sum'),
+            wpm_sq_sum=Sum('wpm_sq_sum'),
+            wpm_max=Max('wpm_max'),
+            accuracy_sum=Sum('accuracy_sum'),
+        )
+    )
+    for row in summaries:
+        scope = (row.pop('language'), row.pop('difficulty'))
+        for target in {GLOBAL_SCOPE, scope}:
+            values = totals.setdefault(target, dict.fromkeys(ROLLUP_FIELDS, 0))
+            for name, value in row.items():
+                values[name] = max(values[name], value) if name == 'wpm_max' else values[name] + value
+    return totals
+
+
+def check():
+    """Сравнивает сохранённую статистику с исходными строками.
+
+    Возвращает список расхождений (scope, поле, в сводке, по факту).
+    """
+    expected = compute()
+    stored = {(row.language, row.difficulty): row for row in StatsRollup.objects.all()}
+    mismatches = []
+    for scope in sorted(set(expected) | set(stored)):
+        values = expected.get(scope)
+        row = stored.get(scope)
+        if values is None:
+            values = dict.fromkeys(ROLLUP_FIELDS, 0)
+        for name, actual in values.items():
+            current = getattr(row, name) if row is not None else 0
+            if abs(current - actual) > FLOAT_TOLERANCE * max(1, abs(actual)):
+                mismatches.append((scope, name, current, actual))
+    return mismatches
+
+
+@transaction.atomic
+def rebuild():
+    """Пересобирает сводную статистику по исходным строкам"""
+    totals = compute()
+    stale = [
+        row.pk for row in StatsRollup.objects.all()
+        if (row.language, row.difficulty) not in totals
+    ]
+    StatsRollup.objects.filter(pk__in=stale).delete()
+    for (language, difficulty), values in totals.items():
+        StatsRollup.objects.update_or_create(
+            language=language, difficulty=difficulty, defaults=values,
+        )
+    return totals
@@ -0,0 +1,233 @@
+"""Индекс текстов для выбора случайного образца без загрузки всей выборки.
+
+Каждый процесс один раз загружает id текстов, сгруппированные по
+(сложность, язык), и выбирает случайный за O(1). Сами тексты подтягиваются
+по первичному ключу (или тоже держатся в памяти, если включён
+TEXT_INDEX_STORE_TEXTS). При изменении текстов сигналы увеличивают версию
+в кэше, и остальные воркеры лениво перечитывают индекс при следующем запросе.
+"""
+import random
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import TextSample
+
+VERSION_KEY = 'text_samples:version'
+SPANS_PREFIX = 'text_spans'
+SPANS_TIMEOUT = 24 * 60 * 60
+
+STORE_TEXTS = getattr(settings, 'TEXT_INDEX_STORE_TEXTS', False)
+
+FALLBACK_TEXT = "Начните печатать этот текст."
+
+# Тексты на случай, если в базе нет подходящих образцов
+DEFAULT_TEXTS = {
+    ('easy', 'ru'): "Кот сидит на окне. Солнце светит ярко. Девочка читает книгу. Мальчик играет с "
+    "машинкой. В саду растут цветы и яблоки. Птицы поют весело. Мама готовит обед. Папа чинит велосипед. "
+    "Все счастливы.",
+    ('medium', 'ru'): "Эффективное управление временем - ключ к продуктивности. Вместо того чтобы "
+    "пытаться сделать всё сразу, разумнее расставлять приоритеты и делить большие задачи на маленькие "
+    "шаги. Метод «Помодоро», например, предлагает работать 25 минут без отвлечений, а затем делать короткий "
+    "перерыв. Такой подход помогает сохранять концентрацию и избегать выгорания. Важно также уметь говорить "
+    "'нет' лишним просьбам и защищать своё расписание. Помните: отдых - не роскошь, а необходимая часть рабочего "
+    "процесса.",
+    ('hard', 'ru'): "Современные квантовые компьютеры используют принцип суперпозиции и квантовой запутанности "
+    "для выполнения вычислений, недоступных классическим системам. Алгоритм Шора, например, способен факторизовать "
+    "большие числа экспоненциально быстрее, чем любой известный классический алгоритм, что ставит под угрозу безопасность "
+    "криптографических протоколов, основанных на RSA. В то же время, декогеренция остаётся главным препятствием на пути к "
+    "созданию масштабируемых квантовых процессоров. Исследователи из лабораторий Google, IBM и IonQ активно работают над "
+    "коррекцией квантовых ошибок, применяя топологические коды и сверхпроводящие кубиты, охлаждённые до температур, близких "
+    "к абсолютному нулю. Несмотря на прогресс, практическое применение fault-tolerant quantum computing всё ещё находится на "
+    "горизонте следующего десятилетия.",
+    ('easy', 'en'): "The sun is bright. A dog runs in the park. Birds fly high. Anna drinks tea."
+    "Tom plays with a ball. Flowers bloom in spring. It is a happy day.",
+    ('medium', 'en'): "Learning to type quickly takes practice and patience. It’s important to keep"
+    "your fingers on the home row and avoid looking at the keyboard. Many people improve their speed"
+    "by using online typing tutors or playing typing games. Consistency matters more than speed at"
+    "first-accuracy builds confidence and reduces errors over time.",
+    ('hard', 'en'): "Quantum entanglement describes a phenomenon where particles become intrinsically"
+    "linked, such that the state of one instantly influences the other—regardless of distance. This non-local"
+    "correlation, famously called “spooky action at a distance” by Einstein, defies classical intuition but has"
+    "been repeatedly confirmed through Bell test experiments. Harnessing entanglement is essential for quantum"
+    "cryptography, teleportation protocols, and error-resistant quantum computing architectures.",
+}
+
+
+class SampleIndex:
+    """Индекс id текстов по (сложность, язык) в памяти процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._ids = {}
+        self._scopes = {}
+        self._texts = {}
+
+    def _load(self, version):
+        ids = defaultdict(list)
+        scopes = {}
+        texts = {}
+        fields = ('id', 'difficulty', 'language') + (('text',) if STORE_TEXTS else ())
+        for row in TextSample.objects.order_by().values_list(*fields).iterator():
+            ids[(row[1], row[2])].append(row[0])
+            scopes[row[0]] = (row[1], row[2])
+            if STORE_TEXTS:
+                texts[row[0]] = row[3]
+        self._ids, self._scopes, self._texts, self._version = dict(ids), scopes, texts, version
+
+    def _reload(self, version):
+        with self._lock:
+            if version != self._version:
+                self._load(version)
+
+    def _ensure_loaded(self):
+        version = current_version()
+        if version != self._version:
+            self._reload(version)
+
+    async def _aensure_loaded(self):
+        version = await acurrent_version()
+        if version != self._version:
+            # Загрузка индекса — редкий длинный проход по таблице, его ведём в потоке
+            await sync_to_async(self._reload)(version)
+
+    @property
+    def version(self):
+        """Версия загруженного индекса (меняется при любом изменении текстов)"""
+        return self._version
+
+    def _choose(self, difficulty, language):
+        ids = self._ids.get((difficulty, language))
+        return random.choice(ids) if ids else None
+
+    def choose(self, difficulty, language):
+        """id случайного текста без запроса к базе (или None)"""
+        self._ensure_loaded()
+        return self._choose(difficulty, language)
+
+    async def achoose(self, difficulty, language):
+        await self._aensure_loaded()
+        return self._choose(difficulty, language)
+
+    def text(self, sample_id, difficulty, language):
+        """(текст, id) выбранного образца или текст по умолчанию с id=None"""
+        if sample_id is not None:
+            text = self._texts.get(sample_id)
+            if text is None:
+                text = TextSample.objects.filter(pk=sample_id).values_list('text', flat=True).first()
+            if text is not None:
+                return text, sample_id
+            # Текст удалили в другом процессе, а версия ещё не дошла
+            invalidate()
+        return DEFAULT_TEXTS.get((difficulty, language), FALLBACK_TEXT), None
+
+    async def atext(self, sample_id, difficulty, language):
+        if sample_id is not None:
+            text = self._texts.get(sample_id)
+            if text is None:
+                text = await TextSample.objects.filter(pk=sample_id).values_list('text', flat=True).afirst()
+            if text is not None:
+                return text, sample_id
+            await ainvalidate()
+        return DEFAULT_TEXTS.get((difficulty, language), FALLBACK_TEXT), None
+
+    def pick(self, difficulty, language):
+        """Случайный текст: (текст, id) или текст по умолчанию с id=None"""
+        return self.text(self.choose(difficulty, language), difficulty, language)
+
+    async def apick(self, difficulty, language):
+        return await self.atext(await self.achoose(difficulty, language), difficulty, language)
+
+    def lookup(self, sample_id):
+        """TextSample с id, сложностью и языком без запроса к базе (или None)"""
+        self._ensure_loaded()
+        return self._stub(sample_id)
+
+    async def alookup(self, sample_id):
+        await self._aensure_loaded()
+        return self._stub(sample_id)
+
+    def _stub(self, sample_id):
+        try:
+            difficulty, language = self._scopes[int(sample_id)]
+        except (KeyError, TypeError, ValueError):
+            return None
+        return TextSample(pk=int(sample_id), difficulty=difficulty, language=language)
+
+
+def render_spans(text):
+    """Текст по символам в <span>: клиент меняет класс отдельных символов, не перерисовывая весь текст"""
+    if not text:
+        return mark_safe('')
+    rest = ''.join(f'<span class="text-to-type">{escape(ch)}</span>' for ch in text[1:])
+    return mark_safe(f'<span class="current-char">{escape(text[0])}</span>{rest}')
+
+
+def _spans_key(sample_id):
+    # Версия индекса меняется при любом изменении текстов
+    return f"{SPANS_PREFIX}:{sample_id}:{index.version}"
+
+
+def spans(text, sample_id=None):
+    """render_spans, для текстов из базы — из кэша по id"""
+    if sample_id is None:
+        return render_spans(text)
+    key = _spans_key(sample_id)
+    html = cache.get(key)
+    if html is None:
+        html = render_spans(text)
+        cache.set(key, str(html), SPANS_TIMEOUT)
+    return mark_safe(html)
+
+
+async def aspans(text, sample_id=None):
+    if sample_id is None:
+        return render_spans(text)
+    key = _spans_key(sample_id)
+    html = await cache.aget(key)
+    if html is None:
+        html = render_spans(text)
+        await cache.aset(key, str(html), SPANS_TIMEOUT)
+    return mark_safe(html)
+
+
+def current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Ключ вытеснен из кэша: новая версия заставит все процессы перечитать индекс
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+async def acurrent_version():
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, time.time_ns(), None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+def invalidate():
+    """Помечает индекс устаревшим во всех процессах"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+async def ainvalidate():
+    try:
+        await cache.aincr(VERSION_KEY)
+    except ValueError:
+        await cache.aset(VERSION_KEY, time.time_ns(), None)
+
+
+index = SampleIndex()
@@ -0,0 +1,133 @@
+"""Оценка набранного текста по выравниванию с оригиналом.
+
+Тексты сравниваются как выравнивание, а не по позициям: один пропущенный
+или лишний символ — это одна ошибка, а не сдвиг всего остатка текста.
+
+Совпадающие участки проходятся сравнением срезов с удвоением шага, так что
+основная работа идёт в C. На расхождении ищется ближайшая точка
+синхронизации в полосе SCORING_BAND символов: смещение (di, dj) с
+наименьшей стоимостью max(di, dj), после которого снова совпадают
+SYNC_LENGTH символов. min(di, dj) из них — замены, остальное — вставки или
+удаления. Время растёт с числом ошибок, а не с длиной текста; после
+SCORING_MAX_ERRORS ошибок остаток текста сравнивается по позициям.
+"""
+from operator import ne
+from typing import NamedTuple
+
+from django.conf import settings
+
+MAX_ERRORS = getattr(settings, 'SCORING_MAX_ERRORS', 300)
+BAND = getattr(settings, 'SCORING_BAND', 16)
+
+# Сколько символов должно совпасть после ошибки, чтобы считать тексты снова выровненными
+SYNC_LENGTH = 4
+
+# Символов в «слове» для WPM
+CHARS_PER_WORD = 5
+
+
+class Score(NamedTuple):
+    insertions: int
+    deletions: int
+    substitutions: int
+    correct: int
+    wpm: float
+    accuracy: float
+    capped: bool
+
+    @property
+    def errors(self):
+        return self.insertions + self.deletions + self.substitutions
+
+
+def _common_run(a, x, b, y):
+    """Длина совпадающего участка a[x:] и b[y:]"""
+    limit = min(len(a) - x, len(b) - y)
+    run = 0
+    step = 64
+    while run < limit:
+        step = min(step, limit - run)
+        if a[x + run:x + run + step] == b[y + run:y + run + step]:
+            run += step
+            step *= 2
+        elif step == 1:
+            break
+        else:
+            step //= 2
+    return run
+
+
+def _synced(a, x, b, y):
+    if len(a) - x < SYNC_LENGTH or len(b) - y < SYNC_LENGTH:
+        return a[x:] == b[y:]
+    return a[x:x + SYNC_LENGTH] == b[y:y + SYNC_LENGTH]
+
+
+def _offsets(cost):
+    """Смещения стоимости cost: сначала с наибольшим числом замен"""
+    yield cost, cost
+    for other in range(cost - 1, -1, -1):
+        yield cost, other
+        yield other, cost
+
+
+def _resync(a, i, b, j, band):
+    """Ближайшее смещение (di, dj), после которого тексты снова совпадают"""
+    n, m = len(a), len(b)
+    for cost in range(1, band + 1):
+        for di, dj in _offsets(cost):
+            x, y = i + di, j + dj
+            if x <= n and y <= m and _synced(a, x, b, y):
+                return di, dj
+    return None
+
+
+def align(original, typed, max_errors=None, band=None):
+    """Вставки, удаления и замены при выравнивании typed по original.
+
+    Возвращает (insertions, deletions, substitutions, capped); capped — если
+    ошибок больше max_errors и остаток сравнён по позициям.
+    """
+    max_errors = MAX_ERRORS if max_errors is None else max_errors
+    band = BAND if band is None else band
+    a, b = original, typed
+    n, m = len(a), len(b)
+    i = j = 0
+    insertions = deletions = substitutions = 0
+    while True:
+        run = _common_run(a, i, b, j)
+        i += run
+        j += run
+        if i == n or j == m:
+            return insertions + m - j, deletions + n - i, substitutions, False
+        if insertions + deletions + substitutions >= max_errors:
+            break
+        offset = _resync(a, i, b, j, band)
+        if offset is None:
+            # В пределах полосы тексты не сходятся — считаем участок по позициям
+            substitutions += sum(map(ne, a[i:i + band], b[j:j + band]))
+            i, j = min(i + band, n), min(j + band, m)
+            continue
+        di, dj = offset
+        substitutions += min(di, dj)
+        insertions += dj - min(di, dj)
+        deletions += di - min(di, dj)
+        i += di
+        j += dj
+
+    # Слишком много ошибок для выравнивания — остаток сравниваем позиционно
+    substitutions += sum(map(ne, a[i:], b[j:]))
+    insertions += max((m - j) - (n - i), 0)
+    deletions += max((n - i) - (m - j), 0)
+    return insertions, deletions, substitutions, True
+
+
+def score(original, typed, time_seconds, max_errors=None):
+    """Оценивает набранный текст: ошибки по видам, WPM (символы / 5) и точность"""
+    insertions, deletions, substitutions, capped = align(original, typed, max_errors)
+    correct = len(original) - deletions - substitutions
+    errors = insertions + deletions + substitutions
+    minutes = time_seconds / 60
+    wpm = (correct / CHARS_PER_WORD) / minutes if minutes > 0 else 0
+    accuracy = max(0, 100 - errors / max(len(original), 1) * 100)
+    return Score(insertions, deletions, substitutions, correct, wpm, accuracy, capped)
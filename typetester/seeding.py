@@ -0,0 +1,157 @@
+"""Синтетические данные для нагрузочных замеров (manage.py seed_bench).
+
+Пользователи и тексты вставляются bulk_create, результаты — executemany
+пачками без построения моделей (на миллионах строк компиляция INSERT в ORM
+занимает больше времени, чем сама запись). Каждая пачка — своя транзакция,
+без сигналов и без обновления сводной статистики на каждую строку — её
+потом один раз пересобирает rebuild_stats.
+
+Результаты похожи на настоящие: у каждого пользователя свой уровень WPM,
+точность и число ошибок с ним связаны, время теста следует из длины текста,
+даты равномерно растут вместе с id на заданное число дней назад.
+"""
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .corpus import content_hash
+from .models import TextSample, TypingTestResult
+
+USERNAME_PREFIX = 'bench_'
+
+BATCH_SIZE = 5000
+ANONYMOUS_SHARE = 0.3
+
+WORDS = {
+    'ru': {
+        'easy': "дом кот лес мир сад сон день ночь вода река поле небо свет снег дождь мама папа друг".split(),
+        'medium': "солнце дорога машина работа погода письмо книга город вечер окно берег ветер улица".split(),
+        'hard': (
+            "электричество преподаватель достопримечательность взаимодействие ответственность "
+            "перпендикулярный сосредоточенность 2024 №17 (примечание) «цитата» 3,14%"
+        ).split(),
+    },
+    'en': {
+        'easy': "cat dog sun run big red box cup hat map pen sit top win yes you day way".split(),
+        'medium': "garden window people simple market summer winter doctor travel number letter".split(),
+        'hard': (
+            "extraordinary responsibility infrastructure characteristic misunderstanding "
+            "acknowledgement 1984 #42 (footnote) \"quoted\" 99.9% e-mail@host"
+        ).split(),
+    },
+}
+
+USER_AGENTS = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 14_2) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Safari/605.1.15",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_2 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148",
+)
+
+
+def _chunks(count, size):
+    for start in range(0, count, size):
+        yield start, min(size, count - start)
+
+
+def make_text(rng, language, difficulty, words=40):
+    """Текст из предложений по словарю сложности (с примесью более простых слов)"""
+    pools = WORDS[language]
+    easier = {'easy': 'easy', 'medium': 'easy', 'hard': 'medium'}[difficulty]
+    sentences = []
+    while sum(len(sentence) for sentence in sentences) < words:
+        sentence = [
+            rng.choice(pools[difficulty] if rng.random() < 0.6 else pools[easier])
+            for _ in range(rng.randint(5, 10))
+        ]
+        sentences.append(sentence)
+    return ' '.join(' '.join(sentence).capitalize() + '.' for sentence in sentences)
+
+
+def seed_users(count, batch_size=BATCH_SIZE):
+    """Пользователи bench_N (уже существующие пропускаются); возвращает их id"""
+    # Без пароля: бенчмарки входят через force_login, а известный пароль
+    # открыл бы эти учётные записи на любом стенде с сидированной базой
+    password = make_password(None)
+    for start, size in _chunks(count, batch_size):
+        User.objects.bulk_create([
+            User(username=f"{USERNAME_PREFIX}{i}", password=password)
+            for i in range(start, start + size)
+        ], ignore_conflicts=True)
+    return list(User.objects.filter(username__startswith=USERNAME_PREFIX).values_list('id', flat=True))
+
+
+def seed_samples(per_scope, rng):
+    """Тексты каждой сложности и языка; возвращает [(id, число слов)]"""
+    samples = []
+    for language in WORDS:
+        for difficulty in WORDS[language]:
+            for _ in range(per_scope):
+                text = make_text(rng, language, difficulty)
+                samples.append(TextSample(
+                    text=text, language=language, difficulty=difficulty, content_hash=content_hash(text),
+                ))
+    TextSample.objects.bulk_create(samples, ignore_conflicts=True)
+    return [
+        (pk, len(text.split()))
+        for pk, text in TextSample.objects.values_list('id', 'text').iterator()
+    ]
+
+
+RESULT_COLUMNS = (
+    'user_id', 'text_sample_id', 'wpm', 'accuracy', 'words_count', 'time_seconds',
+    'mistakes_count', 'ip_address', 'user_agent', 'created_at',
+)
+
+
+def _result(rng, user_id, skill, sample, created_at):
+    """Строка результата в порядке RESULT_COLUMNS"""
+    sample_id, words = sample
+    wpm = min(max(rng.gauss(skill, skill * 0.12), 5.0), 250.0)
+    # Кто печатает быстрее, обычно и ошибается реже
+    accuracy = min(max(rng.gauss(90 + skill / 20, 3), 50.0), 100.0)
+    chars = words * 6
+    return (
+        user_id,
+        sample_id,
+        round(wpm, 1),
+        round(accuracy, 1),
+        words,
+        round(words / wpm * 60, 2),
+        round(chars * (100 - accuracy) / 100),
+        f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+        rng.choice(USER_AGENTS),
+        connection.ops.adapt_datetimefield_value(created_at),
+    )
+
+
+def _insert_sql():
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(column) for column in RESULT_COLUMNS)
+    placeholders = ', '.join(['%s'] * len(RESULT_COLUMNS))
+    return f"INSERT INTO {quote(TypingTestResult._meta.db_table)} ({columns}) VALUES ({placeholders})"
+
+
+def seed_results(count, user_ids, samples, rng, days=365, batch_size=BATCH_SIZE, progress=None):
+    """Вставляет count результатов за последние days дней; возвращает их число"""
+    skills = {user_id: min(max(rng.gauss(55, 20), 15), 150) for user_id in user_ids}
+    now = timezone.now()
+    start = now - timedelta(days=days)
+    step = (now - start) / max(count, 1)
+    sql = _insert_sql()
+    inserted = 0
+    for offset, size in _chunks(count, batch_size):
+        batch = []
+        for i in range(offset, offset + size):
+            user_id = rng.choice(user_ids) if user_ids and rng.random() >= ANONYMOUS_SHARE else None
+            skill = skills[user_id] if user_id is not None else rng.uniform(20, 90)
+            batch.append(_result(rng, user_id, skill, rng.choice(samples), start + step * i))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, batch)
+        inserted += size
+        if progress:
+            progress(inserted)
+    return inserted
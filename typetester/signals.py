@@ -0,0 +1,39 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import ingest, leaderboard, metrics, pagecache, samples
+from .models import TextSample, TypingTestResult
+
+
+@receiver(post_save, sender=TypingTestResult)
+def result_saved(sender, instance, created, **kwargs):
+    # Новые результаты добавляются в таблицы лидеров в save_result,
+    # здесь сбрасываем только изменённые (например, из админки)
+    if not created:
+        leaderboard.invalidate(instance)
+        pagecache.invalidate(instance)
+
+
+@receiver(post_delete, sender=TypingTestResult)
+def result_deleted(sender, instance, **kwargs):
+    # Удаление через ORM идёт в транзакции сборщика, строки уже нет.
+    # Пачки (retention.purge, ingest.remove) удаляются без сигналов
+    ingest.retract([instance])
+    leaderboard.invalidate(instance)
+    pagecache.invalidate(instance)
+
+
+@receiver(post_save, sender=TextSample)
+@receiver(post_delete, sender=TextSample)
+def sample_changed(sender, instance, **kwargs):
+    # Смена языка/сложности текста переносит результаты между таблицами
+    leaderboard.invalidate()
+    pagecache.invalidate()
+    samples.invalidate()
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    # Счётчик SQL-запросов для метрик
+    metrics.instrument(connection)
@@ -1,11 +1,30 @@
 let startTime = null;
-let timerInterval = null;
+let elapsedBeforePause = 0;
+let timerFrame = null;
 let isTestRunning = false;
 
 let originalText = '';
 let currentText = '';
 let saveResultUrl = '';
 
+// === ID ТЕСТА ===
+// Ключ идемпотентности: повторная отправка того же теста не создаст второй результат
+const SAVE_RETRIES = 3;
+let testId = newTestId();
+
+// === ОТОБРАЖЕНИЕ ТЕКСТА ===
+// По <span> на символ (сервер присылает текст уже разбитым); на нажатие
+// меняются классы только затронутых символов, а не разметка всего текста
+const CHAR_CLASSES = {
+    pending: 'text-to-type',
+    current: 'current-char',
+    typed: 'typed-text',
+    error: 'error-char'
+};
+let charSpans = [];
+// Последние показанные значения панели: DOM трогаем только при изменении
+const shownStats = {};
+
 // === ЧЕСТНАЯ СТАТИСТИКА ===
 const stats = {
     totalTyped: 0,
@@ -13,6 +32,15 @@ const stats = {
     mistakes: 0
 };
 
+// === ЖУРНАЛ НАЖАТИЙ ===
+// Пары (код символа, задержка в мс), отправляются на сервер в varint + base64
+const BACKSPACE_CODE = 8;
+const MAX_KEYSTROKES = 100000;
+const keystrokeLog = {
+    events: [],
+    lastTime: null
+};
+
 document.addEventListener('DOMContentLoaded', function () {
     const originalField = document.getElementById('originalText');
     const urlField = document.getElementById('saveResultUrl');
@@ -21,6 +49,8 @@ document.addEventListener('DOMContentLoaded', function () {
     if (originalField) originalText = originalField.value;
     if (urlField) saveResultUrl = urlField.value;
 
+    initTextDisplay();
+
     if (textInput) {
         textInput.focus();
         textInput.addEventListener('keydown', handleKeydown);
@@ -30,7 +60,6 @@ document.addEventListener('DOMContentLoaded', function () {
         });
     }
 
-    updateTextDisplay();
 });
 
 // ======================
@@ -38,7 +67,8 @@ document.addEventListener('DOMContentLoaded', function () {
 // ======================
 function startTest() {
     if (!isTestRunning) {
-        startTime = Date.now();
+        // performance.now() монотонно и не зависит от перевода системных часов
+        startTime = performance.now() - elapsedBeforePause * 1000;
         isTestRunning = true;
 
         const btn = document.getElementById('startBtn');
@@ -47,12 +77,23 @@ function startTest() {
             btn.onclick = pauseTest;
         }
 
-        timerInterval = setInterval(updateTimer, 100);
+        timerFrame = requestAnimationFrame(updateTimer);
     }
 }
 
+function stopTimer() {
+    if (timerFrame !== null) cancelAnimationFrame(timerFrame);
+    timerFrame = null;
+}
+
+function elapsedSeconds() {
+    if (!startTime) return 0;
+    return isTestRunning ? (performance.now() - startTime) / 1000 : elapsedBeforePause;
+}
+
 function pauseTest() {
-    clearInterval(timerInterval);
+    elapsedBeforePause = elapsedSeconds();
+    stopTimer();
     isTestRunning = false;
 
     const btn = document.getElementById('startBtn');
@@ -63,22 +104,27 @@ function pauseTest() {
 }
 
 function restartTest() {
-    clearInterval(timerInterval);
+    stopTimer();
     isTestRunning = false;
     startTime = null;
+    elapsedBeforePause = 0;
 
     currentText = '';
     stats.totalTyped = 0;
     stats.correct = 0;
     stats.mistakes = 0;
 
+    keystrokeLog.events = [];
+    keystrokeLog.lastTime = null;
+    testId = newTestId();
+
     const textInput = document.getElementById('textInput');
     if (textInput) textInput.value = '';
 
-    document.getElementById('timer').textContent = '0.0';
-    document.getElementById('wpm').textContent = '0';
-    document.getElementById('accuracy').textContent = '100%';
-    document.getElementById('errors').textContent = '0';
+    showStat('timer', '0.0');
+    showStat('wpm', '0');
+    showStat('accuracy', '100%');
+    showStat('errors', '0');
 
     const btn = document.getElementById('startBtn');
     if (btn) {
@@ -87,7 +133,7 @@ function restartTest() {
     }
 
     document.getElementById('resultsModal').style.display = 'none';
-    updateTextDisplay();
+    resetTextDisplay();
 }
 
 // ======================
@@ -98,9 +144,19 @@ function handleKeydown(e) {
         startTest();
     }
 
-    if (e.key === 'Backspace') {
+    if (isTestRunning) {
+        if (e.key === 'Backspace') {
+            recordKeystroke(BACKSPACE_CODE);
+        } else if (e.key.length === 1) {
+            recordKeystroke(e.key.codePointAt(0));
+        }
+    }
+
+    if (e.key === 'Backspace' && currentText.length > 0) {
         currentText = currentText.slice(0, -1);
-        updateTextDisplay();
+        const pos = currentText.length;
+        setCharState(pos + 1, 'pending');
+        setCharState(pos, 'current');
     }
 }
 
@@ -126,21 +182,52 @@ function handleInput(e) {
         stats.mistakes++;
     }
 
-    updateTextDisplay();
+    setCharState(pos, typedChar === expectedChar ? 'typed' : 'error');
+    setCharState(pos + 1, 'current');
 
     if (currentText.length === originalText.length) {
         finishTest();
     }
 }
 
+function recordKeystroke(code) {
+    if (keystrokeLog.events.length >= MAX_KEYSTROKES) return;
+
+    const now = performance.now();
+    const delta = keystrokeLog.lastTime === null
+        ? 0
+        : Math.round(now - keystrokeLog.lastTime);
+    keystrokeLog.lastTime = now;
+    keystrokeLog.events.push(code, delta);
+}
+
+function packKeystrokes() {
+    const bytes = [];
+    for (let value of keystrokeLog.events) {
+        while (value >= 0x80) {
+            bytes.push((value & 0x7F) | 0x80);
+            value = Math.floor(value / 128);
+        }
+        bytes.push(value);
+    }
+
+    let binary = '';
+    for (let i = 0; i < bytes.length; i += 0x8000) {
+        binary += String.fromCharCode.apply(null, bytes.slice(i, i + 0x8000));
+    }
+    return btoa(binary);
+}
+
 // ======================
 // METRICS
 // ======================
+// Кадр анимации: панель обновляется вместе с отрисовкой браузера и не
+// отнимает время у обработчиков ввода, пока вкладка скрыта — не вызывается
 function updateTimer() {
     if (!isTestRunning || !startTime) return;
 
-    const elapsed = (Date.now() - startTime) / 1000;
-    document.getElementById('timer').textContent = elapsed.toFixed(1);
+    const elapsed = elapsedSeconds();
+    showStat('timer', elapsed.toFixed(1));
 
     const minutes = elapsed / 60;
     const wpm = minutes > 0
@@ -151,42 +238,61 @@ function updateTimer() {
         ? Math.round((stats.correct / stats.totalTyped) * 100)
         : 100;
 
-    document.getElementById('wpm').textContent = wpm;
-    document.getElementById('accuracy').textContent = accuracy + '%';
-    document.getElementById('errors').textContent = stats.mistakes;
+    showStat('wpm', String(wpm));
+    showStat('accuracy', accuracy + '%');
+    showStat('errors', String(stats.mistakes));
+
+    timerFrame = requestAnimationFrame(updateTimer);
+}
+
+function showStat(id, value) {
+    if (shownStats[id] === value) return;
+    shownStats[id] = value;
+    const elem = document.getElementById(id);
+    if (elem) elem.textContent = value;
 }
 
 // ======================
 // UI
 // ======================
-function updateTextDisplay() {
+function initTextDisplay() {
     const display = document.getElementById('textToType');
     if (!display) return;
 
-    let html = '';
-    for (let i = 0; i < originalText.length; i++) {
-        if (i < currentText.length) {
-            html += currentText[i] === originalText[i]
-                ? `<span class="typed-text">${originalText[i]}</span>`
-                : `<span class="error-char">${originalText[i]}</span>`;
-        } else if (i === currentText.length) {
-            html += `<span class="current-char">${originalText[i]}</span>`;
-        } else {
-            html += `<span class="text-to-type">${originalText[i]}</span>`;
+    // Сервер режет текст по символам Python; если это не совпало с символами
+    // JS (суррогатные пары) или разметки нет, строим её один раз здесь
+    if (display.children.length !== originalText.length) {
+        const fragment = document.createDocumentFragment();
+        for (let i = 0; i < originalText.length; i++) {
+            const span = document.createElement('span');
+            span.className = i === 0 ? CHAR_CLASSES.current : CHAR_CLASSES.pending;
+            span.textContent = originalText[i];
+            fragment.appendChild(span);
         }
+        display.replaceChildren(fragment);
     }
+    charSpans = Array.from(display.children);
+}
 
-    display.innerHTML = html;
+function setCharState(pos, state) {
+    const span = charSpans[pos];
+    if (span) span.className = CHAR_CLASSES[state];
+}
+
+function resetTextDisplay() {
+    for (let i = 0; i < charSpans.length; i++) {
+        setCharState(i, i === 0 ? 'current' : 'pending');
+    }
 }
 
 // ======================
 // FINISH
 // ======================
 function finishTest() {
-    clearInterval(timerInterval);
+    const elapsed = elapsedSeconds();
+    stopTimer();
     isTestRunning = false;
-
-    const elapsed = (Date.now() - startTime) / 1000;
+    elapsedBeforePause = elapsed;
     const minutes = elapsed / 60;
 
     const wpm = minutes > 0
@@ -213,6 +319,27 @@ function finishTest() {
 function saveResult(wpm, accuracy, time, mistakes) {
     const textIdElem = document.getElementById('textId');
     const textId = textIdElem ? textIdElem.value : null;
+    const textSeedElem = document.getElementById('textSeed');
+    const textSeed = textSeedElem ? textSeedElem.value : null;
+
+    sendResult(JSON.stringify({
+        test_id: testId,
+        typed_text: currentText,
+        original_text: originalText,
+        time_seconds: time,
+        mistakes,
+        text_id: textId,
+        text_seed: textSeed,
+        keystrokes: packKeystrokes()
+    }), 0);
+}
+
+function sendResult(body, attempt) {
+    const retry = () => {
+        if (attempt < SAVE_RETRIES) {
+            setTimeout(() => sendResult(body, attempt + 1), 1000 * 2 ** attempt);
+        }
+    };
 
     fetch(saveResultUrl, {
         method: 'POST',
@@ -220,14 +347,16 @@ function saveResult(wpm, accuracy, time, mistakes) {
             'Content-Type': 'application/json',
             'X-CSRFToken': getCookie('csrftoken')
         },
-        body: JSON.stringify({
-            typed_text: currentText,
-            original_text: originalText,
-            time_seconds: time,
-            mistakes,
-            text_id: textId
-        })
-    });
+        body
+    }).then(response => {
+        // 409 — первая отправка ещё сохраняется, 5xx — сбой; с тем же id теста повтор безопасен
+        if (response.status === 409 || response.status >= 500) retry();
+    }).catch(retry);
+}
+
+function newTestId() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return Date.now().toString(36) + Math.random().toString(36).slice(2, 12);
 }
 
 function getCookie(name) {
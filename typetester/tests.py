@@ -1,3 +1,1419 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    admission, async_views, backup, corpus, histogram, ingest, keystrokes, leaderboard, metrics, pagecache, pagination,
+    replica, retention, rollup, samples, scoring, textgen, userstats, views,
+)
+from .models import (
+    DailyResultSummary, KeyStat, KeystrokeLog, StatsRollup, TextSample, TypingTestResult, UserStats, WpmBucket,
+)
+
+SEED_RESULTS = 5000
+
+
+class SyntheticDataMixin:
+    """Синтетический набор: пользователи, тексты всех сложностей и языков, тысячи результатов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(1)
+        cls.users = [User.objects.create_user(f'user{i}', password='secret') for i in range(20)]
+        cls.samples = [
+            TextSample.objects.create(text=f"Текст {difficulty} {language} {i}", difficulty=difficulty, language=language)
+            for difficulty in leaderboard.DIFFICULTIES
+            for language in leaderboard.LANGUAGES
+            for i in range(3)
+        ]
+        now = timezone.now()
+        results = TypingTestResult.objects.bulk_create([
+            TypingTestResult(
+                user=rng.choice(cls.users + [None]),
+                text_sample=rng.choice(cls.samples),
+                wpm=round(rng.uniform(10, 150), 1),
+                accuracy=round(rng.uniform(80, 100), 1),
+                words_count=50,
+                time_seconds=60.0,
+                mistakes_count=rng.randint(0, 10),
+                ip_address='127.0.0.1',
+            )
+            for _ in range(SEED_RESULTS)
+        ])
+        # bulk_create проставляет одинаковое время — разносим результаты на месяц назад
+        for i, result in enumerate(results):
+            result.created_at = now - timedelta(minutes=i * 10)
+        TypingTestResult.objects.bulk_update(results, ['created_at'], batch_size=1000)
+        rollup.rebuild()
+        histogram.rebuild()
+        userstats.rebuild()
+
+    def setUp(self):
+        cache.clear()
+
+
+class ResultFactoryMixin:
+    """Результаты со случайным WPM у нескольких пользователей и текстов"""
+
+    def setUp(self):
+        cache.clear()
+        self.rng = random.Random(5)
+        self.users = [User.objects.create_user(f'typist{i}') for i in range(3)]
+        self.samples = [
+            TextSample.objects.create(text=f"Текст {difficulty} {language}.", difficulty=difficulty, language=language)
+            for difficulty in ('easy', 'hard') for language in ('ru', 'en')
+        ]
+
+    def _results(self, count):
+        return [
+            TypingTestResult(
+                user=self.rng.choice(self.users + [None]),
+                text_sample=self.rng.choice(self.samples + [None]),
+                wpm=round(self.rng.uniform(10, 120), 1), accuracy=round(self.rng.uniform(80, 100), 1),
+                words_count=10, time_seconds=30, mistakes_count=1,
+            )
+            for _ in range(count)
+        ]
+
+    def _persist_batches(self, *sizes):
+        for size in sizes:
+            with self.captureOnCommitCallbacks(execute=True):
+                ingest.persist(self._results(size))
+
+
+class RollupTests(ResultFactoryMixin, TestCase):
+    """Накопленная статистика совпадает с пересчётом по строкам"""
+
+    def test_apply_matches_compute(self):
+        self._persist_batches(1, 1, 7, 1, 12)
+        self.assertEqual(rollup.check(), [])
+        expected = rollup.compute()
+        self.assertEqual(StatsRollup.objects.count(), len(expected))
+        stats = rollup.get_rollup()
+        self.assertEqual(stats.tests_count, 22)
+        self.assertEqual(stats.users_count, expected[rollup.GLOBAL_SCOPE]['users_count'])
+        self.assertAlmostEqual(stats.wpm_max, expected[rollup.GLOBAL_SCOPE]['wpm_max'])
+
+    def test_compute_queries(self):
+        self._persist_batches(12)
+        # Итоги по строкам, последние тесты всех пользователей, дневные сводки
+        with self.assertNumQueries(3):
+            userstats.compute()
+
+    def test_check_and_rebuild(self):
+        self._persist_batches(5)
+        StatsRollup.objects.filter(language='', difficulty='').update(tests_count=100)
+        mismatches = rollup.check()
+        self.assertEqual([(scope, field) for scope, field, _, _ in mismatches], [(rollup.GLOBAL_SCOPE, 'tests_count')])
+        rollup.rebuild()
+        self.assertEqual(rollup.check(), [])
+
+
+class LeaderboardRecordTests(ResultFactoryMixin, TestCase):
+    """Таблицы в кэше после record() совпадают с собранными заново"""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(leaderboard, 'BOARD_SIZE', 5)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _scopes(self):
+        return [
+            (language, difficulty, period)
+            for language in ('', 'ru', 'en') for difficulty in ('', 'easy', 'hard') for period in leaderboard.PERIODS
+        ]
+
+    def test_record_matches_rebuilt_boards(self):
+        self._persist_batches(8)
+        for scope in self._scopes():
+            leaderboard.get_board(*scope)
+        self._persist_batches(1, 1, 10, 1)
+        cached = {scope: leaderboard.get_board(*scope) for scope in self._scopes()}
+        cache.clear()
+        for scope in self._scopes():
+            self.assertEqual(cached[scope], leaderboard.get_board(*scope), scope)
+
+    def test_busy_board_is_dropped(self):
+        leaderboard.get_board()
+        key = leaderboard._cache_key('', '', 'all')
+        cache.add(f"{key}:lock", 1)
+        result = self._results(1)[0]
+        result.wpm = 500
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest.persist([result])
+        # Таблицу обновляет другой процесс — она сбрасывается, а не теряет запись
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(leaderboard.get_board()[0]['id'], result.pk)
+
+    def test_board_built_before_commit_is_not_cached(self):
+        # Таблица собирается при холодном кэше, а результат коммитится и
+        # попадает в record() между её чтением из базы и записью в кэш
+        result = self._results(1)[0]
+        result.wpm = 500
+        build = leaderboard.board_queryset
+
+        def racing_build(*args):
+            entries = list(build(*args))
+            with self.captureOnCommitCallbacks(execute=True):
+                ingest.persist([result])
+            return entries
+
+        with mock.patch.object(leaderboard, 'board_queryset', racing_build):
+            self.assertNotIn(result.pk, [entry['id'] for entry in leaderboard.get_board()])
+        self.assertEqual([entry['id'] for entry in leaderboard.get_board()][:1], [result.pk])
+
+
+class HistogramTests(TestCase):
+    """Место и процентиль по корзинам WPM против прямого подсчёта"""
+
+    def setUp(self):
+        cache.clear()
+        self.sample = TextSample.objects.create(text="Гистограмма.", language='en', difficulty='hard')
+
+    def _save(self, wpm, sample=None):
+        result = TypingTestResult(
+            text_sample=sample, wpm=wpm, accuracy=100, words_count=1, time_seconds=1, mistakes_count=0,
+        )
+        ingest.persist([result])
+        return result
+
+    def test_position_matches_count(self):
+        rng = random.Random(3)
+        for _ in range(60):
+            self._save(round(rng.uniform(10, 120), 1), self.sample if rng.random() < 0.5 else None)
+        ingest.persist([
+            TypingTestResult(text_sample=self.sample, wpm=wpm, accuracy=100, words_count=1, time_seconds=1,
+                             mistakes_count=0)
+            for wpm in (55.5, 55.5, 400.0)
+        ])
+        self.assertEqual(histogram.check(), [])
+
+        results = list(TypingTestResult.objects.select_related('text_sample'))
+        for result in results:
+            # Самая узкая область: язык и сложность текста, без текста — все результаты
+            scope = [
+                other.wpm for other in results
+                if result.text_sample is None or other.text_sample == result.text_sample
+            ]
+            better = sum(histogram.bucket_for(wpm) > histogram.bucket_for(result.wpm) for wpm in scope)
+            expected = (better + 1, round((len(scope) - better) / len(scope) * 100, 1))
+            self.assertEqual(histogram.position(result), expected, result.wpm)
+
+    def test_estimate_for_pending_result(self):
+        for wpm in (30, 40, 50):
+            self._save(wpm)
+        pending = TypingTestResult(wpm=45, accuracy=100, words_count=1, time_seconds=1, mistakes_count=0)
+        self.assertEqual(histogram.estimate_position(pending), (2, 75.0))
+
+    def test_rebuild(self):
+        for wpm in (30, 40, 40):
+            self._save(wpm, self.sample)
+        WpmBucket.objects.update(count=7)
+        self.assertTrue(histogram.check())
+        histogram.rebuild()
+        self.assertEqual(histogram.check(), [])
+        buckets = WpmBucket.objects.filter(language='en', difficulty='hard')
+        self.assertEqual(buckets.filter(level=histogram.BUCKET_LEVEL).count(), 2)
+        self.assertEqual(
+            sorted(buckets.filter(level=histogram.BLOCK_LEVEL).values_list('bucket', 'count')),
+            sorted([(histogram.bucket_for(30) // histogram.BLOCK_SIZE, 1), (histogram.bucket_for(40) // histogram.BLOCK_SIZE, 2)]),
+        )
+
+    def test_block_mismatch_detected(self):
+        self._save(30, self.sample)
+        WpmBucket.objects.filter(level=histogram.BLOCK_LEVEL, language='').update(count=5)
+        self.assertEqual(histogram.check(), [(('', ''), 1, 1)])
+
+
+class SampleIndexTests(TestCase):
+    """Индекс текстов процесса совпадает с таблицей и следует за её изменениями"""
+
+    def setUp(self):
+        cache.clear()
+        self.index = samples.SampleIndex()
+        self.samples = [
+            TextSample.objects.create(text=f"Образец {i}.", difficulty=difficulty, language=language)
+            for i, (difficulty, language) in enumerate([('easy', 'ru'), ('easy', 'ru'), ('hard', 'en')])
+        ]
+
+    def _expected(self):
+        ids = {}
+        for pk, difficulty, language in TextSample.objects.values_list('id', 'difficulty', 'language'):
+            ids.setdefault((difficulty, language), set()).add(pk)
+        return ids
+
+    def test_choose_and_lookup(self):
+        self.index.choose('easy', 'ru')
+        self.assertEqual({scope: set(ids) for scope, ids in self.index._ids.items()}, self._expected())
+        with self.assertNumQueries(0):
+            for _ in range(20):
+                self.assertIn(self.index.choose('easy', 'ru'), {self.samples[0].pk, self.samples[1].pk})
+            self.assertIsNone(self.index.choose('medium', 'ru'))
+            stub = self.index.lookup(str(self.samples[2].pk))
+            self.assertIsNone(self.index.lookup('нет'))
+            self.assertIsNone(self.index.lookup(10 ** 9))
+        self.assertEqual((stub.pk, stub.difficulty, stub.language), (self.samples[2].pk, 'hard', 'en'))
+
+    def test_reload_on_version_change(self):
+        self.index.choose('easy', 'ru')
+        version = self.index.version
+        added = TextSample.objects.create(text="Новый образец.", difficulty='medium', language='en')
+        self.assertEqual(self.index.choose('medium', 'en'), added.pk)
+        self.assertNotEqual(self.index.version, version)
+        self.samples[2].delete()
+        self.assertIsNone(self.index.choose('hard', 'en'))
+        self.assertEqual({scope: set(ids) for scope, ids in self.index._ids.items()}, self._expected())
+
+    def test_deleted_text_falls_back(self):
+        sample = self.samples[2]
+        self.index.choose('hard', 'en')
+        # Удаление в другом процессе: версия в кэше ещё старая
+        TextSample.objects.filter(pk=sample.pk)._raw_delete(TextSample.objects.db)
+        version = samples.current_version()
+        self.assertEqual(self.index.text(sample.pk, 'hard', 'en'), (samples.DEFAULT_TEXTS[('hard', 'en')], None))
+        self.assertNotEqual(samples.current_version(), version)
+        self.assertIsNone(self.index.choose('hard', 'en'))
+
+
+class DeletedSampleTests(TransactionTestCase):
+    """Текст удалён другим воркером, пока индекс процесса его ещё помнит"""
+
+    def setUp(self):
+        cache.clear()
+        self.sample = TextSample.objects.create(text="Скоро удалят.", difficulty='easy', language='ru')
+        samples.index.choose('easy', 'ru')
+        # Удаление без сигналов: версия индекса в кэше не меняется
+        TextSample.objects.filter(pk=self.sample.pk)._raw_delete(TextSample.objects.db)
+
+    def test_result_saved_without_text(self):
+        with self.assertLogs('typetester.ingest', 'WARNING'):
+            response = self.client.post(reverse('save_result'), json.dumps({
+                'typed_text': self.sample.text, 'original_text': self.sample.text, 'time_seconds': 5,
+                'text_id': self.sample.pk,
+            }), content_type='application/json')
+        self.assertTrue(response.json()['success'])
+        result = TypingTestResult.objects.get()
+        self.assertEqual((result.pk, result.text_sample_id), (response.json()['result_id'], None))
+        self.assertEqual(rollup.check(), [])
+        self.assertEqual(rollup.get_rollup().tests_count, 1)
+
+
+class ResultBufferTests(TestCase):
+    """Отложенная запись: остановка дописывает очередь, переполнение не теряет результаты"""
+
+    def setUp(self):
+        cache.clear()
+        self.buffer = ingest.ResultBuffer(enabled=True, max_size=3, batch_size=2, put_timeout=0)
+        # Фоновый поток не запускаем: очередь разбирают flush() и stop() в тесте
+        patcher = mock.patch.object(self.buffer, '_ensure_started')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _result(self, wpm):
+        return TypingTestResult(wpm=wpm, accuracy=100, words_count=5, time_seconds=10, mistakes_count=0)
+
+    def test_stop_drains_queue(self):
+        for wpm in (40, 41, 42):
+            self.assertTrue(self.buffer.submit(self._result(wpm)))
+        # Пачка, которую поток забрал из очереди, но не успел записать
+        self.buffer._leftover.append(self._result(43))
+        self.assertEqual(self.buffer.stop(), 4)
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(sorted(TypingTestResult.objects.values_list('wpm', flat=True)), [40, 41, 42, 43])
+        self.assertEqual(rollup.get_rollup().tests_count, 4)
+
+    def test_failed_flush_keeps_results(self):
+        self.buffer.submit(self._result(40))
+        with mock.patch.object(ingest, 'persist', side_effect=RuntimeError), self.assertLogs('typetester.ingest'):
+            with self.assertRaises(RuntimeError):
+                self.buffer.flush()
+        self.assertFalse(TypingTestResult.objects.exists())
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(TypingTestResult.objects.count(), 1)
+
+    def test_full_queue_rejects(self):
+        for wpm in (40, 41, 42):
+            self.assertTrue(self.buffer.submit(self._result(wpm)))
+        with self.assertLogs('typetester.ingest', 'WARNING'):
+            self.assertFalse(self.buffer.submit(self._result(43)))
+        self.assertEqual(len(self.buffer), 3)
+
+    def test_save_result_falls_back_when_full(self):
+        sample = TextSample.objects.create(text="Обратное давление.", language='ru')
+        with mock.patch.object(ingest, 'buffer', self.buffer):
+            for wpm in (40, 41, 42):
+                self.buffer.submit(self._result(wpm))
+            with self.assertLogs('typetester.ingest', 'WARNING'):
+                response = self.client.post(reverse('save_result'), json.dumps({
+                    'typed_text': sample.text, 'original_text': sample.text, 'time_seconds': 5, 'text_id': sample.pk,
+                }), content_type='application/json')
+        self.assertTrue(response.json()['success'])
+        # Результат записан в запросе, очередь не тронута
+        self.assertEqual(TypingTestResult.objects.count(), 1)
+        self.assertEqual(len(self.buffer), 3)
+
+
+class ScoringTests(SimpleTestCase):
+    """Выравнивание набранного текста с оригиналом"""
+
+    def test_exact_match(self):
+        self.assertEqual(scoring.align('hello world', 'hello world'), (0, 0, 0, False))
+        result = scoring.score('hello world', 'hello world', 6)
+        self.assertEqual((result.correct, result.wpm, result.accuracy), (11, 22.0, 100.0))
+
+    def test_single_errors_do_not_shift_the_rest(self):
+        self.assertEqual(scoring.align('hello world', 'helo world'), (0, 1, 0, False))
+        self.assertEqual(scoring.align('hello world', 'helllo world'), (1, 0, 0, False))
+        self.assertEqual(scoring.align('hello world', 'hellx world'), (0, 0, 1, False))
+        self.assertEqual(scoring.score('hello world', 'helo world', 6).errors, 1)
+
+    def test_truncated_and_extended_input(self):
+        # Ненабранный хвост — удаления, лишний хвост — вставки
+        self.assertEqual(scoring.align('hello world', 'hello'), (0, 6, 0, False))
+        self.assertEqual(scoring.align('the quick brown fox', 'the quick brown fox jumps'), (6, 0, 0, False))
+        self.assertEqual(scoring.score('hello world', 'hello', 6).correct, 5)
+
+    def test_zero_time(self):
+        result = scoring.score('hello world', 'hello world', 0)
+        self.assertEqual((result.wpm, result.accuracy), (0, 100.0))
+        self.assertEqual(scoring.score('', '', 5).accuracy, 100.0)
+
+    def test_resync_window(self):
+        original, typed = 'the quick brown fox', 'the XXXXXquick brown fox'
+        self.assertEqual(scoring.align(original, typed, band=16), (5, 0, 0, False))
+        # Вставка шире полосы не находится — участок сравнивается по позициям
+        insertions, deletions, substitutions, capped = scoring.align(original, typed, band=3)
+        self.assertEqual((insertions, deletions, capped), (5, 0, False))
+        self.assertGreater(substitutions, 0)
+
+    def test_error_cap(self):
+        self.assertEqual(scoring.align('a' * 40, 'b' * 40, max_errors=2, band=4), (0, 0, 40, True))
+        self.assertTrue(scoring.score('a' * 40, 'b' * 40, 10, max_errors=2).capped)
+
+
+class KeystrokeTests(TestCase):
+    """Двоичный журнал нажатий и разбор задержек"""
+
+    def test_encode_decode(self):
+        events = [(ord('a'), 0), (ord('я'), 127), (keystrokes.MAX_CODE, 128), (keystrokes.BACKSPACE, 2 ** 30)]
+        data = keystrokes.encode(events)
+        self.assertEqual(keystrokes.decode(data), events)
+        self.assertEqual(keystrokes.from_upload(base64.b64encode(data).decode()), data)
+
+    def test_invalid_logs(self):
+        with self.assertRaises(keystrokes.KeystrokeFormatError):
+            keystrokes.decode(keystrokes.encode([(ord('a'), 10)])[:-1])
+        with self.assertRaises(keystrokes.KeystrokeFormatError):
+            keystrokes.decode(b'\xff' * 6 + b'\x01\x00')
+        out_of_range = keystrokes.encode([(keystrokes.MAX_CODE + 1, 10)])
+        with self.assertRaises(keystrokes.KeystrokeFormatError):
+            keystrokes.decode(out_of_range)
+        with self.assertRaises(keystrokes.KeystrokeFormatError):
+            keystrokes.from_upload(base64.b64encode(out_of_range).decode())
+        with self.assertRaises(keystrokes.KeystrokeFormatError):
+            keystrokes.from_upload('не base64')
+
+    def test_analyze(self):
+        data = keystrokes.encode([
+            (ord('a'), 500), (ord('x'), 100), (keystrokes.BACKSPACE, 50), (ord('b'), 120), (ord('C'), 80),
+        ])
+        self.assertEqual(dict(keystrokes.analyze(data, 'abC')), {
+            'b': [2, 220, 1], 'ab': [1, 100, 1], 'c': [1, 80, 0], 'bc': [1, 80, 0],
+        })
+
+    def test_bad_log_does_not_block_queue(self):
+        user = User.objects.create_user('typist')
+        sample = TextSample.objects.create(text='ab', language='en')
+        results = [
+            TypingTestResult.objects.create(
+                user=user, text_sample=sample, wpm=40, accuracy=100, words_count=1, time_seconds=1, mistakes_count=0,
+            )
+            for _ in range(2)
+        ]
+        # Журнал из базы, записанный до проверки диапазона кодов
+        KeystrokeLog.objects.create(result=results[0], data=b'\xff\xff\xff\xff\x01\x00')
+        KeystrokeLog.objects.create(result=results[1], data=keystrokes.encode([(ord('a'), 0), (ord('b'), 90)]))
+        with self.assertLogs('typetester.keystrokes', 'WARNING'):
+            self.assertEqual(keystrokes.analyze_pending(), 2)
+        self.assertEqual(keystrokes.analyze_pending(), 0)
+        self.assertEqual(
+            {stat.sequence: (stat.hits, stat.total_ms) for stat in KeyStat.objects.filter(user=user)},
+            {'b': (1, 90), 'ab': (1, 90)},
+        )
+
+
+class UserStatsTests(ResultFactoryMixin, TestCase):
+    """Сводки пользователей совпадают с пересчётом по строкам"""
+
+    def _stored(self):
+        return {
+            stats.user_id: {
+                'tests_count': stats.tests_count, 'wpm_sum': stats.wpm_sum, 'best_wpm': stats.best_wpm,
+                'accuracy_sum': stats.accuracy_sum, 'recent_wpm': list(stats.recent_wpm),
+            }
+            for stats in UserStats.objects.all()
+        }
+
+    def _assert_matches(self, expected):
+        stored = self._stored()
+        self.assertEqual(set(stored), set(expected))
+        for user_id, values in expected.items():
+            for name, value in values.items():
+                if name == 'recent_wpm':
+                    self.assertEqual(stored[user_id][name], value)
+                else:
+                    self.assertAlmostEqual(stored[user_id][name], value, places=6)
+
+    def test_apply_matches_compute(self):
+        with mock.patch.object(userstats, 'RECENT_COUNT', 3):
+            self._persist_batches(1, 1, 7, 1, 12)
+            expected = userstats.compute()
+            self.assertEqual(userstats.check(), [])
+        self.assertTrue(expected)
+        self._assert_matches(expected)
+
+    def test_compute_queries(self):
+        self._persist_batches(12)
+        # Итоги по строкам, последние тесты всех пользователей, дневные сводки
+        with self.assertNumQueries(3):
+            userstats.compute()
+
+    def test_check_and_rebuild(self):
+        self._persist_batches(5, 8)
+        user_id = UserStats.objects.values_list('user_id', flat=True).first()
+        stats = UserStats.objects.get(user_id=user_id)
+        for changes in ({'accuracy_sum': stats.accuracy_sum + 1}, {'recent_wpm': stats.recent_wpm[1:]},
+                        {'best_wpm': 0, 'tests_count': 1}):
+            UserStats.objects.filter(user_id=user_id).update(**changes)
+            self.assertEqual(userstats.check(), [user_id], changes)
+        userstats.rebuild()
+        self.assertEqual(userstats.check(), [])
+        self._assert_matches(userstats.compute())
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ViewQueryCountTests(SyntheticDataMixin, TestCase):
+    """Число запросов горячих представлений не должно зависеть от объёма данных"""
+
+    def test_home(self):
+        with self.assertNumQueries(1):
+            self.client.get(reverse('home'))
+
+    def test_leaderboard_cold_cache(self):
+        # Таблица из базы, имена пользователей одним запросом, сводная статистика
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('leaderboard'), {'language': 'ru', 'difficulty': 'hard'})
+        self.assertEqual(len(response.context['results']), leaderboard.BOARD_SIZE)
+
+    def test_leaderboard_warm_cache(self):
+        self.client.get(reverse('leaderboard'))
+        # Таблица уже в кэше, страница — нет
+        pagecache.invalidate()
+        with self.assertNumQueries(2):
+            self.client.get(reverse('leaderboard'))
+
+    @mock.patch.object(pagecache, 'TIMEOUT', 0)
+    def test_typing_test(self):
+        self.client.get(reverse('typing_test'), {'difficulty': 'easy', 'language': 'en'})
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('typing_test'), {'difficulty': 'easy', 'language': 'en'})
+        self.assertIsNotNone(response.context['text_id'])
+
+    def test_save_result(self):
+        sample = self.samples[0]
+        self.client.force_login(self.users[0])
+        self.client.get(reverse('typing_test'))
+        payload = json.dumps({
+            'typed_text': sample.text,
+            'original_text': sample.text,
+            'time_seconds': 10,
+            'text_id': sample.id,
+        })
+        # Первый результат создаёт корзины гистограммы, дальше они только растут
+        self.client.post(reverse('save_result'), payload, content_type='application/json')
+        # сессия и пользователь, вставка, сводная статистика (глобальная и области),
+        # сводка пользователя, две корзины и два блока гистограммы и место по ним
+        with self.assertNumQueries(16):
+            response = self.client.post(reverse('save_result'), payload, content_type='application/json')
+        self.assertTrue(response.json()['success'])
+
+    def test_my_results(self):
+        self.client.force_login(self.users[0])
+        # сессия, пользователь, страница результатов, сводка, медленные клавиши и сочетания
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('my_results'))
+        cursor = response.context['next_cursor']
+        self.assertIsNotNone(cursor)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('my_results_api'), {'cursor': cursor})
+        self.assertTrue(response.json()['results'])
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN есть только в SQLite")
+class QueryPlanTests(SyntheticDataMixin, TestCase):
+    """Горячие запросы должны идти по индексам, а не полным сканированием таблицы"""
+
+    FULL_SCAN = re.compile(r'SCAN typetester_\w+$', re.MULTILINE)
+
+    def assertUsesIndex(self, queryset, allow_sort=False):
+        plan = queryset.explain()
+        self.assertNotRegex(plan, self.FULL_SCAN, f"Полное сканирование таблицы:\n{plan}")
+        if not allow_sort:
+            self.assertNotIn('USE TEMP B-TREE', plan, f"Сортировка без индекса:\n{plan}")
+
+    def test_leaderboard_all_time(self):
+        self.assertUsesIndex(leaderboard.board_queryset('', '', 'all'))
+
+    def test_leaderboard_period(self):
+        self.assertUsesIndex(leaderboard.board_queryset('', '', 'day'), allow_sort=True)
+
+    def test_leaderboard_segment(self):
+        # Топ по нескольким текстам сливается сортировкой, но строки ищутся по индексам
+        self.assertUsesIndex(leaderboard.board_queryset('ru', 'hard', 'all'), allow_sort=True)
+
+    def test_my_results_page(self):
+        queryset = TypingTestResult.objects.filter(user=self.users[0])
+        first, cursor = pagination.keyset_page(queryset, size=20)
+        self.assertUsesIndex(pagination.after_cursor(queryset))
+        self.assertUsesIndex(pagination.after_cursor(queryset, cursor))
+
+    def test_new_user_check(self):
+        result = TypingTestResult.objects.filter(user=self.users[0]).first()
+        self.assertUsesIndex(
+            TypingTestResult.objects.filter(user_id=result.user_id).exclude(pk__in=[result.pk])
+            .filter(text_sample__language='ru', text_sample__difficulty='easy')
+        )
+
+    def test_text_samples_by_scope(self):
+        self.assertUsesIndex(TextSample.objects.filter(difficulty='easy', language='ru'))
+
+
+class ImportTextsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _write(self, content, suffix='.txt'):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'w', encoding='utf-8') as f:
+            f.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_split_passages(self):
+        text = corpus.normalize(" ".join(f"Предложение номер {i} про кота." for i in range(100)))
+        passages = list(corpus.split_passages(text, min_chars=100, max_chars=200))
+        self.assertTrue(passages)
+        for passage in passages:
+            self.assertTrue(100 <= len(passage) <= 200, passage)
+            self.assertTrue(passage.endswith('.'))
+
+    def test_short_passage_not_dropped(self):
+        # Короткое предложение перед длинным и перед тем, что не помещается
+        long_sentence = " ".join(f"слово{i}" for i in range(60)) + "."
+        text = corpus.normalize(f"Коротко. {long_sentence} Ещё коротко. {'Среднее предложение тут. ' * 10}")
+        passages = list(corpus.split_passages(text, min_chars=100, max_chars=200))
+        self.assertEqual(" ".join(passages).split(), text.split())
+        self.assertTrue(all(len(passage) <= 200 for passage in passages))
+
+    def test_import_dedupes_within_and_across_batches(self):
+        paragraph = "Кот сидит на окне и смотрит на улицу. " * 8
+        english = "The quick brown fox jumps over the lazy dog. " * 4
+        path = self._write(f"{paragraph}\n\n{paragraph}\n\n{english}\n")
+        TextSample.objects.create(text=english, language='en')
+        version = samples.current_version()
+
+        call_command('import_texts', path, '--batch-size', '1', '--min-chars', '100', stdout=open(os.devnull, 'w'))
+
+        texts = TextSample.objects.values_list('language', 'content_hash')
+        self.assertEqual(sorted(language for language, _ in texts), ['en', 'ru'])
+        self.assertEqual(len({content_hash for _, content_hash in texts}), 2)
+        self.assertNotEqual(samples.current_version(), version)
+
+    def test_jsonl_fields_override_heuristics(self):
+        path = self._write(
+            json.dumps({'text': "Простой текст. " * 20, 'language': 'ru', 'difficulty': 'hard'}) + "\n",
+            suffix='.jsonl',
+        )
+        call_command('import_texts', path, stdout=open(os.devnull, 'w'))
+        sample = TextSample.objects.get()
+        self.assertEqual((sample.language, sample.difficulty), ('ru', 'hard'))
+        self.assertEqual(sample.content_hash, corpus.content_hash(sample.text))
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class TextSampleDuplicateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.original = TextSample.objects.create(text="Один и тот же текст.", language='ru')
+
+    def test_admin_rejects_duplicate(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='secret'))
+        response = self.client.post(reverse('admin:typetester_textsample_add'), {
+            'text': "  Один и тот   же текст. ", 'difficulty': 'hard', 'language': 'ru',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('text', response.context['adminform'].form.errors)
+        self.assertEqual(TextSample.objects.count(), 1)
+
+    def test_legacy_duplicate_still_saves(self):
+        # Повтор, которому миграция 0007 оставила пустой хеш
+        legacy = TextSample.objects.create(text="Другой текст.", language='ru')
+        TextSample.objects.filter(pk=legacy.pk).update(text=self.original.text, content_hash=None)
+        legacy.refresh_from_db()
+        legacy.difficulty = 'medium'
+        legacy.full_clean()
+        legacy.save()
+        self.assertIsNone(legacy.content_hash)
+
+        legacy.text = "Исправленный текст."
+        legacy.full_clean()
+        legacy.save()
+        self.assertEqual(legacy.content_hash, corpus.content_hash(legacy.text))
+
+        legacy.text = self.original.text
+        with self.assertRaises(ValidationError):
+            legacy.full_clean()
+
+
+class BackupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.user = User.objects.create_user('backup', password='secret')
+        self.sample = TextSample.objects.create(text="Текст для резервной копии.", language='ru')
+
+    def _results(self, count, wpm):
+        return TypingTestResult.objects.bulk_create([
+            TypingTestResult(
+                user=self.user, text_sample=self.sample, wpm=wpm + i, accuracy=99.5,
+                words_count=5, time_seconds=12.5, mistakes_count=1,
+            )
+            for i in range(count)
+        ])
+
+    def test_incremental_export_and_restore(self):
+        self._results(25, 40)
+        backup.export(self.path, segment_size=10, chunk_size=4)
+        self._results(3, 100)
+        self.assertEqual(backup.export(self.path, segment_size=10)['typetester.typingtestresult'], 3)
+
+        manifest = backup.read_manifest(self.path)
+        state = manifest['models']['typetester.typingtestresult']
+        self.assertEqual(state['rows'], 28)
+        self.assertEqual([segment['rows'] for segment in state['segments']], [10, 10, 5, 3])
+
+        expected = list(TypingTestResult.objects.order_by('pk').values())
+        TypingTestResult.objects.all().delete()
+        TextSample.objects.all().delete()
+        call_command('restore_results', self.path, stdout=open(os.devnull, 'w'))
+        self.assertEqual(list(TypingTestResult.objects.order_by('pk').values()), expected)
+        self.assertEqual(rollup.get_rollup().tests_count, 28)
+
+        # Повторная загрузка ничего не дублирует
+        restored = backup.restore(self.path)
+        self.assertEqual(restored['typetester.typingtestresult'], (0, 0))
+
+    def test_compacted_results_round_trip(self):
+        results = self._results(6, 40)
+        TypingTestResult.objects.filter(pk__in=[result.pk for result in results[:4]]).update(
+            created_at=timezone.now() - timedelta(days=400),
+        )
+        backup.export(self.path, segment_size=2)
+        with mock.patch.object(leaderboard, 'BOARD_SIZE', 1), mock.patch.object(userstats, 'RECENT_COUNT', 1):
+            call_command('compact_results', days=365, stdout=open(os.devnull, 'w'))
+        exported = backup.export(self.path, segment_size=2)
+        self.assertEqual(exported['typetester.dailyresultsummary'], 1)
+        self.assertEqual(backup.export(self.path)['typetester.dailyresultsummary'], 1)
+        self.assertEqual(len(os.listdir(self.path)), 3 + 1 + 1 + 1)
+
+        results = list(TypingTestResult.objects.order_by('pk').values())
+        summaries = list(DailyResultSummary.objects.order_by('pk').values())
+        stats = rollup.compute()
+        DailyResultSummary.objects.all().delete()
+        TypingTestResult.objects.all().delete()
+        TextSample.objects.all().delete()
+        call_command('restore_results', self.path, stdout=open(os.devnull, 'w'))
+        # Свёрнутые результаты не возвращаются рядом со своей сводкой
+        self.assertEqual(list(TypingTestResult.objects.order_by('pk').values()), results)
+        self.assertEqual(list(DailyResultSummary.objects.order_by('pk').values()), summaries)
+        self.assertEqual(rollup.compute(), stats)
+        self.assertEqual(rollup.check(), [])
+
+    def test_corrupted_segment(self):
+        self._results(3, 40)
+        backup.export(self.path)
+        segment = backup.read_manifest(self.path)['models']['typetester.typingtestresult']['segments'][0]
+        with open(os.path.join(self.path, segment['file']), 'ab') as f:
+            f.write(b'x')
+        with self.assertRaises(backup.BackupError):
+            backup.restore(self.path)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class AsyncViewTests(TestCase):
+    """Асинхронные представления отвечают так же, как синхронные"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('async', password='secret')
+        cls.sample = TextSample.objects.create(text="Асинхронный текст для проверки.", language='ru')
+        ingest.persist([
+            TypingTestResult(
+                user=cls.user, text_sample=cls.sample, wpm=30 + i, accuracy=98,
+                words_count=4, time_seconds=10, mistakes_count=0,
+            )
+            for i in range(3)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def _request(self, factory, method='get', path='/', user=None, **kwargs):
+        request = getattr(factory, method)(path, **kwargs)
+        request.user = user or AnonymousUser()
+        return request
+
+    async def test_save_result(self):
+        payload = json.dumps({
+            'typed_text': self.sample.text,
+            'original_text': self.sample.text,
+            'time_seconds': 5,
+            'text_id': self.sample.id,
+        })
+        request = self._request(AsyncRequestFactory(), 'post', data=payload, content_type='application/json', user=self.user)
+        data = json.loads((await async_views.save_result(request)).content)
+        self.assertTrue(data['success'], data)
+        self.assertEqual((data['rank'], data['percentile']), (1, 100.0))
+        result = await TypingTestResult.objects.aget(pk=data['result_id'])
+        self.assertEqual(result.user_id, self.user.pk)
+        self.assertEqual((await rollup.aget_rollup()).tests_count, 4)
+
+    async def test_buffer_submit_off_event_loop(self):
+        # Ожидание места в очереди не должно останавливать цикл событий
+        threads = []
+        buffer = ingest.ResultBuffer(enabled=True, put_timeout=0)
+        payload = json.dumps({'typed_text': 'а', 'original_text': 'а', 'time_seconds': 1, 'text_id': self.sample.id})
+        request = self._request(AsyncRequestFactory(), 'post', data=payload, content_type='application/json')
+        with mock.patch.object(ingest, 'buffer', buffer), \
+                mock.patch.object(buffer, 'submit', side_effect=lambda result: threads.append(threading.get_ident())):
+            data = json.loads((await async_views.save_result(request)).content)
+        self.assertTrue(data['success'], data)
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+
+    async def test_read_views_match_sync(self):
+        self.assertEqual(await leaderboard.aget_board(), await sync_to_async(leaderboard.get_board)())
+        for view in ('home', 'typing_test', 'leaderboard'):
+            response = await getattr(async_views, view)(self._request(AsyncRequestFactory()))
+            self.assertEqual(response.status_code, 200, view)
+
+        api = await async_views.my_results_api(self._request(AsyncRequestFactory(), user=self.user))
+        sync_api = await sync_to_async(views.my_results_api)(self._request(RequestFactory(), user=self.user))
+        self.assertEqual(json.loads(api.content), json.loads(sync_api.content))
+
+    async def test_my_results_requires_login(self):
+        response = await async_views.my_results(self._request(AsyncRequestFactory(), path='/my-results/'))
+        self.assertEqual(response.status_code, 302)
+        response = await async_views.my_results_api(self._request(AsyncRequestFactory()))
+        self.assertEqual(response.status_code, 401)
+        response = await async_views.my_results(self._request(AsyncRequestFactory(), user=self.user))
+        self.assertContains(response, 'resultsBody')
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.collector.flush()
+        cache.clear()
+
+    def test_prometheus_endpoint(self):
+        self.client.get(reverse('home'))
+        self.client.get(reverse('home'))
+        self.client.get('/no-such-page/')
+        text = self.client.get(reverse('metrics')).content.decode()
+
+        self.assertIn('typemaster_requests_total{route="home",status="2xx"} 2', text)
+        self.assertIn('typemaster_requests_total{route="unmatched",status="4xx"} 1', text)
+        # Главная страница — один запрос к сводной статистике, второй раз она из кэша
+        self.assertIn('typemaster_db_queries_total{route="home"} 1', text)
+        self.assertIn('typemaster_page_cache_total{route="home",result="hit"} 1', text)
+        self.assertIn('typemaster_page_cache_hit_ratio{route="home"} 0.5', text)
+        self.assertIn('typemaster_request_duration_seconds_count{route="home"} 2', text)
+        self.assertIn('typemaster_request_duration_seconds_bucket{route="home",le="+Inf"} 2', text)
+        self.assertRegex(text, r'typemaster_response_bytes_total\{route="home"\} [1-9]')
+
+    def test_token(self):
+        with mock.patch.dict(metrics.OPTIONS, {'TOKEN': 'secret'}):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
+
+    def test_slow_request_log(self):
+        with mock.patch.dict(metrics.OPTIONS, {'SLOW_REQUEST_MS': 1e-6}):
+            middleware = metrics.MetricsMiddleware(views.home)
+            request = RequestFactory().get('/')
+            request.user = AnonymousUser()
+            with self.assertLogs('typetester.slow_requests', 'WARNING') as logs:
+                middleware(request)
+        self.assertIn('typetester_statsrollup', logs.output[0])
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class PageCacheTests(TestCase):
+    """Условные GET и кэш страниц по версиям областей"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cached', password='secret')
+        cls.ru = TextSample.objects.create(text="Текст для кэша страниц.", language='ru', difficulty='hard')
+        cls.en = TextSample.objects.create(text="Page cache sample text.", language='en', difficulty='easy')
+
+    def setUp(self):
+        cache.clear()
+
+    def _persist(self, sample):
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest.persist([TypingTestResult(
+                text_sample=sample, wpm=50, accuracy=99, words_count=4, time_seconds=5, mistakes_count=0,
+            )])
+
+    def test_anonymous_page_from_cache(self):
+        first = self.client.get(reverse('home'))
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('home'))
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertIn('Cookie', second['Vary'])
+
+        self._persist(self.ru)
+        with self.assertNumQueries(1):
+            third = self.client.get(reverse('home'))
+        self.assertNotEqual(third['ETag'], first['ETag'])
+
+    def test_not_modified(self):
+        etag = self.client.get(reverse('leaderboard'))['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('leaderboard'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self._persist(self.ru)
+        response = self.client.get(reverse('leaderboard'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_versions_per_scope(self):
+        params = {'language': 'ru', 'difficulty': 'hard'}
+        etag = self.client.get(reverse('leaderboard'), params)['ETag']
+        # Результат на другом языке не меняет ни таблицу ru/hard, ни её статистику
+        self._persist(self.en)
+        self.assertEqual(self.client.get(reverse('leaderboard'), params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self._persist(self.ru)
+        self.assertEqual(self.client.get(reverse('leaderboard'), params, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_logged_in_not_shared(self):
+        self.client.force_login(self.user)
+        first = self.client.get(reverse('home'))
+        self.assertIn('private', first['Cache-Control'])
+        self.assertContains(first, 'Выйти (cached)')
+        self.assertEqual(self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        # Страница вошедшего не попадает в общий кэш, а его ETag не подходит анонимным
+        self.client.logout()
+        response = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Выйти')
+
+    def test_typing_test_per_sample(self):
+        params = {'difficulty': 'hard', 'language': 'ru'}
+        with mock.patch.object(samples.index, 'choose', return_value=self.ru.pk):
+            self.client.get(reverse('typing_test'), params)
+            with self.assertNumQueries(0):
+                response = self.client.get(reverse('typing_test'), params)
+        self.assertContains(response, self.ru.text)
+        self.assertNotIn('ETag', response)
+
+    def test_messages_skip_cache(self):
+        self.client.get(reverse('home'))
+        self.client.cookies['messages'] = 'pending'
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('home'))
+        self.assertNotIn('ETag', response)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ReplicaTests(SimpleTestCase):
+    """Основная база и реплика — два файла SQLite; «репликация» — копирование файла"""
+
+    databases = {'default'}
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.original = connections['default']
+        self._connect('default', 'primary.sqlite3')
+        call_command('migrate', verbosity=0)
+        self.sample = TextSample.objects.create(text="Текст на основной базе.", language='ru', difficulty='easy')
+        self._replicate()
+        patcher = mock.patch.object(replica, 'REPLICA', 'replica')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+
+    def tearDown(self):
+        for alias in ('default', 'replica'):
+            connections[alias].close()
+        connections['default'] = self.original
+        del connections['replica']
+        shutil.rmtree(self.tmp)
+
+    def _connect(self, alias, name):
+        settings_dict = {**self.original.settings_dict, 'NAME': os.path.join(self.tmp, name)}
+        connections[alias] = self.original.__class__(settings_dict, alias)
+
+    def _replicate(self):
+        if hasattr(connections._connections, 'replica'):
+            connections['replica'].close()
+        with sqlite3.connect(os.path.join(self.tmp, 'primary.sqlite3')) as source, \
+                sqlite3.connect(os.path.join(self.tmp, 'replica.sqlite3')) as target:
+            source.backup(target)
+        self._connect('replica', 'replica.sqlite3')
+
+    def _save(self):
+        payload = json.dumps({
+            'typed_text': self.sample.text, 'original_text': self.sample.text,
+            'time_seconds': 5, 'text_id': self.sample.id,
+        })
+        return self.client.post(reverse('save_result'), payload, content_type='application/json')
+
+    def test_router(self):
+        router = replica.ReplicaRouter()
+        self.assertEqual(router.db_for_read(TypingTestResult), 'default')
+        with replica.replica():
+            self.assertEqual(router.db_for_read(TypingTestResult), 'replica')
+            # Сессии и пользователи — только из основной базы
+            self.assertEqual(router.db_for_read(User), 'default')
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(TypingTestResult), 'default')
+        self.assertEqual(router.db_for_write(TypingTestResult), 'default')
+
+    def test_reads_lag_until_replicated(self):
+        self.assertTrue(self._save().json()['success'])
+        self.client.cookies.pop(replica.PIN_COOKIE)
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['total_tests'], 0)
+        # Страницу по отстающей реплике не запоминаем
+        self.assertNotIn('ETag', response)
+        # Таблица лидеров кэшируется надолго и поэтому собирается по основной базе
+        self.assertEqual(len(self.client.get(reverse('leaderboard')).context['results']), 1)
+
+        self._replicate()
+        self.assertEqual(self.client.get(reverse('home')).context['total_tests'], 1)
+
+    def test_sticky_after_write(self):
+        response = self._save()
+        self.assertEqual(response.cookies[replica.PIN_COOKIE]['max-age'], replica.STICKY_SECONDS)
+        self.assertEqual(self.client.get(reverse('home')).context['total_tests'], 1)
+        self.client.cookies.pop(replica.PIN_COOKIE)
+        self.assertEqual(self.client.get(reverse('home')).context['total_tests'], 0)
+
+    def test_session_from_primary(self):
+        user = User.objects.create_user('fresh', password='secret')
+        self.client.force_login(user)
+        # Пользователя и сессии на реплике ещё нет, но вход уже действует
+        self.assertEqual(self.client.get(reverse('my_results')).status_code, 200)
+
+
+class CompactResultsTests(TestCase):
+    """Сворачивание старых результатов не меняет статистику"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('veteran')
+        cls.sample = TextSample.objects.create(text="Старый текст.", language='ru', difficulty='easy')
+        results = [
+            TypingTestResult(user=user, text_sample=sample, wpm=wpm, accuracy=95, words_count=3,
+                             time_seconds=10, mistakes_count=1)
+            for user, sample, wpm in [
+                (cls.user, cls.sample, 30.0), (cls.user, cls.sample, 50.0), (cls.user, cls.sample, 40.0),
+                (cls.user, None, 20.0), (None, cls.sample, 60.0), (None, cls.sample, 35.5),
+                (cls.user, cls.sample, 45.0),
+            ]
+        ]
+        with mock.patch.object(userstats, 'RECENT_COUNT', 1):
+            ingest.persist(results)
+        cls.recent = results[-1]
+        cls.pending = results[2]
+        KeystrokeLog.objects.create(result=cls.pending, data=b'', analyzed=False)
+        cls.old_day = timezone.now() - timedelta(days=400)
+        TypingTestResult.objects.exclude(pk=cls.recent.pk).update(created_at=cls.old_day)
+
+    def setUp(self):
+        cache.clear()
+        # В таблицах лидеров по одной строке — лучший результат, анонимный 60 WPM
+        patcher = mock.patch.object(leaderboard, 'BOARD_SIZE', 1)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Из последних тестов пользователя остаётся только свежий 45 WPM
+        patcher = mock.patch.object(userstats, 'RECENT_COUNT', 1)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_compact(self):
+        before = rollup.compute()
+        boards = leaderboard.get_board('ru', 'easy')
+        call_command('compact_results', days=365, batch_size=2, stdout=open(os.devnull, 'w'))
+
+        # Остались: рекорд пользователя в ru/easy и без текста, строка таблиц
+        # лидеров, свежий результат и результат с неразобранным журналом нажатий
+        remaining = set(TypingTestResult.objects.values_list('wpm', flat=True))
+        self.assertEqual(remaining, {50.0, 20.0, 60.0, 45.0, 40.0})
+        cache.clear()
+        self.assertEqual(leaderboard.get_board('ru', 'easy'), boards)
+        summaries = {(s.user_id, s.language): s for s in DailyResultSummary.objects.all()}
+        self.assertEqual(set(summaries), {(self.user.pk, 'ru'), (None, 'ru')})
+        anonymous = summaries[(None, 'ru')]
+        self.assertEqual((anonymous.tests_count, anonymous.wpm_max), (1, 35.5))
+        self.assertEqual(anonymous.wpm_counts, {'35.5': 1})
+        self.assertEqual(anonymous.day, timezone.localdate(self.old_day))
+
+        # Пересчёт по строкам и сводкам совпадает с накопленной статистикой
+        self.assertEqual(rollup.check(), [])
+        self.assertEqual(histogram.check(), [])
+        self.assertEqual(userstats.check(), [])
+        self.assertEqual(rollup.compute(), before)
+
+    def test_board_entries_kept(self):
+        with mock.patch.object(leaderboard, 'BOARD_SIZE', 50):
+            call_command('compact_results', days=365, stdout=open(os.devnull, 'w'))
+        self.assertEqual(TypingTestResult.objects.count(), 7)
+
+    def test_period_board_entries_kept(self):
+        # Срок хранения короче месяца: свежий результат — единственная строка
+        # таблицы за месяц и не должен из неё пропасть
+        board = leaderboard.get_board('ru', 'easy', 'month')
+        self.assertEqual([entry['id'] for entry in board], [self.recent.pk])
+        retention.compact(timezone.now() + timedelta(seconds=1))
+        self.assertTrue(TypingTestResult.objects.filter(pk=self.recent.pk).exists())
+        cache.clear()
+        self.assertEqual(leaderboard.get_board('ru', 'easy', 'month'), board)
+        self.assertEqual(rollup.check(), [])
+
+    def test_dry_run(self):
+        call_command('compact_results', days=365, dry_run=True, stdout=open(os.devnull, 'w'))
+        self.assertEqual(TypingTestResult.objects.count(), 7)
+        self.assertFalse(DailyResultSummary.objects.exists())
+
+    def test_repeated_runs_merge(self):
+        call_command('compact_results', days=365, stdout=open(os.devnull, 'w'))
+        KeystrokeLog.objects.filter(result=self.pending).update(analyzed=True)
+        call_command('compact_results', days=365, stdout=open(os.devnull, 'w'))
+        summary = DailyResultSummary.objects.get(user=self.user, language='ru')
+        self.assertEqual((summary.tests_count, summary.wpm_sum), (2, 70.0))
+        self.assertEqual(rollup.check(), [])
+
+
+class SeedBenchTests(TestCase):
+    """Генератор нагрузочных данных и сценарии замера"""
+
+    def test_seed_bench(self):
+        call_command('seed_bench', results=300, users=5, samples=2, stdout=open(os.devnull, 'w'))
+        self.assertEqual(TypingTestResult.objects.count(), 300)
+        self.assertEqual(User.objects.filter(username__startswith='bench_').count(), 5)
+        # Входа по паролю у сгенерированных пользователей нет
+        self.assertFalse(any(user.has_usable_password() for user in User.objects.filter(username__startswith='bench_')))
+        self.assertEqual(TextSample.objects.count(), 2 * len(leaderboard.LANGUAGES) * len(leaderboard.DIFFICULTIES))
+        # Сводная статистика пересобрана по вставленным строкам
+        self.assertEqual(rollup.check(), [])
+        self.assertEqual(userstats.check(), [])
+
+    def test_every_route_has_scenario(self):
+        from . import bench
+
+        self.assertEqual(bench.missing_scenarios(), [])
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ResultAdminTests(TestCase):
+    """Список результатов в админке: курсор вместо OFFSET, выгрузка и удаление пачками"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='secret')
+        cls.player = User.objects.create_user('player')
+        cls.sample = TextSample.objects.create(text="Текст.", language='ru', difficulty='hard')
+        results = TypingTestResult.objects.bulk_create([
+            TypingTestResult(user=cls.player if i % 2 else None, text_sample=cls.sample if i % 3 else None,
+                             wpm=40 + i, accuracy=95, words_count=10, time_seconds=15, mistakes_count=1,
+                             ip_address=f'10.0.0.{i}')
+            for i in range(12)
+        ])
+        for i, result in enumerate(results):
+            result.created_at = timezone.now() - timedelta(minutes=i)
+        TypingTestResult.objects.bulk_update(results, ['created_at'])
+        KeystrokeLog.objects.create(result=results[1], data=b'', analyzed=True)
+        cls.url = reverse('admin:typetester_typingtestresult_changelist')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def test_keyset_pages(self):
+        from .admin import TypingTestResultAdmin
+
+        with mock.patch.object(TypingTestResultAdmin, 'list_per_page', 5):
+            first = self.client.get(self.url)
+            self.assertEqual(len(first.context['cl'].result_list), 5)
+            cursor = first.context['cl'].next_cursor
+            with self.assertNumQueries(4):
+                second = self.client.get(self.url, {'cursor': cursor})
+        ids = [r.pk for r in first.context['cl'].result_list] + [r.pk for r in second.context['cl'].result_list]
+        self.assertEqual(len(set(ids)), 10)
+        self.assertContains(second, "В начало")
+
+    def test_difficulty_filter_and_search(self):
+        response = self.client.get(self.url, {'text_sample__difficulty__exact': 'hard'})
+        self.assertEqual(len(response.context['cl'].result_list), 8)
+        response = self.client.get(self.url, {'q': '10.0.0.3'})
+        self.assertEqual([r.ip_address for r in response.context['cl'].result_list], ['10.0.0.3'])
+        response = self.client.get(self.url, {'q': 'player'})
+        self.assertEqual(len(response.context['cl'].result_list), 6)
+
+    def test_export_csv(self):
+        response = self.client.post(self.url, {
+            'action': 'export_csv', 'select_across': '1', 'index': '0', '_selected_action': ['1'],
+        })
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0][:2], ['id', 'user__username'])
+        self.assertEqual(len(rows), 13)
+
+    def test_delete_in_chunks(self):
+        data = {'action': 'delete_in_chunks', 'select_across': '1', '_selected_action': ['1']}
+        confirmation = self.client.post(self.url, {**data, 'index': '0'})
+        self.assertContains(confirmation, "Удалить результаты: 12?")
+        self.assertEqual(TypingTestResult.objects.count(), 12)
+
+        call_command('rebuild_stats', stdout=open(os.devnull, 'w'))
+        with mock.patch('typetester.admin.CHUNK_SIZE', 5):
+            self.client.post(self.url + '?text_sample__difficulty__exact=hard', {**data, 'post': 'yes'})
+        self.assertEqual(TypingTestResult.objects.count(), 4)
+        self.assertFalse(KeystrokeLog.objects.exists())
+        # Удалённые строки вычтены из статистики без rebuild_stats, в том числе лучший WPM
+        self.assertEqual(rollup.check(), [])
+        self.assertEqual(histogram.check(), [])
+        self.assertEqual(userstats.check(), [])
+        self.assertEqual(rollup.get_rollup().wpm_max, 49)
+
+    def test_single_delete_updates_stats(self):
+        call_command('rebuild_stats', stdout=open(os.devnull, 'w'))
+        for result in TypingTestResult.objects.filter(user=self.player).order_by('-wpm'):
+            result.delete()
+            self.assertEqual((rollup.check(), histogram.check(), userstats.check()), ([], [], []), result.wpm)
+        self.assertFalse(UserStats.objects.filter(user=self.player).exists())
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class TextGenTests(TestCase):
+    """Генерация текстов по таблицам слов без базы"""
+
+    def setUp(self):
+        cache.clear()
+        self.tables_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tables_dir)
+        patcher = mock.patch.object(textgen, 'TABLES_DIR', self.tables_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        call_command('build_word_tables', stdout=open(os.devnull, 'w'))
+
+    def test_same_seed_same_text(self):
+        for language in textgen.LANGUAGES:
+            for difficulty in textgen.DIFFICULTIES:
+                passage = textgen.generate(difficulty, language, seed=7)
+                self.assertEqual(passage, textgen.generate(difficulty, language, seed=7))
+                self.assertEqual(textgen.restore(passage.token), passage.text)
+                self.assertEqual(len(passage.text.split()), textgen.PASSAGE_WORDS[difficulty])
+        self.assertNotEqual(textgen.generate('easy', 'ru', seed=7).text, textgen.generate('easy', 'ru', seed=8).text)
+
+    def test_easy_words_are_short(self):
+        text = textgen.generate('easy', 'en', seed=1).text
+        words = re.findall(r'[a-z]+', text.lower())
+        self.assertTrue(all(len(word) <= textgen.MAX_LENGTH['en']['easy'] for word in words))
+
+    def test_rebuilt_tables_change_token(self):
+        token = textgen.generate('medium', 'ru', seed=3).token
+        TextSample.objects.create(text="Совсем новые слова для таблиц.", language='ru', difficulty='easy')
+        call_command('build_word_tables', language=['ru'], stdout=open(os.devnull, 'w'))
+        self.assertIsNone(textgen.restore(token))
+
+    def test_unknown_language_rejected(self):
+        outside = os.path.join(self.tables_dir, 'outside', 'evil')
+        os.makedirs(os.path.dirname(outside))
+        shutil.copy(textgen.table_path('en'), f'{outside}.bin')
+        with self.assertRaises(textgen.TablesError):
+            textgen.table_path(outside)
+        self.assertIsNone(textgen.tables(outside))
+        self.assertIsNone(textgen.generate('easy', outside, seed=1))
+        token = textgen.generate('easy', 'en', seed=1).token
+        self.assertIsNone(textgen.restore(token.replace('en', outside, 1)))
+        response = self.client.get(reverse('typing_test'), {'language': outside, 'seed': '1'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_corrupted_tables(self):
+        with open(textgen.table_path('ru'), 'r+b') as f:
+            f.truncate(textgen.HEADER.size + 16)
+        with self.assertLogs('typetester.textgen', 'ERROR'):
+            self.assertIsNone(textgen.generate('easy', 'ru', seed=1))
+            response = self.client.get(reverse('typing_test'), {'language': 'ru', 'seed': '1'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_typing_test_with_seed(self):
+        url = reverse('typing_test')
+        params = {'difficulty': 'medium', 'language': 'en', 'seed': '11'}
+        self.client.get(url, params)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, params)
+        self.assertEqual(response.context['text'], textgen.generate('medium', 'en', seed=11).text)
+
+        # Оценка идёт по восстановленному тексту, а не по присланному
+        passage = textgen.generate('medium', 'en', seed=11)
+        response = self.client.post(reverse('save_result'), json.dumps({
+            'typed_text': passage.text, 'original_text': 'подмена', 'time_seconds': 30,
+            'text_seed': passage.token,
+        }), content_type='application/json')
+        self.assertEqual(response.json()['accuracy'], 100.0)
+
+        # Токен, который не восстанавливается, не откатывается к присланному тексту
+        language, difficulty, seed, digest = passage.token.split('.')
+        for token in (f"{language}.{difficulty}.{seed}.{'0' * len(digest)}", 'подделка'):
+            response = self.client.post(reverse('save_result'), json.dumps({
+                'typed_text': 'подмена', 'original_text': 'подмена', 'time_seconds': 30, 'text_seed': token,
+            }), content_type='application/json')
+            self.assertFalse(response.json()['success'], token)
+        self.assertEqual(TypingTestResult.objects.count(), 1)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class TextSpansTests(TestCase):
+    """Текст теста приходит клиенту уже разбитым на <span> по символам"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_render_spans(self):
+        html = samples.render_spans('a<b')
+        self.assertEqual(
+            html,
+            '<span class="current-char">a</span><span class="text-to-type">&lt;</span>'
+            '<span class="text-to-type">b</span>',
+        )
+
+    def test_cached_per_sample(self):
+        sample = TextSample.objects.create(text="Кот сидит.", language='ru', difficulty='easy')
+        response = self.client.get(reverse('typing_test'), {'difficulty': 'easy', 'language': 'ru'})
+        self.assertEqual(response.context['text_spans'].count('<span'), len(sample.text))
+        with mock.patch.object(samples, 'render_spans') as render_spans:
+            self.assertEqual(samples.spans(sample.text, sample.pk), response.context['text_spans'])
+        render_spans.assert_not_called()
+
+
+class AdmissionTests(TestCase):
+    """Повторы save_result не создают строк, флуд отсекается до базы"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sample = TextSample.objects.create(text="Проверка допуска.", language='ru', difficulty='easy')
+
+    def setUp(self):
+        cache.clear()
+
+    def _post(self, test_id=None, **fields):
+        body = {
+            'typed_text': self.sample.text, 'original_text': self.sample.text, 'time_seconds': 5,
+            'text_id': self.sample.pk, **fields,
+        }
+        if test_id:
+            body['test_id'] = test_id
+        return self.client.post(reverse('save_result'), json.dumps(body), content_type='application/json')
+
+    def test_duplicate_gets_original_response(self):
+        first = self._post('test-0001')
+        with self.assertNumQueries(0):
+            second = self._post('test-0001')
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(TypingTestResult.objects.count(), 1)
+        self._post('test-0002')
+        self.assertEqual(TypingTestResult.objects.count(), 2)
+
+    def test_in_flight_and_failed(self):
+        cache.set('admission:test:ip127.0.0.1:test-0003', admission.PENDING)
+        self.assertEqual(self._post('test-0003').status_code, 409)
+
+        # Ошибка освобождает ключ — повтор того же теста записывается
+        self.assertFalse(self._post('test-0004', time_seconds='x').json()['success'])
+        self.assertTrue(self._post('test-0004').json()['success'])
+        self.assertEqual(TypingTestResult.objects.count(), 1)
+
+    def test_rate_limit(self):
+        with mock.patch.object(admission, 'RATE_PER_MINUTE', 1), mock.patch.object(admission, 'BURST', 2):
+            self.assertTrue(self._post().json()['success'])
+            self.assertTrue(self._post().json()['success'])
+            with self.assertNumQueries(0):
+                response = self._post()
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response['Retry-After'], '60')
+            # Повтор уже сохранённого теста отвечает и без токенов
+            self.assertEqual(self._post('test-0005').status_code, 429)
+        self.assertEqual(TypingTestResult.objects.count(), 2)
+
+    def test_buckets_per_client_behind_proxy(self):
+        def post(ip):
+            # Все запросы приходят от nginx, адрес клиента — в X-Real-IP
+            return self.client.post(reverse('save_result'), json.dumps({
+                'typed_text': self.sample.text, 'original_text': self.sample.text, 'time_seconds': 5,
+            }), content_type='application/json', REMOTE_ADDR='172.18.0.5', HTTP_X_REAL_IP=ip)
+
+        with mock.patch.object(admission, 'RATE_PER_MINUTE', 1), mock.patch.object(admission, 'BURST', 1), \
+                mock.patch.object(admission, 'CLIENT_IP_HEADER', 'HTTP_X_REAL_IP'):
+            self.assertEqual(post('203.0.113.1').status_code, 200)
+            self.assertEqual(post('203.0.113.1').status_code, 429)
+            self.assertEqual(post('203.0.113.2').status_code, 200)
+
+    def test_client_ip(self):
+        request = RequestFactory().post('/', REMOTE_ADDR='172.18.0.5', HTTP_X_FORWARDED_FOR='10.9.9.9, 203.0.113.7')
+        self.assertEqual(admission.client_ip(request), '172.18.0.5')
+        with mock.patch.object(admission, 'CLIENT_IP_HEADER', 'HTTP_X_FORWARDED_FOR'):
+            self.assertEqual(admission.client_ip(request), '203.0.113.7')
+        with mock.patch.object(admission, 'CLIENT_IP_HEADER', 'HTTP_X_REAL_IP'):
+            self.assertEqual(admission.client_ip(request), '172.18.0.5')
+
+    async def test_async_duplicate(self):
+        payload = json.dumps({
+            'typed_text': self.sample.text, 'original_text': self.sample.text, 'time_seconds': 5,
+            'test_id': 'async-0001',
+        })
+        responses = []
+        for _ in range(2):
+            request = AsyncRequestFactory().post('/', data=payload, content_type='application/json')
+            request.user = AnonymousUser()
+            responses.append(json.loads((await async_views.save_result(request)).content))
+        self.assertEqual(responses[0], responses[1])
+        self.assertEqual(await TypingTestResult.objects.acount(), 1)
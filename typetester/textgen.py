@@ -0,0 +1,360 @@
+"""Генерация текстов для теста по частотным таблицам слов, без базы.
+
+manage.py build_word_tables один раз считает по текстам (TextSample,
+тексты по умолчанию, файлы корпуса) частоты слов и пар слов для каждого
+языка и пишет их в двоичный файл WORD_TABLES_DIR/<язык>.bin. Воркеры
+открывают файл через mmap только для чтения: страницы файла общие для
+всех процессов в кэше ОС, а выбор слова — двоичный поиск прямо по
+накопленным весам в файле, без копирования таблиц в память процесса.
+
+Текст определяется языком, сложностью, seed и дайджестом таблиц — по
+токену Passage.token save_result восстанавливает исходный текст и
+проверяет результат по нему, а не по присланному клиентом.
+
+Формат файла (little-endian, секции выровнены по 8 байт):
+  заголовок HEADER;
+  u32[слов + 1]    смещения слов в блоке строк;
+  u8[слов]         маска сложностей слова (бит на easy, medium, hard);
+  для каждой сложности: u32[n] id слов и u64[n] накопленные веса;
+  u32[слов + 1]    начало строки пар для каждого слова;
+  u32[пар]         следующее слово пары;
+  u64[пар]         накопленные веса внутри строки пары;
+  блок строк UTF-8.
+"""
+import hashlib
+import logging
+import mmap
+import os
+import random
+import re
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from typing import NamedTuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'TMWT'
+FORMAT_VERSION = 1
+# magic, версия, слов, пар, размер блока строк, слов каждой сложности, дайджест
+HEADER = struct.Struct('<4sIIIIIII8s')
+
+DIFFICULTIES = ('easy', 'medium', 'hard')
+LANGUAGES = ('ru', 'en')
+
+TABLES_DIR = getattr(settings, 'WORD_TABLES_DIR', os.path.join(settings.BASE_DIR, 'wordtables'))
+
+MAX_WORDS = 50000
+# Самые длинные слова easy и medium по языкам: русские слова длиннее
+MAX_LENGTH = {
+    'ru': {'easy': 6, 'medium': 10},
+    'en': {'easy': 5, 'medium': 8},
+}
+# Слова easy — только из самых частых
+EASY_TOP = 2000
+
+PASSAGE_WORDS = {'easy': 30, 'medium': 50, 'hard': 70}
+# Доля слов, выбранных по предыдущему слову, а не по общей частоте
+BIGRAM_SHARE = 0.6
+QUOTES = {'ru': '«»', 'en': '“”'}
+
+WORD = re.compile(r"[^\W\d_]+(?:-[^\W\d_]+)*")
+SENTENCE_END = re.compile(r'[.!?…;:]+')
+
+
+class TablesError(ValueError):
+    pass
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+# ======================
+# Построение таблиц
+# ======================
+
+def update_counts(words, pairs, text):
+    """Добавляет к счётчикам слова и пары соседних слов одного текста"""
+    for sentence in SENTENCE_END.split(text):
+        tokens = [token.lower() for token in WORD.findall(sentence)]
+        words.update(tokens)
+        pairs.update(zip(tokens, tokens[1:]))
+
+
+def count_words(texts):
+    """Частоты слов и пар соседних слов внутри предложения"""
+    words = Counter()
+    pairs = Counter()
+    for text in texts:
+        update_counts(words, pairs, text)
+    return words, pairs
+
+
+def _mask(word, rank, language):
+    limits = MAX_LENGTH[language]
+    mask = 0b100
+    if len(word) <= limits['medium']:
+        mask |= 0b010
+        if len(word) <= limits['easy'] and rank < EASY_TOP:
+            mask |= 0b001
+    return mask
+
+
+def _align(data):
+    data += b'\0' * (-len(data) % 8)
+    return data
+
+
+def _u32(values):
+    return array('I', values)
+
+
+def _u64(values):
+    return array('Q', values)
+
+
+def _cumulative(weights):
+    total = 0
+    result = []
+    for weight in weights:
+        total += weight
+        result.append(total)
+    return result
+
+
+def build(words, pairs, language, max_words=MAX_WORDS):
+    """Содержимое файла таблиц (bytes) по частотам count_words"""
+    vocabulary = [word for word, _ in sorted(words.items(), key=lambda item: (-item[1], item[0]))[:max_words]]
+    ids = {word: i for i, word in enumerate(vocabulary)}
+    encoded = [word.encode('utf-8') for word in vocabulary]
+    offsets = _cumulative([0] + [len(word) for word in encoded])
+    masks = bytes(_mask(word, rank, language) for rank, word in enumerate(vocabulary))
+
+    unigrams = []
+    for bit, difficulty in enumerate(DIFFICULTIES):
+        allowed = [i for i, mask in enumerate(masks) if mask & (1 << bit)]
+        unigrams.append((allowed, _cumulative(words[vocabulary[i]] for i in allowed)))
+
+    rows = defaultdict(list)
+    for (first, second), count in pairs.items():
+        if first in ids and second in ids:
+            rows[ids[first]].append((count, ids[second]))
+    starts, following, weights = [0], [], []
+    for i in range(len(vocabulary)):
+        row = sorted(rows.get(i, ()), key=lambda item: (-item[0], item[1]))
+        following.extend(second for _, second in row)
+        weights.extend(_cumulative(count for count, _ in row))
+        starts.append(len(following))
+
+    sections = [_u32(offsets).tobytes(), masks]
+    for allowed, cumulative in unigrams:
+        sections += [_u32(allowed).tobytes(), _u64(cumulative).tobytes()]
+    blob = b''.join(encoded)
+    sections += [_u32(starts).tobytes(), _u32(following).tobytes(), _u64(weights).tobytes(), blob]
+    body = b''.join(_align(section) for section in sections)
+    digest = hashlib.sha256(body).digest()[:8]
+    header = HEADER.pack(
+        MAGIC, FORMAT_VERSION, len(vocabulary), len(following), len(blob),
+        *(len(allowed) for allowed, _ in unigrams), digest,
+    )
+    return _align(header) + body
+
+
+def write(path, data):
+    """Пишет файл таблиц атомарно: открытые mmap продолжают читать старый"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def table_path(language):
+    # Язык приходит из запроса: без проверки он стал бы путём к любому файлу
+    if language not in LANGUAGES:
+        raise TablesError(f"Неизвестный язык: {language!r}")
+    return os.path.join(TABLES_DIR, f'{language}.bin')
+
+
+# ======================
+# Чтение и генерация
+# ======================
+
+class Passage(NamedTuple):
+    text: str
+    token: str
+
+
+class WordTables:
+    """Таблицы одного языка поверх mmap файла"""
+
+    def __init__(self, path, language):
+        self.language = language
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._stat = _stat(path)
+        if sys.byteorder != 'little':
+            raise TablesError("Таблицы слов читаются только на little-endian платформах")
+        view = memoryview(self._mmap)
+        if len(view) < HEADER.size:
+            raise TablesError(f"{path}: файл короче заголовка")
+        magic, version, words, pairs, blob, *counts, digest = HEADER.unpack_from(view)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise TablesError(f"{path}: неизвестный формат, пересоберите manage.py build_word_tables")
+        self.digest = digest.hex()
+        self.words = words
+
+        position = HEADER.size + (-HEADER.size % 8)
+
+        def section(size, fmt):
+            nonlocal position
+            end = position + size * struct.calcsize(fmt)
+            if end > len(view):
+                raise TablesError(f"{path}: файл обрезан, пересоберите manage.py build_word_tables")
+            part = view[position:end]
+            position = end + (-end % 8)
+            return part.cast(fmt)
+
+        self._offsets = section(words + 1, 'I')
+        self._masks = section(words, 'B')
+        self._unigrams = {}
+        for difficulty, count in zip(DIFFICULTIES, counts):
+            self._unigrams[difficulty] = (section(count, 'I'), section(count, 'Q'))
+        self._starts = section(words + 1, 'I')
+        self._following = section(pairs, 'I')
+        self._weights = section(pairs, 'Q')
+        self._blob = section(blob, 'B')
+
+    def word(self, i):
+        return str(self._blob[self._offsets[i]:self._offsets[i + 1]], 'utf-8')
+
+    def _next(self, previous, bit, rng):
+        lo, hi = self._starts[previous], self._starts[previous + 1]
+        if lo == hi:
+            return None
+        j = bisect_right(self._weights, rng.randrange(self._weights[hi - 1]), lo, hi)
+        following = self._following[j]
+        return following if self._masks[following] & bit else None
+
+    def _words(self, difficulty, count, rng):
+        ids, weights = self._unigrams[difficulty]
+        if not ids:
+            raise TablesError(f"Нет слов сложности {difficulty}")
+        bit = 1 << DIFFICULTIES.index(difficulty)
+        total = weights[-1]
+        previous = None
+        for _ in range(count):
+            word = None
+            if previous is not None and rng.random() < BIGRAM_SHARE:
+                word = self._next(previous, bit, rng)
+            if word is None:
+                word = ids[bisect_right(weights, rng.randrange(total))]
+            yield self.word(word)
+            previous = word
+
+    def generate(self, difficulty, seed, words=None):
+        """Текст из предложений; один и тот же seed даёт один и тот же текст"""
+        rng = random.Random(f"{self.language}:{difficulty}:{seed}")
+        tokens = list(self._words(difficulty, words or PASSAGE_WORDS[difficulty], rng))
+        sentences = []
+        while tokens:
+            length = rng.randint(5, 12)
+            # Короткий хвост присоединяется к последнему предложению
+            if len(tokens) - length < 3:
+                length = len(tokens)
+            sentence, tokens = tokens[:length], tokens[length:]
+            sentences.append(_punctuate(sentence, self.language, difficulty, rng))
+        return ' '.join(sentences)
+
+
+def _punctuate(words, language, difficulty, rng):
+    if difficulty != 'easy':
+        for i in range(len(words) - 1):
+            if rng.random() < 0.08:
+                words[i] += ','
+    if difficulty == 'hard':
+        # Цифры, скобки и кавычки, которых нет на основных клавишах
+        for i in range(len(words)):
+            roll = rng.random()
+            if roll < 0.05:
+                words[i] = str(rng.randint(2, 2100))
+            elif roll < 0.08:
+                words[i] = f"({words[i].rstrip(',')})"
+            elif roll < 0.10:
+                opening, closing = QUOTES[language]
+                words[i] = f"{opening}{words[i].rstrip(',')}{closing}"
+    words[0] = words[0][:1].upper() + words[0][1:]
+    end = rng.choice('.!?') if difficulty == 'hard' and rng.random() < 0.2 else '.'
+    return ' '.join(words).rstrip(',') + end
+
+
+def _stat(path):
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+_lock = threading.Lock()
+_tables = {}
+
+
+def tables(language):
+    """Таблицы языка (или None, если файла нет или он испорчен); пересобранный файл открывается заново"""
+    if language not in LANGUAGES:
+        return None
+    path = table_path(language)
+    try:
+        stat = _stat(path)
+    except OSError:
+        return None
+    current = _tables.get(language)
+    if current is not None and current._stat == stat:
+        return current
+    with _lock:
+        current = _tables.get(language)
+        if current is None or current._stat != stat:
+            try:
+                table = WordTables(path, language)
+            except (OSError, ValueError, struct.error, TypeError):
+                # Обрезанный или чужой файл: тест обходится текстами из базы
+                logger.exception("Не удалось открыть таблицы слов %s", path)
+                return None
+            # Старый mmap не закрываем: его может читать другой поток
+            current = _tables[language] = table
+    return current
+
+
+def make_token(language, difficulty, seed, digest):
+    return f"{language}.{difficulty}.{seed}.{digest}"
+
+
+def generate(difficulty, language, seed=None):
+    """Сгенерированный текст (Passage) или None, если таблиц языка нет"""
+    if difficulty not in DIFFICULTIES or language not in LANGUAGES:
+        return None
+    table = tables(language)
+    if table is None:
+        return None
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    return Passage(table.generate(difficulty, seed), make_token(language, difficulty, seed, table.digest))
+
+
+def restore(token):
+    """Текст по токену Passage.token (или None, если таблицы с тех пор пересобраны)"""
+    try:
+        language, difficulty, seed, digest = str(token).split('.')
+        seed = int(seed)
+    except ValueError:
+        return None
+    if language not in LANGUAGES or difficulty not in DIFFICULTIES:
+        return None
+    table = tables(language)
+    if table is None or table.digest != digest:
+        return None
+    return table.generate(difficulty, seed)
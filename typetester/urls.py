@@ -1,10 +1,16 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Под ASGI (uvicorn) — асинхронные представления, под WSGI — обычные
+handlers = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
-    path('', views.home, name='home'),
-    path('test/', views.typing_test, name='typing_test'),
-    path('save-result/', views.save_result, name='save_result'),
-    path('leaderboard/', views.leaderboard, name='leaderboard'),
-    path('my-results/', views.my_results, name='my_results'),
+    path('', handlers.home, name='home'),
+    path('test/', handlers.typing_test, name='typing_test'),
+    path('save-result/', handlers.save_result, name='save_result'),
+    path('leaderboard/', handlers.leaderboard, name='leaderboard'),
+    path('my-results/', handlers.my_results, name='my_results'),
+    path('my-results/api/', handlers.my_results_api, name='my_results_api'),
+    path('metrics', views.prometheus_metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -0,0 +1,169 @@
+"""Сводка результатов пользователя для страницы «Мои результаты».
+
+UserStats обновляется в транзакции сохранения результата, поэтому страница
+не агрегирует все результаты пользователя при каждом просмотре.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum, Window
+from django.db.models.functions import RowNumber
+
+from .models import DailyResultSummary, TypingTestResult, UserStats
+
+RECENT_COUNT = getattr(settings, 'USER_STATS_RECENT', 10)
+
+
+def get_stats(user):
+    """Сводка пользователя (несохранённая пустая, если тестов ещё не было)"""
+    stats = UserStats.objects.filter(user=user).first()
+    return stats or UserStats(user=user)
+
+
+async def aget_stats(user):
+    stats = await UserStats.objects.filter(user=user).afirst()
+    return stats or UserStats(user=user)
+
+
+def apply(results):
+    """Учитывает сохранённые результаты в сводках их пользователей"""
+    by_user = defaultdict(list)
+    for result in results:
+        if result.user_id is not None:
+            by_user[result.user_id].append(result)
+
+    for user_id, items in by_user.items():
+        stats = UserStats.objects.select_for_update().filter(user_id=user_id).first()
+        if stats is None:
+            UserStats.objects.get_or_create(user_id=user_id)
+            stats = UserStats.objects.select_for_update().get(user_id=user_id)
+        stats.tests_count += len(items)
+        stats.wpm_sum += sum(result.wpm for result in items)
+        stats.accuracy_sum += sum(result.accuracy for result in items)
+        stats.best_wpm = max([stats.best_wpm] + [result.wpm for result in items])
+        stats.recent_wpm = (list(stats.recent_wpm) + [result.wpm for result in items])[-RECENT_COUNT:]
+        stats.save()
+
+
+def retract(results):
+    """Вычитает удалённые результаты из сводок их пользователей.
+
+    Вызывается в транзакции удаления, когда строк уже нет: лучший WPM и
+    последние тесты пересчитываются по оставшимся строкам и сводкам.
+    """
+    by_user = defaultdict(list)
+    for result in results:
+        if result.user_id is not None:
+            by_user[result.user_id].append(result)
+
+    for user_id, items in sorted(by_user.items()):
+        stats = UserStats.objects.select_for_update().filter(user_id=user_id).first()
+        if stats is None:
+            continue
+        stats.tests_count -= len(items)
+        if stats.tests_count <= 0:
+            stats.delete()
+            continue
+        stats.wpm_sum -= sum(result.wpm for result in items)
+        stats.accuracy_sum -= sum(result.accuracy for result in items)
+        if max(result.wpm for result in items) >= stats.best_wpm:
+            best = [
+                TypingTestResult.objects.filter(user_id=user_id).aggregate(value=Max('wpm'))['value'],
+                DailyResultSummary.objects.filter(user_id=user_id).aggregate(value=Max('wpm_max'))['value'],
+            ]
+            stats.best_wpm = max((value for value in best if value is not None), default=0)
+        stats.recent_wpm = list(
+            recent_results().filter(user_id=user_id).order_by('-place').values_list('wpm', flat=True)
+        )
+        stats.save()
+
+
+def recent_results():
+    """Последние RECENT_COUNT результатов каждого пользователя (place 1 — самый новый)"""
+    return (
+        TypingTestResult.objects
+        .filter(user__isnull=False)
+        .annotate(place=Window(
+            RowNumber(),
+            partition_by=[F('user_id')],
+            order_by=[F('created_at').desc(), F('id').desc()],
+        ))
+        .filter(place__lte=RECENT_COUNT)
+    )
+
+
+def compute():
+    """Сводки по исходным строкам и дневным сводкам: {user_id: {поле: значение}}"""
+    totals = {}
+    rows = (
+        TypingTestResult.objects
+        .filter(user__isnull=False)
+        .order_by()
+        .values('user')
+        .annotate(
+            tests_count=Count('id'),
+            wpm_sum=Sum('wpm'),
+            best_wpm=Max('wpm'),
+            accuracy_sum=Sum('accuracy'),
+        )
+    )
+    for row in rows:
+        row['recent_wpm'] = []
+        totals[row.pop('user')] = row
+
+    # Последние тесты всех пользователей одним запросом, от старых к новым
+    for user_id, wpm in recent_results().order_by('user_id', '-place').values_list('user_id', 'wpm'):
+        totals[user_id]['recent_wpm'].append(wpm)
+
+    # Свёрнутые результаты; последние тесты берутся только из оставшихся строк
+    summaries = (
+        DailyResultSummary.objects
+        .filter(user__isnull=False)
+        .order_by()
+        .values('user')
+        .annotate(
+            tests_count=Sum('tests_count'),
+            wpm_sum=Sum('wpm_sum'),
+            best_wpm=Max('wpm_max'),
+            accuracy_sum=Sum('accuracy_sum'),
+        )
+    )
+    for row in summaries:
+        values = totals.setdefault(row.pop('user'), {
+            'tests_count': 0, 'wpm_sum': 0, 'best_wpm': 0, 'accuracy_sum': 0, 'recent_wpm': [],
+        })
+        for name, value in row.items():
+            values[name] = max(values[name], value) if name == 'best_wpm' else values[name] + value
+    return totals
+
+
+@transaction.atomic
+def rebuild():
+    """Пересобирает сводки пользователей по исходным строкам"""
+    totals = compute()
+    UserStats.objects.exclude(user_id__in=list(totals)).delete()
+    for user_id, values in totals.items():
+        UserStats.objects.update_or_create(user_id=user_id, defaults=values)
+    return totals
+
+
+def check():
+    """Пользователи, у которых сводка расходится с исходными строками"""
+    expected = compute()
+    stored = {stats.user_id: stats for stats in UserStats.objects.all()}
+    mismatches = []
+    for user_id in set(expected) | set(stored):
+        values = expected.get(user_id)
+        stats = stored.get(user_id)
+        if values is None or stats is None or any(
+            not _same(getattr(stats, name), value) for name, value in values.items()
+        ):
+            mismatches.append(user_id)
+    return sorted(mismatches)
+
+
+def _same(current, actual):
+    if isinstance(actual, list):
+        return len(current) == len(actual) and all(map(_same, current, actual))
+    return abs(current - actual) <= 1e-6 * max(1, abs(actual))
@@ -1,142 +1,167 @@
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
-from django.db.models import Avg, Max, Count
+from django.conf import settings
 import json
-import random
-from .models import TextSample, TypingTestResult
+from .models import TypingTestResult
+from . import admission, histogram, ingest, keystrokes, leaderboard as boards, metrics, pagecache, pagination, rollup, samples, scoring, textgen, userstats
+
+MY_RESULTS_PAGE_SIZE = getattr(settings, 'MY_RESULTS_PAGE_SIZE', 50)
+
+def home_context(stats):
+    return {
+        'total_tests': stats.tests_count,
+        'avg_wpm': round(stats.avg_wpm, 1),
+        'best_wpm': round(stats.wpm_max, 1),
+    }
+
+def home_page(request):
+    return pagecache.Page(request, 'home', [rollup.GLOBAL_SCOPE])
 
 def home(request):
     """Главная страница с выбором настроек"""
-    total_tests = TypingTestResult.objects.count()
-    avg_wpm = TypingTestResult.objects.aggregate(Avg('wpm'))['wpm__avg'] or 0
-    best_wpm = TypingTestResult.objects.aggregate(Max('wpm'))['wpm__max'] or 0
-    
-    context = {
-        'total_tests': total_tests,
-        'avg_wpm': round(avg_wpm, 1),
-        'best_wpm': round(best_wpm, 1),
+    page = home_page(request)
+    response = page.lookup()
+    if response is not None:
+        return response
+    stats = rollup.get_rollup()
+    return page.finish(render(request, 'typetester/home.html', home_context(stats)))
+
+def test_context(text, text_id, difficulty, language, text_spans, text_seed=None):
+    return {
+        'text': text,
+        'text_spans': text_spans,
+        'text_id': text_id,
+        'text_seed': text_seed,
+        'difficulty': difficulty,
+        'language': language,
     }
-    return render(request, 'typetester/home.html', context)
+
+def generated_passage(request, difficulty, language, sample_id):
+    """Сгенерированный текст вместо TextSample (или None).
+
+    Генератор включает GENERATED_TEXTS, параметр ?seed= (тот же текст ещё
+    раз) или отсутствие в базе текстов нужной сложности и языка.
+    """
+    seed = request.GET.get('seed', '')
+    if not (settings.GENERATED_TEXTS or seed or sample_id is None):
+        return None
+    return textgen.generate(difficulty, language, int(seed) if seed.isdigit() else None)
+
+def generated_page(request, passage, difficulty, language):
+    # Каждый текст новый — в кэш страниц не кладём, генерация дешевле обращения к нему
+    context = test_context(passage.text, None, difficulty, language, samples.render_spans(passage.text), passage.token)
+    return render(request, 'typetester/test.html', context)
+
+def test_page(request, difficulty, language, sample_id):
+    # Текст на странице каждый раз случайный, поэтому без ETag: страница
+    # хранится для каждого текста отдельно, пока не изменятся тексты
+    return pagecache.Page(
+        request, 'typing_test', (), difficulty, language, sample_id, samples.index.version, conditional=False,
+    )
 
 def typing_test(request):
     """Страница тестирования скорости печати"""
     difficulty = request.GET.get('difficulty', 'easy')
     language = request.GET.get('language', 'ru')
     
-    # Получаем случайный текст
-    samples = TextSample.objects.filter(difficulty=difficulty, language=language)
+    # Выбираем случайный текст по индексу текстов процесса, без запроса к базе
+    sample_id = samples.index.choose(difficulty, language)
+    passage = generated_passage(request, difficulty, language, sample_id)
+    if passage is not None:
+        return generated_page(request, passage, difficulty, language)
+    page = test_page(request, difficulty, language, sample_id)
+    response = page.lookup()
+    if response is not None:
+        return response
+    text, text_id = samples.index.text(sample_id, difficulty, language)
+    context = test_context(text, text_id, difficulty, language, samples.spans(text, text_id))
+    return page.finish(render(request, 'typetester/test.html', context))
+
+def build_result(request, data, user, text_sample):
+    """Оценивает присланный текст и собирает несохранённый результат"""
+    typed_text = data.get('typed_text', '')
+    original_text = data.get('original_text', '')
+    if data.get('text_seed'):
+        # Сгенерированный текст восстанавливаем по токену, а не верим присланному.
+        # Токен, который не восстанавливается (таблицы пересобраны или подделка),
+        # не принимаем: иначе оценка шла бы по тексту клиента
+        original_text = textgen.restore(data['text_seed'])
+        if original_text is None:
+            raise textgen.InvalidToken("Текст теста устарел, начните тест заново")
+    time_seconds = data.get('time_seconds', 0)
     
-    if samples.exists():
-        text_sample = random.choice(samples)
-        text = text_sample.text
-        text_id = text_sample.id
-    else:
-        default_texts = {
-            ('easy', 'ru'): "Кот сидит на окне. Солнце светит ярко. Девочка читает книгу. Мальчик играет с "
-            "машинкой. В саду растут цветы и яблоки. Птицы поют весело. Мама готовит обед. Папа чинит велосипед. "
-            "Все счастливы.",
-            ('medium', 'ru'): "Эффективное управление временем - ключ к продуктивности. Вместо того чтобы "
-            "пытаться сделать всё сразу, разумнее расставлять приоритеты и делить большие задачи на маленькие "
-            "шаги. Метод «Помодоро», например, предлагает работать 25 минут без отвлечений, а затем делать короткий "
-            "перерыв. Такой подход помогает сохранять концентрацию и избегать выгорания. Важно также уметь говорить "
-            "'нет' лишним просьбам и защищать своё расписание. Помните: отдых - не роскошь, а необходимая часть рабочего "
-            "процесса.",
-            ('hard', 'ru'): "Современные квантовые компьютеры используют принцип суперпозиции и квантовой запутанности "
-            "для выполнения вычислений, недоступных классическим системам. Алгоритм Шора, например, способен факторизовать "
-            "большие числа экспоненциально быстрее, чем любой известный классический алгоритм, что ставит под угрозу безопасность "
-            "криптографических протоколов, основанных на RSA. В то же время, декогеренция остаётся главным препятствием на пути к "
-            "созданию масштабируемых квантовых процессоров. Исследователи из лабораторий Google, IBM и IonQ активно работают над "
-            "коррекцией квантовых ошибок, применяя топологические коды и сверхпроводящие кубиты, охлаждённые до температур, близких "
-            "к абсолютному нулю. Несмотря на прогресс, практическое применение fault-tolerant quantum computing всё ещё находится на "
-            "горизонте следующего десятилетия.",
-            ('easy', 'en'): "The sun is bright. A dog runs in the park. Birds fly high. Anna drinks tea."
-            "Tom plays with a ball. Flowers bloom in spring. It is a happy day.",
-            ('medium', 'en'): "Learning to type quickly takes practice and patience. It’s important to keep"
-            "your fingers on the home row and avoid looking at the keyboard. Many people improve their speed"
-            "by using online typing tutors or playing typing games. Consistency matters more than speed at"
-            "first-accuracy builds confidence and reduces errors over time.",
-            ('hard', 'en'): "Quantum entanglement describes a phenomenon where particles become intrinsically"
-            "linked, such that the state of one instantly influences the other—regardless of distance. This non-local"
-            "correlation, famously called “spooky action at a distance” by Einstein, defies classical intuition but has"
-            "been repeatedly confirmed through Bell test experiments. Harnessing entanglement is essential for quantum"
-            "cryptography, teleportation protocols, and error-resistant quantum computing architectures.",
-        }
-        text = default_texts.get((difficulty, language), "Начните печатать этот текст.")
-        text_id = None
+    # Подсчет слов и ошибок по выравниванию с оригиналом
+    words = len(typed_text.split())
+    score = scoring.score(original_text, typed_text, time_seconds)
     
-    context = {
-        'text': text,
-        'text_id': text_id,
-        'difficulty': difficulty,
-        'language': language,
+    result = TypingTestResult(
+        user=user,
+        text_sample=text_sample,
+        wpm=round(score.wpm, 1),
+        accuracy=round(score.accuracy, 1),
+        words_count=words,
+        time_seconds=round(time_seconds, 2),
+        mistakes_count=score.errors,
+        ip_address=request.META.get('REMOTE_ADDR'),
+        user_agent=request.META.get('HTTP_USER_AGENT', '')[:500]
+    )
+    
+    # Журнал нажатий необязателен: битый журнал не мешает сохранить результат
+    try:
+        result.keystrokes = keystrokes.from_upload(data.get('keystrokes'))
+    except keystrokes.KeystrokeFormatError:
+        result.keystrokes = None
+    return result, score
+
+def result_payload(result, score, rank, percentile):
+    return {
+        'success': True,
+        'result_id': result.id,
+        'wpm': result.wpm,
+        'accuracy': result.accuracy,
+        'words': result.words_count,
+        'time': result.time_seconds,
+        'mistakes': result.mistakes_count,
+        'insertions': score.insertions,
+        'deletions': score.deletions,
+        'substitutions': score.substitutions,
+        'rank': rank,
+        'percentile': percentile,
     }
-    return render(request, 'typetester/test.html', context)
 
 @csrf_exempt
 def save_result(request):
     """Сохранение результата теста (AJAX)"""
     if request.method == 'POST':
+        ticket = admission.Ticket()
         try:
             data = json.loads(request.body)
-            
-            # Получаем данные
-            typed_text = data.get('typed_text', '')
-            original_text = data.get('original_text', '')
-            time_seconds = data.get('time_seconds', 0)
+            # Повторы и флуд отсекаются раньше сессии, индекса текстов и записи
+            response, ticket = admission.admit(request, data)
+            if response is not None:
+                return response
             text_id = data.get('text_id')
             
-            # Подсчет слов и ошибок
-            words = len(typed_text.split())
-            
-            # Подсчет ошибок (простейший алгоритм)
-            mistakes = 0
-            min_len = min(len(typed_text), len(original_text))
-            for i in range(min_len):
-                if typed_text[i] != original_text[i]:
-                    mistakes += 1
-            
-            # Добавляем ошибки за пропущенные/лишние символы
-            mistakes += abs(len(typed_text) - len(original_text))
-            
-            # Рассчитываем WPM и точность
-            wpm = (words / time_seconds * 60) if time_seconds > 0 else 0
-            accuracy = max(0, 100 - (mistakes / max(len(original_text), 1) * 100))
+            # Получаем объект текста если есть ID (по индексу текстов, без запроса)
+            text_sample = samples.index.lookup(text_id) if text_id else None
+            user = request.user if request.user.is_authenticated else None
+            result, score = build_result(request, data, user, text_sample)
             
-            # Получаем объект текста если есть ID
-            text_sample = None
-            if text_id:
-                try:
-                    text_sample = TextSample.objects.get(id=text_id)
-                except TextSample.DoesNotExist:
-                    pass
+            if ingest.buffer.enabled and ingest.buffer.submit(result):
+                # Результат запишет фоновый поток, место считаем по текущей гистограмме
+                rank, percentile = histogram.estimate_position(result)
+            else:
+                ingest.persist([result])
+                rank, percentile = histogram.position(result)
             
-            # Сохраняем результат
-            result = TypingTestResult(
-                user=request.user if request.user.is_authenticated else None,
-                text_sample=text_sample,
-                wpm=round(wpm, 1),
-                accuracy=round(accuracy, 1),
-                words_count=words,
-                time_seconds=round(time_seconds, 2),
-                mistakes_count=mistakes,
-                ip_address=request.META.get('REMOTE_ADDR'),
-                user_agent=request.META.get('HTTP_USER_AGENT', '')[:500]
-            )
-            result.save()
-            
-            return JsonResponse({
-                'success': True,
-                'result_id': result.id,
-                'wpm': result.wpm,
-                'accuracy': result.accuracy,
-                'words': words,
-                'time': round(time_seconds, 2),
-                'mistakes': mistakes
-            })
+            payload = result_payload(result, score, rank, percentile)
+            ticket.complete(payload)
+            return JsonResponse(payload)
             
         except Exception as e:
+            ticket.release()
             return JsonResponse({
                 'success': False,
                 'error': str(e)
@@ -144,47 +169,114 @@ def save_result(request):
     
     return JsonResponse({'success': False, 'error': 'Invalid request method'})
 
+def leaderboard_filters(request):
+    return boards.normalize(
+        request.GET.get('language', ''),
+        request.GET.get('difficulty', ''),
+        request.GET.get('period', 'all'),
+    )
+
+def rollup_scope(language, difficulty):
+    """Сводная статистика ведётся для пары язык+сложность, иначе показываем общую"""
+    return (language, difficulty) if language and difficulty else rollup.GLOBAL_SCOPE
+
+def leaderboard_context(top_results, stats, language, difficulty, period):
+    return {
+        'results': top_results,
+        'total_users': stats.users_count,
+        'total_tests': stats.tests_count,
+        'avg_wpm': round(stats.avg_wpm, 1),
+        'avg_accuracy': round(stats.avg_accuracy, 1),
+        'max_wpm': round(stats.wpm_max, 1),
+        'language': language,
+        'difficulty': difficulty,
+        'period': period,
+        'languages': boards.LANGUAGES,
+        'difficulties': boards.DIFFICULTIES,
+        'periods': boards.PERIODS,
+    }
+
+def leaderboard_page(request, language, difficulty, period):
+    # Таблица за день или месяц меняется и со сменой периода
+    start = boards.period_start(period)
+    return pagecache.Page(
+        request, 'leaderboard', [(language, difficulty), rollup_scope(language, difficulty)],
+        language, difficulty, period, start, since=start,
+    )
+
 def leaderboard(request):
     """Таблица лидеров"""
-    # Лучшие результаты (топ 50)
-    top_results = TypingTestResult.objects.all().order_by('-wpm')[:50]
+    language, difficulty, period = leaderboard_filters(request)
+    page = leaderboard_page(request, language, difficulty, period)
+    response = page.lookup()
+    if response is not None:
+        return response
     
-    # Статистика
-    total_users = TypingTestResult.objects.values('user').distinct().count()
-    total_tests = TypingTestResult.objects.count()
+    # Лучшие результаты (топ 50) из кэша таблиц лидеров
+    top_results = boards.get_board(language, difficulty, period)
     
-    # Средние показатели
-    stats = TypingTestResult.objects.aggregate(
-        avg_wpm=Avg('wpm'),
-        avg_accuracy=Avg('accuracy'),
-        max_wpm=Max('wpm')
-    )
-    
-    context = {
-        'results': top_results,
-        'total_users': total_users,
-        'total_tests': total_tests,
-        'avg_wpm': round(stats['avg_wpm'] or 0, 1),
-        'avg_accuracy': round(stats['avg_accuracy'] or 0, 1),
-        'max_wpm': round(stats['max_wpm'] or 0, 1),
-    }
-    return render(request, 'typetester/results.html', context)
+    # Статистика и средние показатели из сводной таблицы
+    stats = rollup.get_rollup(*rollup_scope(language, difficulty))
+    return page.finish(render(request, 'typetester/results.html', leaderboard_context(top_results, stats, language, difficulty, period)))
+
+RESULT_LIST_FIELDS = ('id', 'wpm', 'accuracy', 'mistakes_count', 'time_seconds', 'created_at')
+
+def my_results_queryset(user):
+    return TypingTestResult.objects.filter(user=user).only(*RESULT_LIST_FIELDS)
+
+def _my_results_page(request):
+    """Страница результатов пользователя по курсору из ?cursor="""
+    queryset = my_results_queryset(request.user)
+    return pagination.keyset_page(queryset, request.GET.get('cursor'), MY_RESULTS_PAGE_SIZE)
 
 @login_required
 def my_results(request):
     """Личные результаты пользователя"""
-    results = TypingTestResult.objects.filter(user=request.user).order_by('-created_at')
-    
-    # Статистика пользователя
-    user_stats = results.aggregate(
-        avg_wpm=Avg('wpm'),
-        avg_accuracy=Avg('accuracy'),
-        best_wpm=Max('wpm'),
-        total_tests=Count('id')
-    )
+    try:
+        results, next_cursor = _my_results_page(request)
+    except pagination.InvalidCursor:
+        return redirect('my_results')
     
     context = {
         'results': results,
-        'user_stats': user_stats,
+        'next_cursor': next_cursor,
+        'user_stats': userstats.get_stats(request.user),
+        'slow_keys': keystrokes.slow_keys(request.user),
+        'slow_bigrams': keystrokes.slow_keys(request.user, bigrams=True),
     }
-    return render(request, 'typetester/my_results.html', context)
\ No newline at end of file
+    return render(request, 'typetester/my_results.html', context)
+
+def my_results_api(request):
+    """Следующая страница личных результатов (JSON для подгрузки при прокрутке)"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'error': 'Authentication required'}, status=401)
+    try:
+        results, next_cursor = _my_results_page(request)
+    except pagination.InvalidCursor as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    
+    return results_page_response(results, next_cursor)
+
+def results_page_response(results, next_cursor):
+    return JsonResponse({
+        'success': True,
+        'results': [
+            {
+                'id': result.id,
+                'wpm': result.wpm,
+                'accuracy': result.accuracy,
+                'mistakes': result.mistakes_count,
+                'time': result.time_seconds,
+                'created_at': result.created_at.isoformat(),
+            }
+            for result in results
+        ],
+        'next_cursor': next_cursor,
+    })
+
+def prometheus_metrics(request):
+    """Метрики запросов в текстовом формате Prometheus"""
+    token = metrics.OPTIONS['TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')